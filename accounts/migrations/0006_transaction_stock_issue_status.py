@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0005_merge_20250825_1454"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="transaction",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "En attente"),
+                    ("processing", "En cours"),
+                    ("succeeded", "Réussie"),
+                    ("failed", "Échouée"),
+                    ("cancelled", "Annulée"),
+                    ("refunded", "Remboursée"),
+                    ("stock_issue", "Rupture de stock"),
+                ],
+                default="pending",
+                max_length=20,
+                verbose_name="Statut",
+            ),
+        ),
+    ]
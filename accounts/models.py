@@ -260,6 +260,7 @@ class Transaction(models.Model):
         ("failed", "Échouée"),
         ("cancelled", "Annulée"),
         ("refunded", "Remboursée"),
+        ("stock_issue", "Rupture de stock"),
     ]
 
     user = models.ForeignKey(
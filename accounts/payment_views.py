@@ -27,11 +27,84 @@ from .payment_services import (
     PaymentMethodService,
     PaymentProcessingError,
     PayPalPaymentProcessor,
+    StripePaymentProcessor,
 )
 from store.models import Order, Cart
+from store.inventory import (
+    InsufficientStockError,
+    decrement_stock,
+    release_reservations,
+    reserve_stock,
+    validate_cart_lines,
+)
+from store.popularity import record_sales
 from .email_services import EmailService
 
 
+def _decrement_cart_stock(cart_orders, reference=None, user=None):
+    """
+    Décrémente le stock d'un panier payé.
+
+    Les réservations du paiement et de l'acheteur sont consommées : elles ne
+    bloquent pas son propre achat.
+
+    Args:
+        cart_orders: Lignes Order payées
+        reference: PaymentIntent dont les réservations sont consommées
+        user: Acheteur dont les réservations sont consommées
+
+    Raises:
+        InsufficientStockError: Une ligne n'a plus assez de stock ; la
+            transaction appelante doit être annulée et le paiement remboursé
+    """
+    failed = [
+        result.line
+        for result in decrement_stock(cart_orders, reference=reference, user=user)
+        if not result.ok
+    ]
+    if failed:
+        for order in failed:
+            logger.warning(
+                f"Stock insuffisant pour {order.product.name} "
+                f"taille {order.size or 'unique'}, quantité demandée: {order.quantity}"
+            )
+        raise InsufficientStockError(failed)
+
+
+def _refund_unfulfilled_payment(payment_intent_id=None, charge_id=None):
+    """
+    Rembourse un paiement Stripe dont le panier n'a pas pu être servi.
+
+    Returns:
+        bool: True si le remboursement a été créé
+    """
+    try:
+        if payment_intent_id:
+            StripePaymentProcessor.create_refund(payment_intent_id)
+        else:
+            stripe.Refund.create(charge=charge_id, reason="requested_by_customer")
+    except (PaymentProcessingError, stripe.error.StripeError) as e:
+        logger.error(
+            f"Remboursement impossible après rupture "
+            f"({payment_intent_id or charge_id}): {e}"
+        )
+        return False
+    return True
+
+
+def _out_of_stock_response(error, refunded):
+    """Réponse 409 d'un paiement refusé pour rupture de stock."""
+    names = ", ".join(order.product.name for order in error.lines)
+    refund = (
+        "Votre paiement a été remboursé."
+        if refunded
+        else "Votre paiement va être remboursé par notre service client."
+    )
+    return JsonResponse(
+        {"error": f"Stock insuffisant pour : {names}. {refund}"}, status=409
+    )
+
+
 @login_required
 def payment_options(request):
     """Affiche les options de paiement disponibles."""
@@ -115,10 +188,25 @@ def create_stripe_payment_intent(request):
         stripe.api_key = settings.STRIPE_SECRET_KEY
 
         # Récupérer les commandes du panier
-        cart_orders = Order.objects.filter(user=request.user, ordered=False)
-        if not cart_orders.exists():
+        cart_orders = Order.objects.filter(
+            user=request.user, ordered=False
+        ).select_related("product")
+        if not cart_orders:
             return JsonResponse({"error": "Panier vide"}, status=400)
 
+        # Vérifier tout le panier en une requête avant de créer le paiement
+        # (les réservations d'un précédent PaymentIntent de l'acheteur ne comptent pas)
+        unavailable = [
+            check.line
+            for check in validate_cart_lines(cart_orders, user=request.user)
+            if not check.available
+        ]
+        if unavailable:
+            names = ", ".join(order.product.name for order in unavailable)
+            return JsonResponse(
+                {"error": f"Stock insuffisant pour : {names}"}, status=409
+            )
+
         # Calculer le total
         total_amount = sum(
             order.quantity * order.product.price for order in cart_orders
@@ -146,6 +234,20 @@ def create_stripe_payment_intent(request):
             },
         )
 
+        # Retenir le stock du panier jusqu'à la confirmation du paiement
+        unavailable = [
+            result.line
+            for result in reserve_stock(cart_orders, intent.id, user=request.user)
+            if not result.ok
+        ]
+        if unavailable:
+            release_reservations(intent.id)
+            stripe.PaymentIntent.cancel(intent.id)
+            names = ", ".join(order.product.name for order in unavailable)
+            return JsonResponse(
+                {"error": f"Stock insuffisant pour : {names}"}, status=409
+            )
+
         logger.info(f"PaymentIntent créé: {intent.id} pour {total_amount}€")
 
         return JsonResponse(
@@ -290,13 +392,13 @@ def confirm_stripe_payment(request):
                 order.date_ordered = timezone.now()
                 order.save()
 
-                # Diminuer le stock via la variante appropriée
-                product = order.product
-                if not product.reduce_stock(order.size, order.quantity):
-                    logger.warning(
-                        f"Stock insuffisant pour {product.name} "
-                        f"taille {order.size or 'unique'}, quantité demandée: {order.quantity}"
-                    )
+            # Diminuer le stock des variantes (UPDATE conditionnels, par lot)
+            _decrement_cart_stock(
+                cart_orders, reference=payment_intent.id, user=request.user
+            )
+
+            # Compteurs de popularité (ventes en attente de repli)
+            record_sales(cart_orders)
 
             # Envoi automatique de l'email de confirmation de commande
             try:
@@ -344,6 +446,11 @@ def confirm_stripe_payment(request):
                 }
             )
 
+    except InsufficientStockError as e:
+        # Transaction annulée : commandes non payées, paiement remboursé
+        return _out_of_stock_response(
+            e, _refund_unfulfilled_payment(payment_intent_id=payment_intent_id)
+        )
     except stripe.error.StripeError as e:
         logger.error(f"Erreur Stripe: {e}")
         return JsonResponse({"error": f"Erreur Stripe: {str(e)}"}, status=500)
@@ -442,9 +549,6 @@ def execute_paypal_payment(request):
             transaction_id=transaction_id, user=request.user
         )
 
-        # Exécuter le paiement PayPal
-        PayPalPaymentProcessor.execute_payment(payment_id, payer_id)
-
         # Récupérer les commandes liées à cette transaction
         order_ids = [
             int(oid.strip())
@@ -453,7 +557,21 @@ def execute_paypal_payment(request):
         ]
         cart_orders = Order.objects.filter(
             id__in=order_ids, user=request.user, ordered=False
-        )
+        ).select_related("product")
+
+        # Vérifier le stock avant d'encaisser : pas de remboursement PayPal ici
+        unavailable = [
+            check.line
+            for check in validate_cart_lines(cart_orders, user=request.user)
+            if not check.available
+        ]
+        if unavailable:
+            names = ", ".join(order.product.name for order in unavailable)
+            messages.error(request, f"Stock insuffisant pour : {names}")
+            return redirect("store:cart")
+
+        # Exécuter le paiement PayPal
+        PayPalPaymentProcessor.execute_payment(payment_id, payer_id)
 
         # Finaliser la commande
         return _finalize_successful_payment(request, transaction, cart_orders)
@@ -474,13 +592,11 @@ def _finalize_successful_payment(request, transaction, cart_orders):
                 order.date_ordered = timezone.now()
                 order.save()
 
-                # Diminuer le stock via la variante appropriée
-                product = order.product
-                if not product.reduce_stock(order.size, order.quantity):
-                    logger.warning(
-                        f"Stock insuffisant pour {product.name} "
-                        f"taille {order.size or 'unique'}, quantité: {order.quantity}"
-                    )
+            # Diminuer le stock des variantes (UPDATE conditionnels, par lot)
+            _decrement_cart_stock(cart_orders, user=request.user)
+
+            # Compteurs de popularité (ventes en attente de repli)
+            record_sales(cart_orders)
 
             # Nettoyer la session PayPal si nécessaire
             if "paypal_transaction_id" in request.session:
@@ -504,6 +620,20 @@ def _finalize_successful_payment(request, transaction, cart_orders):
             )
             return redirect(success_url)
 
+    except InsufficientStockError as e:
+        # Vendu entre la vérification et l'encaissement : commandes non payées
+        names = ", ".join(order.product.name for order in e.lines)
+        logger.error(
+            f"Rupture après paiement PayPal (transaction {transaction.id}), "
+            f"remboursement à effectuer: {names}"
+        )
+        messages.error(
+            request,
+            f"Stock insuffisant pour : {names}. "
+            "Votre paiement va être remboursé par notre service client.",
+        )
+        return redirect("store:cart")
+
     except Exception as e:
         error_msg = f"Erreur lors de la finalisation: {str(e)}"
         messages.error(request, error_msg)
@@ -825,13 +955,13 @@ def stripe_confirm_payment(request):
                 order.date_ordered = timezone.now()
                 order.save()
 
-                # Décrémenter le stock via la variante appropriée
-                product = order.product
-                if not product.reduce_stock(order.size, order.quantity):
-                    logger.warning(
-                        f"Stock insuffisant pour {product.name} "
-                        f"taille {order.size or 'unique'}: demandé={order.quantity}"
-                    )
+            # Diminuer le stock des variantes (UPDATE conditionnels, par lot)
+            _decrement_cart_stock(
+                cart_orders, reference=payment_intent_id, user=request.user
+            )
+
+            # Compteurs de popularité (ventes en attente de repli)
+            record_sales(cart_orders)
 
             logger.info(f"Commande finalisée - Transaction: {transaction.id}")
 
@@ -845,6 +975,12 @@ def stripe_confirm_payment(request):
 
             return JsonResponse({"success": True, "redirect_url": success_url})
 
+    except InsufficientStockError as e:
+        # Transaction annulée : commandes non payées, paiement remboursé
+        return _out_of_stock_response(
+            e, _refund_unfulfilled_payment(payment_intent_id=payment_intent_id)
+        )
+
     except stripe.error.StripeError as e:
         logger.error(f"Erreur Stripe: {str(e)}")
         return JsonResponse({"error": f"Erreur de paiement: {str(e)}"}, status=500)
@@ -886,7 +1022,8 @@ def stripe_cancel_payment(request):
         if not payment_intent_id:
             return JsonResponse({"error": "Payment Intent ID manquant"}, status=400)
 
-        # Annuler le PaymentIntent si possible
+        # Annuler le PaymentIntent si possible et libérer le stock retenu
+        release_reservations(payment_intent_id)
         payment_intent = stripe.PaymentIntent.cancel(payment_intent_id)
 
         return JsonResponse({"success": True, "status": payment_intent.status})
@@ -928,6 +1065,18 @@ def process_stripe_token_payment(request, stripe_token, amount):
             logger.error(f"Montant incohérent: Formulaire={amount_decimal}, Panier={total_amount}")
             return JsonResponse({"error": "Montant incohérent"}, status=400)
 
+        # Vérifier le stock avant de débiter la carte
+        unavailable = [
+            check.line
+            for check in validate_cart_lines(cart_orders, user=request.user)
+            if not check.available
+        ]
+        if unavailable:
+            names = ", ".join(order.product.name for order in unavailable)
+            return JsonResponse(
+                {"error": f"Stock insuffisant pour : {names}"}, status=409
+            )
+
         # Créer le paiement avec Stripe
         charge = stripe.Charge.create(
             amount=amount_cents,
@@ -984,13 +1133,11 @@ def process_stripe_token_payment(request, stripe_token, amount):
                 order.date_ordered = timezone.now()
                 order.save()
 
-                # Diminuer le stock
-                product = order.product
-                if not product.reduce_stock(order.size, order.quantity):
-                    logger.warning(
-                        f"Stock insuffisant pour {product.name} "
-                        f"taille {order.size or 'unique'}, quantité demandée: {order.quantity}"
-                    )
+            # Diminuer le stock des variantes (UPDATE conditionnels, par lot)
+            _decrement_cart_stock(cart_orders, user=request.user)
+
+            # Compteurs de popularité (ventes en attente de repli)
+            record_sales(cart_orders)
 
             logger.info(f"Paiement par token réussi - Transaction: {transaction.id}")
 
@@ -1014,6 +1161,11 @@ def process_stripe_token_payment(request, stripe_token, amount):
                 # Redirection directe pour les formulaires HTML
                 return redirect(success_url)
 
+    except InsufficientStockError as e:
+        # Transaction annulée : commandes non payées, débit remboursé
+        return _out_of_stock_response(
+            e, _refund_unfulfilled_payment(charge_id=charge.id)
+        )
     except stripe.error.StripeError as e:
         logger.error(f"Erreur Stripe lors du paiement par token: {e}")
         return JsonResponse({"error": f"Erreur Stripe: {str(e)}"}, status=500)
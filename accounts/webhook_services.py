@@ -162,6 +162,7 @@ class StripeWebhookService:
     def _handle_payment_success(event, logger):
         """Traite un paiement Stripe réussi"""
         from django.db import transaction as db_transaction
+        from store.inventory import InsufficientStockError, decrement_stock
         from store.models import Order
 
         payment_intent = event["data"]["object"]
@@ -170,49 +171,59 @@ class StripeWebhookService:
         try:
             transaction = Transaction.objects.get(transaction_id=payment_intent_id)
 
-            if transaction.status == "succeeded":
+            if transaction.status in ("succeeded", "refunded", "stock_issue"):
                 logger.info(f"Transaction {transaction.id} déjà finalisée")
                 return {"success": True, "message": "Already processed"}
 
-            with db_transaction.atomic():
-                transaction.status = "succeeded"
-                transaction.updated_at = timezone.now()
-
-                # Ajouter les détails de la réponse Stripe
-                stripe_data = {
-                    "payment_intent_id": payment_intent_id,
-                    "amount_received": payment_intent.get("amount_received"),
-                    "charges": payment_intent.get("charges", {}).get("data", []),
-                    "webhook_timestamp": timezone.now().isoformat(),
-                }
-                transaction.metadata = stripe_data
-                transaction.save()
+            # Ajouter les détails de la réponse Stripe
+            stripe_data = {
+                "payment_intent_id": payment_intent_id,
+                "amount_received": payment_intent.get("amount_received"),
+                "charges": payment_intent.get("charges", {}).get("data", []),
+                "webhook_timestamp": timezone.now().isoformat(),
+            }
 
-                # Finaliser les commandes
-                if transaction.order_id:
-                    order_ids = [
-                        int(oid.strip())
-                        for oid in transaction.order_id.split(",")
-                        if oid.strip().isdigit()
-                    ]
-                    cart_orders = Order.objects.filter(
-                        id__in=order_ids, user=transaction.user, ordered=False
-                    )
-
-                    for order in cart_orders:
-                        order.ordered = True
-                        order.date_ordered = timezone.now()
-                        order.save()
-
-                        # Diminuer le stock
-                        product = order.product
-                        if product.stock >= order.quantity:
-                            product.stock -= order.quantity
-                            product.save()
-                            logger.info(
-                                f"Stock mis à jour pour {product.name}: "
-                                f"-{order.quantity}"
+            try:
+                with db_transaction.atomic():
+                    transaction.status = "succeeded"
+                    transaction.updated_at = timezone.now()
+                    transaction.metadata = stripe_data
+                    transaction.save()
+
+                    # Finaliser les commandes
+                    if transaction.order_id:
+                        order_ids = [
+                            int(oid.strip())
+                            for oid in transaction.order_id.split(",")
+                            if oid.strip().isdigit()
+                        ]
+                        cart_orders = Order.objects.filter(
+                            id__in=order_ids, user=transaction.user, ordered=False
+                        )
+
+                        for order in cart_orders:
+                            order.ordered = True
+                            order.date_ordered = timezone.now()
+                            order.save()
+
+                        # Diminuer le stock des variantes (UPDATE conditionnels)
+                        failed = [
+                            result.line
+                            for result in decrement_stock(
+                                cart_orders,
+                                reference=payment_intent_id,
+                                user=transaction.user,
                             )
+                            if not result.ok
+                        ]
+                        if failed:
+                            raise InsufficientStockError(failed)
+
+            except InsufficientStockError as e:
+                # Tout est annulé : commandes laissées au panier, paiement remboursé
+                return StripeWebhookService._refund_out_of_stock(
+                    transaction, stripe_data, e.lines, logger
+                )
 
             logger.info(f"Paiement Stripe finalisé avec succès: {transaction.id}")
             return {"success": True, "message": "Payment processed successfully"}
@@ -225,6 +236,43 @@ class StripeWebhookService:
             StripeWebhookService._create_orphan_transaction(payment_intent, logger)
             return {"success": True, "message": "Orphan transaction created"}
 
+    @staticmethod
+    def _refund_out_of_stock(transaction, stripe_data, lines, logger):
+        """
+        Rembourse un paiement dont le panier n'a pas pu être servi.
+
+        La transaction passe en ``refunded``, ou en ``stock_issue`` si le
+        remboursement échoue (à traiter par le service client).
+
+        Args:
+            transaction: Transaction du paiement
+            stripe_data: Détails du PaymentIntent enregistrés en métadonnées
+            lines: Lignes Order sans stock suffisant
+            logger: Logger du webhook
+        """
+        from .payment_services import PaymentProcessingError, StripePaymentProcessor
+
+        for order in lines:
+            logger.warning(f"Stock insuffisant pour la commande {order.id}")
+
+        try:
+            StripePaymentProcessor.create_refund(transaction.transaction_id)
+            transaction.status = "refunded"
+        except PaymentProcessingError as e:
+            logger.error(
+                f"Remboursement impossible après rupture "
+                f"({transaction.transaction_id}): {e}"
+            )
+            transaction.status = "stock_issue"
+
+        transaction.metadata = {
+            **stripe_data,
+            "stock_issue_orders": [order.id for order in lines],
+        }
+        transaction.updated_at = timezone.now()
+        transaction.save()
+        return {"success": True, "message": "Out of stock, payment refunded"}
+
     @staticmethod
     def _handle_payment_failed(event, logger):
         """Traite un échec de paiement Stripe"""
@@ -259,9 +307,14 @@ class StripeWebhookService:
     @staticmethod
     def _handle_payment_canceled(event, logger):
         """Traite l'annulation d'un paiement Stripe"""
+        from store.inventory import release_reservations
+
         payment_intent = event["data"]["object"]
         payment_intent_id = payment_intent["id"]
 
+        # Stock retenu pour ce paiement rendu disponible
+        release_reservations(payment_intent_id)
+
         try:
             transaction = Transaction.objects.get(transaction_id=payment_intent_id)
             transaction.status = "cancelled"
@@ -465,6 +518,7 @@ class PayPalWebhookService:
     def _handle_payment_completed(payload, logger):
         """Traite un paiement PayPal complété"""
         from django.db import transaction as db_transaction
+        from store.inventory import InsufficientStockError, decrement_stock
         from store.models import Order
 
         resource = payload.get("resource", {})
@@ -477,45 +531,67 @@ class PayPalWebhookService:
         try:
             transaction = Transaction.objects.get(transaction_id=custom_id)
 
-            if transaction.status == "succeeded":
+            if transaction.status in ("succeeded", "refunded", "stock_issue"):
                 logger.info(f"Transaction PayPal {transaction.id} déjà finalisée")
                 return {"success": True, "message": "Already processed"}
 
-            with db_transaction.atomic():
-                transaction.status = "succeeded"
-                transaction.updated_at = timezone.now()
+            paypal_data = {
+                "capture_id": resource.get("id"),
+                "amount": resource.get("amount"),
+                "status": resource.get("status"),
+                "webhook_timestamp": timezone.now().isoformat(),
+                "payer_email": resource.get("payer", {}).get("email_address"),
+            }
 
-                paypal_data = {
-                    "capture_id": resource.get("id"),
-                    "amount": resource.get("amount"),
-                    "status": resource.get("status"),
-                    "webhook_timestamp": timezone.now().isoformat(),
-                    "payer_email": resource.get("payer", {}).get("email_address"),
+            try:
+                with db_transaction.atomic():
+                    transaction.status = "succeeded"
+                    transaction.updated_at = timezone.now()
+                    transaction.metadata = paypal_data
+                    transaction.save()
+
+                    # Finaliser les commandes
+                    if transaction.order_id:
+                        order_ids = [
+                            int(oid.strip())
+                            for oid in transaction.order_id.split(",")
+                            if oid.strip().isdigit()
+                        ]
+                        cart_orders = Order.objects.filter(
+                            id__in=order_ids, user=transaction.user, ordered=False
+                        )
+
+                        for order in cart_orders:
+                            order.ordered = True
+                            order.date_ordered = timezone.now()
+                            order.save()
+
+                        # Diminuer le stock des variantes (UPDATE conditionnels)
+                        failed = [
+                            result.line
+                            for result in decrement_stock(
+                                cart_orders, user=transaction.user
+                            )
+                            if not result.ok
+                        ]
+                        if failed:
+                            raise InsufficientStockError(failed)
+
+            except InsufficientStockError as e:
+                # Tout est annulé ; pas de remboursement PayPal automatique
+                for order in e.lines:
+                    logger.warning(f"Stock insuffisant pour la commande {order.id}")
+                logger.error(
+                    f"Paiement PayPal {custom_id} à rembourser : rupture de stock"
+                )
+                transaction.status = "stock_issue"
+                transaction.updated_at = timezone.now()
+                transaction.metadata = {
+                    **paypal_data,
+                    "stock_issue_orders": [order.id for order in e.lines],
                 }
-                transaction.metadata = paypal_data
                 transaction.save()
-
-                # Finaliser les commandes
-                if transaction.order_id:
-                    order_ids = [
-                        int(oid.strip())
-                        for oid in transaction.order_id.split(",")
-                        if oid.strip().isdigit()
-                    ]
-                    cart_orders = Order.objects.filter(
-                        id__in=order_ids, user=transaction.user, ordered=False
-                    )
-
-                    for order in cart_orders:
-                        order.ordered = True
-                        order.date_ordered = timezone.now()
-                        order.save()
-
-                        # Diminuer le stock
-                        product = order.product
-                        if product.stock >= order.quantity:
-                            product.stock -= order.quantity
-                            product.save()
+                return {"success": True, "message": "Out of stock, refund required"}
 
             logger.info(f"Paiement PayPal finalisé avec succès: {transaction.id}")
             return {"success": True, "message": "Payment processed successfully"}
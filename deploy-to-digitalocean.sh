@@ -85,6 +85,7 @@ ssh root@$SERVER_IP << EOF
     echo "🗂️ Migrations Django..."
     python manage.py makemigrations
     python manage.py migrate
+    python manage.py createcachetable
 
     # Collecte des fichiers statiques
     echo "📄 Collecte des fichiers statiques..."
@@ -6,7 +6,10 @@ from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 import json
 
+from store.middleware import page_cache
 
+
+@page_cache()
 def about_view(request):
     """Vue pour la page À propos inspirée de Rhode Skin"""
     context = {
@@ -99,6 +102,7 @@ def contact_view(request):
     return render(request, "pages/contact.html", context)
 
 
+@page_cache()
 def faq_view(request):
     """Vue pour la page FAQ"""
     faq_data = [
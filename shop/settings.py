@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import environ
+import tempfile
 import os
 from django.urls import reverse_lazy
 
@@ -112,11 +113,13 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",  # Pour servir les fichiers statiques
+    "store.middleware.PageCacheMiddleware",  # Pages anonymes en cache (X-Cache)
     "django.contrib.sessions.middleware.SessionMiddleware",
     "accounts.middleware_session.SessionErrorHandlerMiddleware",  # Gestion des erreurs de session
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "allauth.account.middleware.AccountMiddleware",  # Middleware Django Allauth requis
+    "store.middleware.CartSummaryMiddleware",  # request.cart_summary (une fois par requête)
     "django_otp.middleware.OTPMiddleware",  # OTP middleware
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
@@ -395,6 +398,9 @@ PAYMENT_HOST_URL = env("PAYMENT_HOST_URL", default="http://localhost:8000")
 PAYMENT_SUCCESS_URL = reverse_lazy("accounts:payment_success")
 PAYMENT_CANCEL_URL = PAYMENT_HOST_URL + "/accounts/payment/cancelled/"
 
+# Durée des réservations de stock pendant un paiement (store.inventory, secondes)
+STOCK_RESERVATION_TTL = env.int("STOCK_RESERVATION_TTL", default=15 * 60)
+
 # Security for payment processing
 PAYMENT_ENCRYPTION_KEY = env("PAYMENT_ENCRYPTION_KEY", default="default-key-change-me")
 
@@ -535,3 +541,60 @@ SESSION_SERIALIZER = 'django.contrib.sessions.serializers.JSONSerializer'
 SESSION_COOKIE_NAME = 'sessionid'
 CSRF_COOKIE_NAME = 'csrftoken'
 CSRF_COOKIE_HTTPONLY = False
+
+# =============================================================================
+# CACHE PARTAGÉ
+# =============================================================================
+# Un seul cache pour tous les workers : Redis si REDIS_URL est défini, sinon
+# table en base (après `python manage.py createcachetable`). Les verrous de
+# get_or_compute reposent sur un cache.add atomique, ce que FileBasedCache
+# ne garantit pas : pas de repli sur fichiers.
+# InstrumentedCache compte hits/misses/latence/taille par préfixe de clé
+# (admin > Métriques de cache).
+REDIS_URL = env("REDIS_URL", default=None)
+
+if REDIS_URL:
+    CACHE_BACKEND = "django.core.cache.backends.redis.RedisCache"
+    CACHE_LOCATION = REDIS_URL
+else:
+    CACHE_BACKEND = "django.core.cache.backends.db.DatabaseCache"
+    CACHE_LOCATION = "shop_cache"
+
+CACHES = {
+    "default": {
+        "BACKEND": "store.cache_metrics.InstrumentedCache",
+        "LOCATION": CACHE_LOCATION,
+        "TIMEOUT": 300,
+        "KEY_PREFIX": "shop",
+        "OPTIONS": {"BACKEND": CACHE_BACKEND},
+    }
+}
+
+# Fréquence d'écriture des compteurs de cache de chaque worker (secondes)
+CACHE_METRICS_FLUSH_SECONDS = env.int("CACHE_METRICS_FLUSH_SECONDS", default=30)
+# Taille des valeurs mesurée sur une écriture sur N par préfixe (extrapolée)
+CACHE_METRICS_SIZE_SAMPLE_EVERY = env.int("CACHE_METRICS_SIZE_SAMPLE_EVERY", default=10)
+
+# Cache des pages anonymes (store.middleware.PageCacheMiddleware)
+PAGE_CACHE_ENABLED = env.bool("PAGE_CACHE_ENABLED", default=True)
+PAGE_CACHE_TIMEOUT = env.int("PAGE_CACHE_TIMEOUT", default=60)
+PAGE_CACHE_STALE_TIMEOUT = env.int("PAGE_CACHE_STALE_TIMEOUT", default=300)
+
+# Cache local des workers devant le cache partagé (store.near_cache)
+NEAR_CACHE_TTL = env.int("NEAR_CACHE_TTL", default=10)
+NEAR_CACHE_MAX_ENTRIES = env.int("NEAR_CACHE_MAX_ENTRIES", default=512)
+
+# Diffusion des invalidations aux autres workers (store.invalidation_bus) :
+# auto = LISTEN/NOTIFY sous PostgreSQL, journal sur disque sinon ; off = aucun
+INVALIDATION_BUS = env("INVALIDATION_BUS", default="auto")
+INVALIDATION_BUS_FILE = env(
+    "INVALIDATION_BUS_FILE",
+    default=os.path.join(tempfile.gettempdir(), "shop_invalidations.log"),
+)
+INVALIDATION_BUS_POLL_SECONDS = env.float("INVALIDATION_BUS_POLL_SECONDS", default=1.0)
+
+# =============================================================================
+# CATALOGUE - PERFORMANCES
+# =============================================================================
+# Index NumPy en mémoire pour les filtres/tris de la boutique (nécessite numpy)
+CATALOG_INDEX_ENABLED = env.bool("CATALOG_INDEX_ENABLED", default=False)
@@ -48,6 +48,10 @@ CACHES = {
     }
 }
 
+# Pas de copie locale entre les tests, ni de thread d'écoute des invalidations
+NEAR_CACHE_TTL = 0
+INVALIDATION_BUS = 'off'
+
 # Configurations pour éviter les erreurs
 SECRET_KEY = 'test-secret-key-for-testing-only'
 ALLOWED_HOSTS = ['*']
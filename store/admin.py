@@ -3,14 +3,18 @@ from django.utils.html import format_html
 from django.urls import reverse
 from django.http import HttpResponseRedirect
 from django.contrib import messages
-from django.db.models import Sum, Count, Avg
+from django.db.models import Count, Avg
 from .models import (
     Category,
     Product,
     ProductVariant,
     Order,
     Cart,
+    CartItem,
     Wishlist,
+    CacheMetric,
+    StockReservation,
+    InventoryMovement,
 )
 
 
@@ -23,6 +27,21 @@ class ProductVariantInline(admin.TabularInline):
     verbose_name_plural = "Variantes"
 
 
+class CartItemInline(admin.TabularInline):
+    """Lignes du panier, écrites depuis les commandes (lecture seule)"""
+
+    model = CartItem
+    extra = 0
+    can_delete = False
+    fields = ("order", "product", "variant", "quantity", "added_at")
+    readonly_fields = fields
+    verbose_name = "Ligne"
+    verbose_name_plural = "Lignes"
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ["name", "slug", "is_active", "created_at"]
@@ -42,18 +61,24 @@ class ProductAdmin(admin.ModelAdmin):
         "price",
         "image_preview",
         "variant_count",
-        "total_stock",
-        "is_available",
+        "stock_badge",
+        "is_in_stock",
         "created_at",
     ]
-    list_filter = ["category", "created_at", "price"]
+    list_filter = ["is_in_stock", "category", "created_at", "price"]
     search_fields = ["name", "description", "category__name"]
     prepopulated_fields = {"slug": ("name",)}
     list_editable = ["price"]
     ordering = ["-created_at"]
     date_hierarchy = "created_at"
     inlines = [ProductVariantInline]
-    readonly_fields = ["created_at", "updated_at"]
+    readonly_fields = [
+        "created_at",
+        "updated_at",
+        "total_stock",
+        "in_stock_variant_count",
+        "is_in_stock",
+    ]
 
     def image_preview(self, obj):
         if obj.thumbnail:
@@ -65,8 +90,12 @@ class ProductAdmin(admin.ModelAdmin):
 
     image_preview.short_description = "Aperçu"
 
+    def get_queryset(self, request):
+        # Nombre de variantes calculé dans la requête de la liste (pas de N+1)
+        return super().get_queryset(request).annotate(variant_total=Count("variants"))
+
     def variant_count(self, obj):
-        count = obj.variants.count()
+        count = obj.variant_total
         if count > 0:
             return format_html(
                 '<span style="background: #007bff; color: white; padding: 2px 8px; border-radius: 12px; font-size: 11px;">{}</span>',
@@ -77,15 +106,17 @@ class ProductAdmin(admin.ModelAdmin):
         )
 
     variant_count.short_description = "Variantes"
+    variant_count.admin_order_field = "variant_total"
 
-    def total_stock(self, obj):
-        total = obj.variants.aggregate(total=Sum("stock"))["total"] or 0
+    def stock_badge(self, obj):
+        total = obj.total_stock
         color = "#28a745" if total > 10 else "#ffc107" if total > 0 else "#dc3545"
         return format_html(
             '<span style="color: {}; font-weight: bold;">{}</span>', color, total
         )
 
-    total_stock.short_description = "Stock total"
+    stock_badge.short_description = "Stock total"
+    stock_badge.admin_order_field = "total_stock"
 
     fieldsets = (
         (
@@ -102,6 +133,12 @@ class ProductAdmin(admin.ModelAdmin):
                 )
             },
         ),
+        (
+            "Stock",
+            {
+                "fields": ("total_stock", "in_stock_variant_count", "is_in_stock"),
+            },
+        ),
         (
             "Métadonnées",
             {
@@ -144,6 +181,7 @@ class CartAdmin(admin.ModelAdmin):
     search_fields = ["user__username", "user__email"]
     ordering = ["-updated_at"]
     readonly_fields = ["created_at", "updated_at", "detailed_summary"]
+    inlines = [CartItemInline]
 
     def total_items(self, obj):
         return obj.total_items
@@ -279,3 +317,100 @@ class WishlistAdmin(admin.ModelAdmin):
     )
 
     readonly_fields = ["created_at"]
+
+
+@admin.register(CacheMetric)
+class CacheMetricAdmin(admin.ModelAdmin):
+    """Taux de hit, latence et taille des valeurs du cache, par préfixe de clé"""
+
+    list_display = [
+        "prefix",
+        "hit_ratio_display",
+        "hits",
+        "misses",
+        "sets",
+        "deletes",
+        "avg_get_display",
+        "avg_set_display",
+        "avg_size_display",
+        "updated_at",
+    ]
+    search_fields = ["prefix"]
+    ordering = ["prefix"]
+    readonly_fields = [field.name for field in CacheMetric._meta.fields]
+    actions = ["reset_metrics"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        # Inclure les compteurs du worker courant pas encore écrits en base
+        from store.cache_metrics import flush_metrics
+
+        flush_metrics()
+        return super().changelist_view(request, extra_context)
+
+    def hit_ratio_display(self, obj):
+        ratio = obj.hit_ratio * 100
+        color = "#28a745" if ratio >= 80 else "#ffc107" if ratio >= 50 else "#dc3545"
+        return format_html(
+            '<span style="color: {}; font-weight: bold;">{} %</span>',
+            color,
+            f"{ratio:.1f}",
+        )
+
+    hit_ratio_display.short_description = "Taux de hit"
+
+    def avg_get_display(self, obj):
+        return f"{obj.avg_get_ms:.2f} ms"
+
+    avg_get_display.short_description = "Lecture moy."
+
+    def avg_set_display(self, obj):
+        return f"{obj.avg_set_ms:.2f} ms"
+
+    avg_set_display.short_description = "Écriture moy."
+
+    def avg_size_display(self, obj):
+        return f"{obj.avg_value_size / 1024:.1f} Ko"
+
+    avg_size_display.short_description = "Taille moy."
+
+    @admin.action(description="Remettre les compteurs à zéro")
+    def reset_metrics(self, request, queryset):
+        count = queryset.count()
+        queryset.delete()
+        messages.success(request, f"{count} métrique(s) remise(s) à zéro.")
+
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    """Stock retenu par les paiements en cours (lecture seule)"""
+
+    list_display = ["variant", "quantity", "user", "reference", "expires_at"]
+    list_filter = ["expires_at"]
+    search_fields = ["reference", "variant__product__name", "user__username"]
+    list_select_related = ["variant__product", "user"]
+    ordering = ["expires_at"]
+    readonly_fields = [field.name for field in StockReservation._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(InventoryMovement)
+class InventoryMovementAdmin(admin.ModelAdmin):
+    """Journal des mouvements de stock (ajout seul : lecture uniquement)"""
+
+    list_display = ["created_at", "variant", "quantity", "reason", "order", "user", "note"]
+    list_filter = ["reason", "created_at"]
+    search_fields = ["variant__product__name", "note", "user__username"]
+    list_select_related = ["variant__product", "order", "user"]
+    date_hierarchy = "created_at"
+    readonly_fields = [field.name for field in InventoryMovement._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,260 @@
+"""
+Codec compact des valeurs mises en cache.
+
+Les listes de produits de l'accueil (produits vedettes, ``hero_products``,
+``products_by_category``) étaient mises en cache sous forme d'instances
+picklées : volumineuses, lentes à relire et liées à la classe Python du
+déploiement qui les a écrites.
+
+``dumps`` réduit chaque instance de modèle à un tuple de valeurs simples ;
+les noms de champs ne sont écrits qu'une fois par forme (modèle + champs
+chargés) et chaque ligne une seule fois (la catégorie commune à vingt
+produits), dans l'en-tête. Le tout est sérialisé en msgpack (marshal si msgpack
+n'est pas installé) puis compressé par zlib au-delà de
+``COMPRESS_THRESHOLD`` octets. ``loads`` reconstruit les instances comme si
+elles avaient été dépicklées, relations préchargées comprises.
+
+Une valeur écrite avec un autre ``SCHEMA_VERSION`` ou dont un champ n'existe
+plus lève ``CodecSchemaError`` : le cache la traite comme absente.
+"""
+
+import datetime
+import marshal
+import struct
+import zlib
+from decimal import Decimal
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.base import ModelState
+from django.db.models.fields.files import FieldFile
+
+try:
+    import msgpack
+except ImportError:  # Dépendance optionnelle
+    msgpack = None
+
+SCHEMA_VERSION = 1
+
+# Compression zlib au-delà de cette taille (octets)
+COMPRESS_THRESHOLD = 1024
+COMPRESS_LEVEL = 6
+
+_MAGIC = b"SC"
+_HEADER = struct.Struct(">2sBB")
+_FLAG_ZLIB = 1
+_FLAG_MARSHAL = 2
+
+# Marqueurs des valeurs non natives
+_MODEL = "~m"
+_DECIMAL = "~d"
+_DATETIME = "~t"
+_DATE = "~D"
+
+
+class CodecSchemaError(ValueError):
+    """Valeur écrite avec un autre schéma : à recalculer."""
+
+
+def _plain(value):
+    """Valeur de champ de modèle -> type natif msgpack/marshal."""
+    if isinstance(value, FieldFile):
+        return value.name
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def _converter(field):
+    """Conversion inverse de _plain (None : valeur native telle quelle)."""
+    internal_type = field.get_internal_type()
+    if internal_type == "DecimalField":
+        return Decimal
+    if internal_type == "DateTimeField":
+        return datetime.datetime.fromisoformat
+    if internal_type == "DateField":
+        return datetime.date.fromisoformat
+    if internal_type == "TimeField":
+        return datetime.time.fromisoformat
+    return None
+
+
+class _Encoder:
+    def __init__(self):
+        self.shapes = []
+        self.objects = []
+        self._shape_ids = {}
+        self._object_ids = {}
+
+    def shape_id(self, instance):
+        opts = instance._meta
+        deferred = instance.get_deferred_fields()
+        fields = tuple(
+            field.attname
+            for field in opts.concrete_fields
+            if field.attname not in deferred
+        )
+        shape = (opts.label, fields)
+        if shape not in self._shape_ids:
+            self._shape_ids[shape] = len(self.shapes)
+            self.shapes.append([opts.label, list(fields)])
+        return self._shape_ids[shape], fields
+
+    def object_id(self, instance):
+        shape, fields = self.shape_id(instance)
+        values = [_plain(getattr(instance, attname)) for attname in fields]
+        # Relations déjà chargées (select_related)
+        related = {
+            name: self.encode(cached)
+            for name, cached in instance._state.fields_cache.items()
+            if cached is None or hasattr(cached, "_meta")
+        }
+        # Une même ligne (la catégorie de 20 produits) n'est écrite qu'une fois
+        key = (
+            shape,
+            tuple(values),
+            tuple((name, ref and ref[_MODEL]) for name, ref in related.items()),
+        )
+        if key not in self._object_ids:
+            self._object_ids[key] = len(self.objects)
+            self.objects.append([shape, values, related])
+        return self._object_ids[key]
+
+    def encode(self, value):
+        if value is None or isinstance(value, (bool, int, float, str, bytes)):
+            return value
+        if isinstance(value, (list, tuple)):
+            return [self.encode(item) for item in value]
+        if isinstance(value, dict):
+            return {key: self.encode(item) for key, item in value.items()}
+        if isinstance(value, Decimal):
+            return {_DECIMAL: str(value)}
+        if isinstance(value, datetime.datetime):
+            return {_DATETIME: value.isoformat()}
+        if isinstance(value, datetime.date):
+            return {_DATE: value.isoformat()}
+        if hasattr(value, "_meta") and hasattr(value, "_state"):
+            return {_MODEL: self.object_id(value)}
+        raise TypeError(f"Type non pris en charge par le codec: {type(value)!r}")
+
+
+class _Decoder:
+    def __init__(self, shapes, objects):
+        self.shapes = []
+        for label, attnames in shapes:
+            try:
+                model = apps.get_model(label)
+            except LookupError as e:
+                raise CodecSchemaError(str(e)) from e
+            fields = {field.attname: field for field in model._meta.concrete_fields}
+            missing = set(attnames) - set(fields)
+            if missing:
+                raise CodecSchemaError(f"Champs disparus de {label}: {missing}")
+            converters = [
+                (position, convert)
+                for position, convert in enumerate(
+                    _converter(fields[attname]) for attname in attnames
+                )
+                if convert is not None
+            ]
+            self.shapes.append((model, attnames, converters))
+        self.objects = objects
+        self._instances = {}
+
+    def decode(self, value):
+        if isinstance(value, list):
+            return [self.decode(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+        if len(value) == 1:
+            marker, payload = next(iter(value.items()))
+            if marker == _MODEL:
+                return self.instance(payload)
+            if marker == _DECIMAL:
+                return Decimal(payload)
+            if marker == _DATETIME:
+                return datetime.datetime.fromisoformat(payload)
+            if marker == _DATE:
+                return datetime.date.fromisoformat(payload)
+        return {key: self.decode(item) for key, item in value.items()}
+
+    def instance(self, object_id):
+        if object_id in self._instances:
+            return self._instances[object_id]
+
+        shape, values, related = self.objects[object_id]
+        model, attnames, converters = self.shapes[shape]
+        for position, convert in converters:
+            if values[position] is not None:
+                values[position] = convert(values[position])
+
+        # Comme le dépickling : pas d'appel à __init__ ni aux signaux init
+        instance = model.__new__(model)
+        instance.__dict__.update(zip(attnames, values))
+        instance._state = ModelState()
+        instance._state.adding = False
+        instance._state.db = DEFAULT_DB_ALIAS
+        for name, cached in related.items():
+            instance._state.fields_cache[name] = self.decode(cached)
+
+        self._instances[object_id] = instance
+        return instance
+
+
+def dumps(value):
+    """
+    Sérialise une valeur (types simples, listes, dicts, instances de modèle).
+
+    Returns:
+        bytes: En-tête (version, options) + corps éventuellement compressé
+    """
+    encoder = _Encoder()
+    body = encoder.encode(value)
+    document = [encoder.shapes, encoder.objects, body]
+
+    flags = 0
+    if msgpack is not None:
+        data = msgpack.packb(document, use_bin_type=True)
+    else:
+        data = marshal.dumps(document)
+        flags |= _FLAG_MARSHAL
+
+    if len(data) > COMPRESS_THRESHOLD:
+        data = zlib.compress(data, COMPRESS_LEVEL)
+        flags |= _FLAG_ZLIB
+
+    return _HEADER.pack(_MAGIC, SCHEMA_VERSION, flags) + data
+
+
+def loads(data):
+    """
+    Reconstruit une valeur écrite par dumps.
+
+    Raises:
+        CodecSchemaError: Format ou schéma différent de celui du déploiement
+    """
+    if len(data) < _HEADER.size:
+        raise CodecSchemaError("Valeur tronquée")
+    magic, version, flags = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != SCHEMA_VERSION:
+        raise CodecSchemaError(f"Schéma {version} (attendu {SCHEMA_VERSION})")
+
+    if not flags & _FLAG_MARSHAL and msgpack is None:
+        raise CodecSchemaError("msgpack requis pour relire cette valeur")
+
+    data = data[_HEADER.size :]
+    try:
+        if flags & _FLAG_ZLIB:
+            data = zlib.decompress(data)
+        if flags & _FLAG_MARSHAL:
+            shapes, objects, body = marshal.loads(data)
+        else:
+            shapes, objects, body = msgpack.unpackb(
+                data, raw=False, strict_map_key=False
+            )
+    except (ValueError, EOFError, zlib.error) as e:
+        raise CodecSchemaError(f"Valeur illisible: {e}") from e
+
+    return _Decoder(shapes, objects).decode(body)
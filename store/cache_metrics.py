@@ -0,0 +1,228 @@
+"""
+Backend de cache instrumenté.
+
+``InstrumentedCache`` enveloppe le vrai backend (Redis, fichiers, base)
+désigné par ``OPTIONS["BACKEND"]`` et compte, par préfixe de clé
+(``featured_products``, ``cart_summary``...), les hits, misses, écritures,
+suppressions, la latence et la taille des valeurs écrites. La taille n'est
+mesurée (pickle) que sur une écriture sur ``CACHE_METRICS_SIZE_SAMPLE_EVERY``
+de chaque préfixe, puis extrapolée : le backend sérialise déjà la valeur.
+
+Les compteurs sont tenus en mémoire par worker puis ajoutés régulièrement
+(``CACHE_METRICS_FLUSH_SECONDS``) au modèle ``CacheMetric``, consultable dans
+l'admin : les chiffres agrègent donc tous les workers. Un accès au cache fait
+dans une transaction reporte l'écriture après le commit.
+"""
+
+import logging
+import pickle
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Fin de clé variable : identifiants, versions, empreintes
+_VARIABLE_PART_RE = re.compile(r"[:_.-]+(?=[^:_.-]*\d)")
+
+STAT_FIELDS = (
+    "hits",
+    "misses",
+    "sets",
+    "deletes",
+    "get_time",
+    "set_time",
+    "bytes_written",
+)
+
+_lock = threading.Lock()
+_stats = {}
+_last_flush = time.monotonic()
+
+
+def key_prefix(key):
+    """
+    Préfixe de regroupement d'une clé : partie fixe avant le premier segment
+    contenant un chiffre (``cart_summary_42`` -> ``cart_summary``).
+    """
+    key = str(key)
+    match = _VARIABLE_PART_RE.search(key)
+    prefix = key[: match.start()] if match else key
+    return prefix or key
+
+
+def value_size(value):
+    """Taille sérialisée approximative d'une valeur (octets)."""
+    try:
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 0
+
+
+def record(key, **increments):
+    """Ajoute des compteurs pour la clé (mémoire du worker)."""
+    prefix = key_prefix(key)
+    with _lock:
+        stats = _stats.setdefault(prefix, dict.fromkeys(STAT_FIELDS, 0))
+        for field, amount in increments.items():
+            stats[field] += amount
+        due = time.monotonic() - _last_flush >= getattr(
+            settings, "CACHE_METRICS_FLUSH_SECONDS", 30
+        )
+    if due:
+        _flush_when_safe()
+
+
+def record_write(key, value, elapsed):
+    """Compte une écriture ; taille mesurée sur un échantillon des écritures."""
+    every = max(getattr(settings, "CACHE_METRICS_SIZE_SAMPLE_EVERY", 10), 1)
+    with _lock:
+        stats = _stats.get(key_prefix(key))
+        sampled = stats is None or stats["sets"] % every == 0
+    size = every * value_size(value) if sampled else 0
+    record(key, sets=1, set_time=elapsed, bytes_written=size)
+
+
+def _flush_when_safe():
+    """Écrit les compteurs, après le commit si une transaction est en cours."""
+    global _last_flush
+
+    if not connection.in_atomic_block:
+        flush_metrics()
+        return
+    # Une seule écriture programmée par période ; après un rollback, les
+    # compteurs restent en mémoire pour la période suivante
+    with _lock:
+        _last_flush = time.monotonic()
+    transaction.on_commit(flush_metrics)
+
+
+def pending_metrics():
+    """Copie des compteurs du worker pas encore écrits en base."""
+    with _lock:
+        return {prefix: dict(stats) for prefix, stats in _stats.items()}
+
+
+def flush_metrics():
+    """
+    Ajoute les compteurs du worker à CacheMetric puis les remet à zéro.
+
+    Returns:
+        int: Nombre de préfixes écrits
+    """
+    global _stats, _last_flush
+
+    with _lock:
+        stats, _stats = _stats, {}
+        _last_flush = time.monotonic()
+    if not stats:
+        return 0
+
+    from django.db.models import F
+    from django.utils import timezone
+
+    from store.models import CacheMetric
+
+    try:
+        # Point de sauvegarde : une erreur ici n'interrompt pas la transaction appelante
+        with transaction.atomic():
+            for prefix, values in stats.items():
+                metric, _ = CacheMetric.objects.get_or_create(prefix=prefix[:200])
+                CacheMetric.objects.filter(pk=metric.pk).update(
+                    **{field: F(field) + values[field] for field in STAT_FIELDS},
+                    updated_at=timezone.now(),
+                )
+    except Exception as e:
+        logger.warning("Métriques de cache non enregistrées: %s", e)
+        return 0
+    return len(stats)
+
+
+class InstrumentedCache(BaseCache):
+    """Proxy de cache comptant les accès par préfixe de clé."""
+
+    def __init__(self, location, params):
+        params = dict(params)
+        options = dict(params.get("OPTIONS", {}))
+        backend = options.pop(
+            "BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        )
+        params["OPTIONS"] = options
+        super().__init__(params)
+        self._cache = import_string(backend)(location, params)
+
+    def _timed(self, method, *args, **kwargs):
+        start = time.perf_counter()
+        result = getattr(self._cache, method)(*args, **kwargs)
+        return result, time.perf_counter() - start
+
+    def get(self, key, default=None, version=None):
+        sentinel = object()
+        value, elapsed = self._timed("get", key, sentinel, version=version)
+        if value is sentinel:
+            record(key, misses=1, get_time=elapsed)
+            return default
+        record(key, hits=1, get_time=elapsed)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found, elapsed = self._timed("get_many", keys, version=version)
+        share = elapsed / len(keys) if keys else 0
+        for key in keys:
+            if key in found:
+                record(key, hits=1, get_time=share)
+            else:
+                record(key, misses=1, get_time=share)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        result, elapsed = self._timed("set", key, value, timeout, version=version)
+        record_write(key, value, elapsed)
+        return result
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added, elapsed = self._timed("add", key, value, timeout, version=version)
+        if added:
+            record_write(key, value, elapsed)
+        return added
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed, elapsed = self._timed("set_many", data, timeout, version=version)
+        share = elapsed / len(data) if data else 0
+        for key, value in data.items():
+            record_write(key, value, share)
+        return failed
+
+    def delete(self, key, version=None):
+        record(key, deletes=1)
+        return self._cache.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        for key in keys:
+            record(key, deletes=1)
+        return self._cache.delete_many(keys, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._cache.touch(key, timeout, version=version)
+
+    def has_key(self, key, version=None):
+        return self._cache.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self._cache.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        return self._cache.decr(key, delta, version=version)
+
+    def clear(self):
+        return self._cache.clear()
+
+    def close(self, **kwargs):
+        return self._cache.close(**kwargs)
@@ -0,0 +1,133 @@
+"""
+Invalidation du cache par étiquettes (tags).
+
+Une entrée est étiquetée par les objets dont elle dépend : ``product:42``,
+``category:*`` (n'importe quelle catégorie), ``catalog``, ``cart:7``... Chaque
+étiquette a une version stockée dans le cache ; la clé réelle d'une entrée
+contient l'empreinte des versions de ses étiquettes. Invalider une étiquette
+change sa version : les entrées concernées ne sont plus jamais lues et
+expirent d'elles-mêmes.
+
+Les invalidations faites dans une transaction sont regroupées et appliquées
+une seule fois après le commit (``on_commit``) : une édition en masse dans
+l'admin ne coûte qu'une écriture de cache.
+"""
+
+import hashlib
+import threading
+import uuid
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+TAG_VERSION_PREFIX = "tag_version:"
+
+# Les versions doivent survivre aux entrées qu'elles protègent
+TAG_VERSION_TIMEOUT = None
+
+_local = threading.local()
+
+
+def _version_key(tag):
+    return f"{TAG_VERSION_PREFIX}{tag}"
+
+
+def _new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def get_tag_versions(tags):
+    """
+    Versions courantes des étiquettes (une seule lecture groupée).
+
+    Une étiquette sans version (jamais invalidée ou évincée du cache) en
+    reçoit une nouvelle : une éviction ne peut pas ressusciter d'anciennes
+    entrées.
+
+    Returns:
+        dict: {étiquette: version}
+    """
+    keys = {_version_key(tag): tag for tag in tags}
+    found = cache.get_many(list(keys))
+    versions = {keys[key]: value for key, value in found.items()}
+
+    for key, tag in keys.items():
+        if tag not in versions:
+            version = _new_version()
+            if not cache.add(key, version, TAG_VERSION_TIMEOUT):
+                version = cache.get(key, version)
+            versions[tag] = version
+    return versions
+
+
+def tag_stamp(tags):
+    """Empreinte des versions courantes des étiquettes ("" sans étiquette)."""
+    tags = sorted(set(tags))
+    if not tags:
+        return ""
+    versions = get_tag_versions(tags)
+    stamp = "|".join(f"{tag}={versions[tag]}" for tag in tags)
+    return hashlib.md5(stamp.encode()).hexdigest()[:12]
+
+
+def tagged_key(key, tags, stamp=None):
+    """
+    Clé de cache incluant l'empreinte des versions des étiquettes.
+
+    Args:
+        stamp: Empreinte déjà lue par tag_stamp (évite une seconde lecture)
+    """
+    if stamp is None:
+        stamp = tag_stamp(tags)
+    return f"{key}:{stamp}" if stamp else key
+
+
+def bump_tags(tags):
+    """Change immédiatement la version des étiquettes (une écriture groupée)."""
+    from store.invalidation_bus import publish
+    from store.near_cache import discard_tags
+
+    tags = set(tags)
+    if tags:
+        version = _new_version()
+        cache.set_many(
+            {_version_key(tag): version for tag in tags}, TAG_VERSION_TIMEOUT
+        )
+        # Les copies locales de ce worker sont retirées sans attendre leur TTL,
+        # celles des autres workers à réception du message
+        discard_tags(tags)
+        publish(tags)
+
+
+def _pending():
+    if not hasattr(_local, "tags"):
+        _local.tags = set()
+    return _local.tags
+
+
+def _flush_pending():
+    tags = _pending()
+    if tags:
+        # Vider avant d'écrire : les rappels suivants de la transaction sont sans effet
+        pending = set(tags)
+        tags.clear()
+        bump_tags(pending)
+
+
+def invalidate_tags(*tags):
+    """
+    Invalide des étiquettes, après le commit si une transaction est en cours.
+
+    Toutes les invalidations d'une même transaction sont appliquées ensemble
+    par une seule écriture de cache.
+    """
+    _pending().update(tags)
+    if connection.in_atomic_block:
+        transaction.on_commit(_flush_pending)
+    else:
+        _flush_pending()
+
+
+def instance_tags(label, pk):
+    """Étiquettes d'un objet : l'objet lui-même et le joker de son modèle."""
+    return (f"{label}:{pk}", f"{label}:*")
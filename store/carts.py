@@ -0,0 +1,121 @@
+"""
+Lignes et totaux du panier.
+
+``Cart.orders`` passait par la table M2M automatique : chaque lecture du
+panier joignait trois tables, et ``total_items``, ``total_price`` et
+``is_empty`` lançaient chacun leur requête. Les lignes sont désormais des
+CartItem (table intermédiaire de ``Cart.orders``) : une ligne par commande
+non payée, au plus une par variante, avec produit et quantité recopiés de la
+commande.
+
+``Cart.item_count`` et ``Cart.subtotal`` sont recalculés par un seul UPDATE
+dans la transaction de chaque écriture (signaux de Cart.orders, Order et
+Product) : le badge du panier (``get_cart_counts``) lit une seule ligne.
+Une commande payée quitte le panier.
+"""
+
+from decimal import Decimal
+
+from django.db.models import (
+    DecimalField,
+    Exists,
+    ExpressionWrapper,
+    F,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+EMPTY_CART_COUNTS = {"total_items": 0, "total_price": 0, "is_empty": True}
+
+
+def cart_totals():
+    """Expressions item_count / subtotal d'un panier, pour Cart.objects.update()."""
+    from store.models import CartItem
+
+    items = CartItem.objects.filter(cart=OuterRef("pk")).order_by().values("cart")
+    amount = ExpressionWrapper(
+        F("quantity") * F("product__price"),
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+    return {
+        "item_count": Coalesce(
+            Subquery(items.annotate(total=Sum("quantity")).values("total")), 0
+        ),
+        "subtotal": Coalesce(
+            Subquery(items.annotate(total=Sum(amount)).values("total")),
+            Value(Decimal("0")),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        ),
+    }
+
+
+def refresh_cart_totals(carts):
+    """
+    Recalcule les totaux des paniers en un UPDATE.
+
+    Args:
+        carts: QuerySet de Cart
+
+    Returns:
+        int: Nombre de paniers mis à jour
+    """
+    return carts.update(updated_at=timezone.now(), **cart_totals())
+
+
+def sync_cart_items(items):
+    """
+    Recopie produit, variante et quantité de la commande dans ses lignes.
+
+    Appelée après ``cart.orders.add()``, qui crée les lignes sans ces champs.
+
+    Args:
+        items: QuerySet de CartItem
+    """
+    from store.models import Order, ProductVariant
+
+    order = Order.objects.filter(pk=OuterRef("order_id"))
+    variant = ProductVariant.objects.filter(
+        Exists(
+            Order.objects.filter(
+                pk=OuterRef(OuterRef("order_id")),
+                product_id=OuterRef("product_id"),
+                size=OuterRef("size"),
+            )
+        )
+    )
+    items.update(
+        product_id=Subquery(order.values("product_id")),
+        quantity=Subquery(order.values("quantity")),
+        variant_id=Subquery(variant.values("pk")[:1]),
+    )
+
+
+def get_cart_counts(user):
+    """
+    Nombre d'articles et total du panier, lus sur la seule ligne Cart.
+
+    Args:
+        user: L'utilisateur Django
+
+    Returns:
+        dict: total_items, total_price, is_empty
+    """
+    from store.models import Cart
+
+    if not user.is_authenticated:
+        return dict(EMPTY_CART_COUNTS)
+
+    row = Cart.objects.filter(user=user).values_list("item_count", "subtotal").first()
+    if row is None:
+        return dict(EMPTY_CART_COUNTS)
+
+    item_count, subtotal = row
+    return {
+        "total_items": item_count,
+        "total_price": subtotal,
+        "is_empty": not item_count,
+    }
@@ -0,0 +1,177 @@
+"""
+Index du catalogue en mémoire (NumPy), optionnel.
+
+Chaque worker charge une fois les colonnes utiles au listing (id, prix en
+centimes, catégorie, date de création, disponibilité) dans des tableaux NumPy.
+Les filtres catégorie/prix/stock et les tris de ``product_list`` sont alors
+résolus par masques vectorisés et ``argsort`` ; seule la page affichée est
+lue en base.
+
+L'index est reconstruit dès que la version du catalogue ou de l'inventaire
+change (``store.performance_utils``) : une vente qui ne vide aucune variante
+ne le reconstruit pas. Le tri par quantité en stock reste donc en SQL.
+Activé par
+``CATALOG_INDEX_ENABLED`` ; sans NumPy, la boutique reste sur SQL.
+"""
+
+import logging
+import threading
+
+from django.conf import settings
+from django.core.paginator import Paginator
+
+from store.models import Product
+from store.performance_utils import get_catalog_version, get_inventory_version
+
+try:
+    import numpy as np
+except ImportError:  # Dépendance optionnelle
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Tris de product_list résolus par l'index -> (colonne, décroissant)
+CATALOG_INDEX_SORTS = {
+    "price": ("price_cents", False),
+    "-price": ("price_cents", True),
+    "created_at": ("created_at", False),
+    "-created_at": ("created_at", True),
+}
+
+_lock = threading.Lock()
+_index = None
+
+
+class CatalogIndex:
+    """Instantané colonne par colonne du catalogue."""
+
+    def __init__(self, rows, version):
+        self.version = version
+        (ids, prices, category_ids, created_at, in_stock) = (
+            zip(*rows) if rows else ((),) * 5
+        )
+
+        self.ids = np.array(ids, dtype=np.int64)
+        self.price_cents = np.array(
+            [int(round(price * 100)) for price in prices], dtype=np.int64
+        )
+        self.category_ids = np.array(
+            [-1 if pk is None else pk for pk in category_ids], dtype=np.int64
+        )
+        self.created_at = np.array(
+            [int(date.timestamp() * 1_000_000) if date else 0 for date in created_at],
+            dtype=np.int64,
+        )
+        self.in_stock = np.array(in_stock, dtype=bool)
+
+    @classmethod
+    def build(cls):
+        version = get_catalog_version() + get_inventory_version()
+        rows = list(
+            Product.objects.order_by().values_list(
+                "id",
+                "price",
+                "category_id",
+                "created_at",
+                "is_in_stock",
+            )
+        )
+        return cls(rows, version)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def query(
+        self,
+        category_id=None,
+        price_min=None,
+        price_max=None,
+        price_below=None,
+        stock_filter="",
+        sort="-created_at",
+        product_ids=None,
+    ):
+        """
+        Retourne les identifiants correspondants, dans l'ordre demandé.
+
+        Args:
+            category_id: Catégorie à filtrer (None = toutes)
+            price_min, price_max: Bornes de prix en euros (incluses)
+            price_below: Borne haute exclue (tranches de prix)
+            stock_filter: "in", "out" ou ""
+            sort: Clé de CATALOG_INDEX_SORTS
+            product_ids: Restreindre à ces identifiants (ex. filtre taille)
+
+        Returns:
+            numpy.ndarray: Identifiants de produits triés
+        """
+        mask = np.ones(len(self.ids), dtype=bool)
+        if category_id is not None:
+            mask &= self.category_ids == category_id
+        if price_min is not None:
+            mask &= self.price_cents >= int(round(price_min * 100))
+        if price_max is not None:
+            mask &= self.price_cents <= int(round(price_max * 100))
+        if price_below is not None:
+            mask &= self.price_cents < int(round(price_below * 100))
+        if stock_filter == "in":
+            mask &= self.in_stock
+        elif stock_filter == "out":
+            mask &= ~self.in_stock
+        if product_ids is not None:
+            mask &= np.isin(self.ids, np.fromiter(product_ids, dtype=np.int64))
+
+        column, descending = CATALOG_INDEX_SORTS[sort]
+        keys = getattr(self, column)[mask]
+        ids = self.ids[mask]
+
+        # Tri principal sur la colonne, l'identifiant départage les égalités
+        order = np.lexsort((ids, keys))
+        if descending:
+            order = order[::-1]
+        return ids[order]
+
+
+def is_enabled():
+    return np is not None and getattr(settings, "CATALOG_INDEX_ENABLED", False)
+
+
+def get_catalog_index():
+    """
+    Retourne l'index du worker, reconstruit si le catalogue a changé.
+
+    Returns:
+        CatalogIndex ou None si l'index est désactivé
+    """
+    global _index
+
+    if not is_enabled():
+        return None
+
+    version = get_catalog_version() + get_inventory_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+
+    with _lock:
+        if _index is None or _index.version != version:
+            _index = CatalogIndex.build()
+            logger.info("Index catalogue reconstruit: %s produits", len(_index))
+        return _index
+
+
+def paginate_product_ids(product_ids, per_page, page_number, queryset=None):
+    """
+    Pagine des identifiants puis ne charge que ceux de la page demandée.
+
+    Returns:
+        Page: Page Django dont object_list contient les produits
+    """
+    if queryset is None:
+        queryset = Product.objects.select_related("category")
+
+    page = Paginator(product_ids, per_page).get_page(page_number)
+    page_ids = [int(pk) for pk in page.object_list]
+    products = queryset.in_bulk(page_ids)
+    page.object_list = [products[pk] for pk in page_ids if pk in products]
+    return page
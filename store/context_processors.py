@@ -1,33 +1,50 @@
 """
 Context processors pour rendre les données globales disponibles dans tous les templates.
+
+Les valeurs sont paresseuses (SimpleLazyObject) : le cache et la base ne sont
+interrogés que si le template les lit. Les pages qui n'affichent ni menu des
+catégories ni badge du panier (FAQ, à propos, erreurs) ne coûtent aucune
+requête.
 """
 
-from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
 from store.models import Category
+from store.near_cache import near_cache
+
+
+def _active_categories():
+    # Copie locale au worker devant le cache partagé
+    return near_cache.get_or_compute(
+        "global_categories",
+        lambda: list(
+            Category.objects.filter(is_active=True).order_by("display_order", "name")
+        ),
+        3600,  # Cache 1h
+        tags=("category:*",),
+    )
+
+
+def _featured_categories():
+    return near_cache.get_or_compute(
+        "global_featured_categories",
+        lambda: list(
+            Category.objects.filter(is_featured=True, is_active=True).order_by(
+                "display_order", "name"
+            )[:6]
+        ),
+        3600,
+        tags=("category:*",),
+    )
 
 
 def global_categories(request):
     """
     Context processor pour rendre les catégories disponibles globalement.
     """
-    # Utiliser le cache pour éviter des requêtes répétées
-    categories = cache.get("global_categories")
-    if categories is None:
-        categories = Category.objects.filter(is_active=True).order_by(
-            "display_order", "name"
-        )
-        cache.set("global_categories", categories, 3600)  # Cache 1h
-
-    featured_categories = cache.get("global_featured_categories")
-    if featured_categories is None:
-        featured_categories = Category.objects.filter(
-            is_featured=True, is_active=True
-        ).order_by("display_order", "name")[:6]
-        cache.set("global_featured_categories", featured_categories, 3600)
-
     return {
-        "global_categories": categories,
-        "global_featured_categories": featured_categories,
+        "global_categories": SimpleLazyObject(_active_categories),
+        "global_featured_categories": SimpleLazyObject(_featured_categories),
     }
 
 
@@ -35,20 +52,15 @@ def cart_info(request):
     """
     Context processor pour le panier disponible globalement.
     """
-    if not request.user.is_authenticated:
-        return {
-            "cart_total_items": 0,
-            "cart_total_price": 0,
-            "cart_is_empty": True,
-        }
-
-    # Utiliser la fonction existante
-    from store.views import get_cart_summary
+    # Résumé partagé avec les tags et la vue de la requête, calculé à la
+    # première lecture (rien pour un visiteur anonyme)
+    from store.middleware import get_request_cart_summary
 
-    cart_data = get_cart_summary(request.user)
+    # Totaux seuls : une ligne Cart, sans les articles
+    counts = get_request_cart_summary(request).counts
 
     return {
-        "cart_total_items": cart_data["total_items"],
-        "cart_total_price": cart_data["total_price"],
-        "cart_is_empty": cart_data["is_empty"],
+        "cart_total_items": SimpleLazyObject(lambda: counts()["total_items"]),
+        "cart_total_price": SimpleLazyObject(lambda: counts()["total_price"]),
+        "cart_is_empty": SimpleLazyObject(lambda: counts()["is_empty"]),
     }
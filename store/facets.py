@@ -0,0 +1,238 @@
+"""
+Statistiques à facettes de la boutique en une seule requête groupée.
+
+Le QuerySet filtré (recherche, prix et taille) est agrégé une fois par
+(catégorie, en stock, tranche de prix). Les filtres de catégorie et de stock
+sont ensuite appliqués en Python sur ces lignes : la même entrée de cache sert
+donc toutes les combinaisons catégorie/stock d'une recherche.
+
+La facette taille suit le même principe : une requête groupée par (catégorie,
+en stock, taille) sur les variantes en stock, mise en cache à côté des
+facettes.
+"""
+
+import hashlib
+
+from django.core.paginator import Paginator
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    IntegerField,
+    Max,
+    Min,
+    Value,
+    When,
+)
+from django.utils.functional import cached_property
+
+from store.performance_utils import (
+    get_catalog_version,
+    get_inventory_version,
+    get_or_compute,
+)
+from store.search import tokenize
+
+# Bornes des tranches de l'histogramme des prix (en euros)
+PRICE_BUCKET_EDGES = (25, 50, 100, 200)
+
+FACETS_CACHE_TIMEOUT = 60 * 5
+
+
+class FacetPaginator(Paginator):
+    """Paginator dont le nombre total provient des facettes (pas de COUNT)."""
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._facet_count = count
+
+    @cached_property
+    def count(self):
+        return self._facet_count
+
+
+def facets_cache_key(search_query, price_min, price_max, size="", price_below=None):
+    """Clé de cache construite à partir du tuple normalisé des filtres."""
+    # Les lignes dépendent du catalogue et de la disponibilité, pas du stock exact
+    version = "_".join(
+        str(part) for part in get_catalog_version() + get_inventory_version()
+    )
+    # Ordre des mots conservé : la recherche icontains de repli en dépend
+    normalized = (
+        tuple(tokenize(search_query)),
+        price_min,
+        price_max,
+        price_below,
+        size,
+    )
+    digest = hashlib.md5(repr(normalized).encode()).hexdigest()
+    return f"facets_{version}_{digest}"
+
+
+def _bucket_labels():
+    # Tranches [min, max[ : les liens filtrent avec price_below (borne exclue),
+    # comme le regroupement de facet_rows
+    edges = PRICE_BUCKET_EDGES
+    buckets = [{"min": None, "max": edges[0], "label": f"moins de {edges[0]} €"}]
+    for low, high in zip(edges, edges[1:]):
+        buckets.append({"min": low, "max": high, "label": f"{low} € - {high} €"})
+    buckets.append({"min": edges[-1], "max": None, "label": f"{edges[-1]} € et plus"})
+    return buckets
+
+
+def facet_rows(queryset):
+    """
+    Exécute la requête groupée unique.
+
+    Args:
+        queryset: Produits filtrés par recherche, prix et taille (sans
+            catégorie ni stock)
+
+    Returns:
+        list: Lignes {category_id, is_in_stock, facet_bucket, count,
+              min_price, max_price}
+    """
+    bucket = Case(
+        *[
+            When(price__lt=edge, then=Value(index))
+            for index, edge in enumerate(PRICE_BUCKET_EDGES)
+        ],
+        default=Value(len(PRICE_BUCKET_EDGES)),
+        output_field=IntegerField(),
+    )
+    return list(
+        queryset.order_by()
+        .annotate(facet_bucket=bucket)
+        .values("category_id", "is_in_stock", "facet_bucket")
+        .annotate(count=Count("id"), min_price=Min("price"), max_price=Max("price"))
+    )
+
+
+def get_facet_rows_cached(
+    queryset, search_query="", price_min=None, price_max=None, size="", price_below=None
+):
+    """Version mise en cache de facet_rows, clé = filtres normalisés."""
+    cache_key = facets_cache_key(search_query, price_min, price_max, size, price_below)
+    return get_or_compute(cache_key, lambda: facet_rows(queryset), FACETS_CACHE_TIMEOUT)
+
+
+def size_facet_rows(queryset):
+    """
+    Requête groupée de la facette taille.
+
+    Args:
+        queryset: Produits filtrés par recherche et prix (sans taille,
+            catégorie ni stock)
+
+    Returns:
+        list: Lignes {category_id, is_in_stock, size, count}, ``count`` étant
+              le nombre de produits disponibles dans la taille
+    """
+    from store.models import ProductVariant
+
+    return list(
+        ProductVariant.objects.order_by()
+        .filter(stock__gt=0, product__in=queryset.order_by().values("pk"))
+        .values(
+            "size",
+            category_id=F("product__category_id"),
+            is_in_stock=F("product__is_in_stock"),
+        )
+        .annotate(count=Count("product", distinct=True))
+    )
+
+
+def get_size_facet_rows_cached(
+    queryset, search_query="", price_min=None, price_max=None, price_below=None
+):
+    """Version mise en cache de size_facet_rows, clé = filtres normalisés."""
+    cache_key = "size_" + facets_cache_key(
+        search_query, price_min, price_max, price_below=price_below
+    )
+    return get_or_compute(
+        cache_key, lambda: size_facet_rows(queryset), FACETS_CACHE_TIMEOUT
+    )
+
+
+def summarize_size_facets(rows, sizes, category_id=None, stock_filter=""):
+    """
+    Facette taille pour la sélection courante.
+
+    Args:
+        rows: Lignes retournées par size_facet_rows
+        sizes: Tailles dans l'ordre d'affichage
+        category_id: Catégorie sélectionnée (None = toutes)
+        stock_filter: "in", "out" ou ""
+
+    Returns:
+        list: Dicts {"size", "count"} dans l'ordre de ``sizes``
+    """
+    counts = {}
+    for row in rows:
+        if category_id is not None and row["category_id"] != category_id:
+            continue
+        if stock_filter == "in" and not row["is_in_stock"]:
+            continue
+        if stock_filter == "out" and row["is_in_stock"]:
+            continue
+        counts[row["size"]] = counts.get(row["size"], 0) + row["count"]
+    return [{"size": size, "count": counts.get(size, 0)} for size in sizes]
+
+
+def summarize_facets(rows, category_id=None, stock_filter=""):
+    """
+    Dérive les statistiques pour la sélection courante.
+
+    Args:
+        rows: Lignes retournées par facet_rows
+        category_id: Catégorie sélectionnée (None = toutes)
+        stock_filter: "in", "out" ou ""
+
+    Returns:
+        dict: total, in_stock, out_of_stock, price_range, categories, price_buckets
+    """
+
+    def stock_ok(row):
+        if stock_filter == "in":
+            return row["is_in_stock"]
+        if stock_filter == "out":
+            return not row["is_in_stock"]
+        return True
+
+    categories = {}
+    buckets = _bucket_labels()
+    for bucket in buckets:
+        bucket["count"] = 0
+
+    total = in_stock = 0
+    min_price = max_price = None
+
+    for row in rows:
+        if not stock_ok(row):
+            continue
+
+        categories[row["category_id"]] = (
+            categories.get(row["category_id"], 0) + row["count"]
+        )
+
+        if category_id is not None and row["category_id"] != category_id:
+            continue
+
+        total += row["count"]
+        if row["is_in_stock"]:
+            in_stock += row["count"]
+        buckets[row["facet_bucket"]]["count"] += row["count"]
+
+        if min_price is None or row["min_price"] < min_price:
+            min_price = row["min_price"]
+        if max_price is None or row["max_price"] > max_price:
+            max_price = row["max_price"]
+
+    return {
+        "total": total,
+        "in_stock": in_stock,
+        "out_of_stock": total - in_stock,
+        "price_range": {"min_price": min_price, "max_price": max_price},
+        "categories": categories,
+        "price_buckets": buckets,
+    }
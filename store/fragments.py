@@ -0,0 +1,89 @@
+"""
+Cache des fragments HTML (cartes produit, navigation des catégories).
+
+Une page de listing rend les mêmes cartes produit à chaque requête, y
+compris pour les utilisateurs connectés (le cache de pages ne s'applique
+qu'aux anonymes). Chaque carte est rendue une fois puis mise en cache sous
+une clé dérivée de la ligne du produit (``updated_at`` et résumé de stock) :
+toute modification du produit ou de ses variantes change la clé, sans
+invalidation explicite.
+
+Les cartes d'une page sont lues en une seule lecture groupée (``get_many``) ;
+seules les cartes absentes sont rendues puis écrites ensemble
+(``set_many``). Les cartes ne doivent contenir aucune donnée propre au
+visiteur (jeton CSRF, panier).
+"""
+
+import hashlib
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils import translation
+from django.utils.safestring import mark_safe
+
+FRAGMENT_PREFIX = "fragment:"
+
+# Les clés changent avec le produit : longue durée de vie
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+
+def _digest(*parts):
+    raw = "|".join(str(part) for part in parts)
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def product_fragment_key(template_name, product):
+    """Clé d'une carte : change avec le produit, son stock et sa catégorie."""
+    updated_at = product.updated_at.timestamp() if product.updated_at else ""
+    category = product._state.fields_cache.get("category")
+    version = _digest(
+        updated_at,
+        product.total_stock,
+        product.in_stock_variant_count,
+        product.category_id,
+        category.name if category is not None else "",
+        getattr(product, "size_availability", ""),
+    )
+    return (
+        f"{FRAGMENT_PREFIX}{template_name}:{translation.get_language()}:"
+        f"{product.pk}:{version}"
+    )
+
+
+def render_product_fragments(template_name, products):
+    """
+    Cartes HTML des produits : une lecture groupée, rendu des seules absentes.
+
+    Args:
+        template_name: Template de la carte (contexte : ``product``)
+        products: Produits de la page
+
+    Returns:
+        dict: {id du produit: HTML de la carte}
+    """
+    products = list(products)
+    keys = {product_fragment_key(template_name, product): product for product in products}
+    found = cache.get_many(list(keys)) if keys else {}
+
+    missing = {
+        key: render_to_string(template_name, {"product": product})
+        for key, product in keys.items()
+        if key not in found
+    }
+    if missing:
+        cache.set_many(missing, FRAGMENT_TIMEOUT)
+
+    return {
+        product.pk: mark_safe(found[key] if key in found else missing[key])
+        for key, product in keys.items()
+    }
+
+
+def fragment_key(name, vary_on=(), tags=()):
+    """Clé d'un fragment nommé, validée par les versions d'étiquettes."""
+    from store.cache_tags import tag_stamp
+
+    return (
+        f"{FRAGMENT_PREFIX}{name}:{translation.get_language()}:"
+        f"{_digest(tag_stamp(tags), *vary_on)}"
+    )
@@ -0,0 +1,256 @@
+"""
+Diffusion des invalidations entre workers et serveurs.
+
+Les données gardées en mémoire par un worker (cache local, index du
+catalogue, suggestions...) deviennent périmées quand un autre worker ou un
+autre serveur modifie le catalogue. Chaque invalidation d'étiquettes
+(store.cache_tags, après le commit) est donc publiée sur un canal ; chaque
+worker y est abonné par un thread qui retire les entrées locales concernées.
+
+Deux implémentations :
+
+- ``PostgresBus`` : LISTEN/NOTIFY de PostgreSQL, livraison immédiate ;
+- ``FileBus`` : journal append-only sur disque lu toutes les
+  ``INVALIDATION_BUS_POLL_SECONDS`` (développement, SQLite, un seul serveur).
+
+``INVALIDATION_BUS`` choisit l'implémentation (``auto``, ``postgres``,
+``file`` ou ``off``). Un abonné qui a pu manquer des messages (reconnexion,
+journal tronqué) vide tout son état local : le retard reste borné.
+"""
+
+import json
+import logging
+import os
+import select
+import tempfile
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "shop_invalidation"
+
+# Taille maximale d'un NOTIFY PostgreSQL (8000 octets) avec une marge
+MAX_PAYLOAD_BYTES = 7000
+
+# Au-delà, le journal FileBus est tronqué (les abonnés vident leur état)
+MAX_LOG_BYTES = 1024 * 1024
+
+# Identifiant du worker : ses propres messages sont ignorés
+ORIGIN = uuid.uuid4().hex
+
+_lock = threading.Lock()
+_bus = None
+_subscribed_pid = None
+
+
+def poll_seconds():
+    return getattr(settings, "INVALIDATION_BUS_POLL_SECONDS", 1.0)
+
+
+def encode_messages(tags):
+    """Découpe les étiquettes en messages JSON sous MAX_PAYLOAD_BYTES."""
+    messages, batch = [], []
+    for tag in sorted(set(tags)):
+        candidate = json.dumps({"origin": ORIGIN, "tags": batch + [tag]})
+        if batch and len(candidate.encode()) > MAX_PAYLOAD_BYTES:
+            messages.append(json.dumps({"origin": ORIGIN, "tags": batch}))
+            batch = []
+        batch.append(tag)
+    if batch:
+        messages.append(json.dumps({"origin": ORIGIN, "tags": batch}))
+    return messages
+
+
+def apply_message(payload):
+    """
+    Applique un message reçu : retire les entrées locales étiquetées.
+
+    Returns:
+        bool: True si le message venait d'un autre worker
+    """
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        logger.warning("Message d'invalidation illisible: %r", payload[:200])
+        return False
+    if message.get("origin") == ORIGIN:
+        return False
+
+    drop_local_state(message.get("tags", []))
+    return True
+
+
+def drop_local_state(tags=None):
+    """
+    Retire l'état local du worker lié aux étiquettes (tout si tags vaut None).
+    """
+    from store.near_cache import discard_all, discard_tags
+    from store.performance_utils import (
+        bump_local_catalog_version,
+        bump_local_inventory_version,
+    )
+
+    if tags is None:
+        discard_all()
+        bump_local_catalog_version()
+        bump_local_inventory_version()
+        return
+
+    discard_tags(tags)
+    if "catalog" in tags:
+        bump_local_catalog_version()
+    if "inventory" in tags:
+        bump_local_inventory_version()
+
+
+class PostgresBus:
+    """Canal LISTEN/NOTIFY sur la base PostgreSQL principale."""
+
+    def publish(self, tags):
+        with connection.cursor() as cursor:
+            for payload in encode_messages(tags):
+                cursor.execute(
+                    "SELECT pg_notify(%s, %s)", [INVALIDATION_CHANNEL, payload]
+                )
+
+    def listen(self, handler):
+        """Boucle d'écoute (thread dédié, connexion dédiée)."""
+        while True:
+            try:
+                raw = connection.get_new_connection(connection.get_connection_params())
+                raw.autocommit = True
+                with raw.cursor() as cursor:
+                    cursor.execute(f"LISTEN {INVALIDATION_CHANNEL}")
+                # Messages perdus pendant la (re)connexion
+                drop_local_state()
+
+                while True:
+                    if select.select([raw], [], [], poll_seconds()) == ([], [], []):
+                        continue
+                    raw.poll()
+                    while raw.notifies:
+                        handler(raw.notifies.pop(0).payload)
+            except Exception as e:
+                logger.error("Écoute des invalidations interrompue: %s", e)
+                time.sleep(poll_seconds() * 5)
+
+
+class FileBus:
+    """Journal d'invalidations partagé sur disque, lu par scrutation."""
+
+    def __init__(self, path=None):
+        self.path = path or getattr(
+            settings,
+            "INVALIDATION_BUS_FILE",
+            os.path.join(tempfile.gettempdir(), "shop_invalidations.log"),
+        )
+        self.offset = self._size()
+
+    def _size(self):
+        try:
+            return os.stat(self.path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def publish(self, tags):
+        if self._size() > MAX_LOG_BYTES:
+            with open(self.path, "w"):
+                pass
+        data = "".join(f"{payload}\n" for payload in encode_messages(tags))
+        # O_APPEND : écritures courtes atomiques entre processus
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data.encode())
+        finally:
+            os.close(fd)
+
+    def poll(self):
+        """
+        Lit les messages publiés depuis la dernière lecture.
+
+        Returns:
+            list: Messages (JSON), ou None si le journal a été tronqué
+        """
+        size = self._size()
+        if size < self.offset:
+            self.offset = 0
+            return None
+        if size == self.offset:
+            return []
+
+        with open(self.path, "rb") as log:
+            log.seek(self.offset)
+            data = log.read(size - self.offset)
+        # Une ligne incomplète sera relue au passage suivant
+        complete = data.rfind(b"\n") + 1
+        self.offset += complete
+        return data[:complete].decode().splitlines()
+
+    def listen(self, handler):
+        while True:
+            time.sleep(poll_seconds())
+            try:
+                payloads = self.poll()
+                if payloads is None:
+                    drop_local_state()
+                    continue
+                for payload in payloads:
+                    handler(payload)
+            except Exception as e:
+                logger.error("Lecture du journal d'invalidations: %s", e)
+
+
+def get_bus():
+    """Canal configuré (None si INVALIDATION_BUS=off)."""
+    global _bus
+
+    if _bus is None:
+        kind = getattr(settings, "INVALIDATION_BUS", "auto")
+        if kind == "auto":
+            kind = "postgres" if connection.vendor == "postgresql" else "file"
+        if kind == "postgres":
+            _bus = PostgresBus()
+        elif kind == "file":
+            _bus = FileBus()
+        else:
+            return None
+    return _bus
+
+
+def publish(tags):
+    """Publie des étiquettes invalidées pour les autres workers."""
+    tags = set(tags)
+    bus = get_bus()
+    if bus is None or not tags:
+        return
+    try:
+        bus.publish(tags)
+    except Exception as e:
+        logger.error("Publication des invalidations impossible: %s", e)
+
+
+def ensure_subscribed():
+    """Démarre le thread d'écoute du worker (une fois par processus)."""
+    global _subscribed_pid
+
+    pid = os.getpid()
+    if _subscribed_pid == pid:
+        return
+    with _lock:
+        if _subscribed_pid == pid:
+            return
+        _subscribed_pid = pid
+        bus = get_bus()
+        if bus is None:
+            return
+        threading.Thread(
+            target=bus.listen,
+            args=(apply_message,),
+            name="invalidation-bus",
+            daemon=True,
+        ).start()
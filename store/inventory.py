@@ -0,0 +1,658 @@
+"""
+Décrément atomique du stock des variantes.
+
+``Product.reduce_stock`` lisait la variante, comparait le stock en Python
+puis sauvegardait : deux paiements simultanés lisaient le même stock et le
+produit était survendu. Ici chaque ligne est un UPDATE conditionnel ::
+
+    UPDATE store_productvariant SET stock = stock - n WHERE id = v AND stock >= n
+
+La base arbitre les accès concurrents : une ligne réussit si et seulement si
+l'UPDATE a modifié une ligne. Les lignes d'un panier sont traitées dans
+l'ordre des identifiants de variante, pour que deux paniers prennent leurs
+verrous dans le même ordre (pas d'interblocage).
+
+Les UPDATE ne déclenchent pas les signaux de ProductVariant : le résumé de
+stock des produits, les étiquettes de cache et la version du catalogue sont
+mis à jour une seule fois pour tout le lot.
+
+Réservations : à la création du PaymentIntent, le panier est retenu pendant
+``STOCK_RESERVATION_TTL`` secondes (StockReservation). Le stock disponible
+d'une variante est son stock moins les réservations actives des autres
+paiements et acheteurs ; le décrément de confirmation le respecte et supprime
+les réservations du paiement confirmé et de son acheteur. Les réservations expirées ne comptent
+plus et sont supprimées par lots (commande ``release_expired_reservations``).
+
+Journal : chaque variation de stock est un InventoryMovement (vente,
+annulation, import, ajustement manuel) ; ``ProductVariant.stock`` en est la
+projection, lue en O(1). ``compact_ledger`` (commande
+``compact_inventory_ledger``) replie périodiquement les anciens mouvements
+dans des InventorySnapshot : recalculer le stock depuis le journal
+(``ledger_stock``, ``reconcile``) ne lit que le dernier instantané et les
+mouvements suivants.
+"""
+
+import logging
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Suppression des réservations expirées par lots de N lignes
+SWEEP_BATCH_SIZE = 1000
+
+# Ligne à décrémenter (Order convient aussi : product_id, size, quantity)
+StockLine = namedtuple("StockLine", "product_id size quantity")
+
+# Résultat par ligne, dans l'ordre des lignes reçues
+StockResult = namedtuple("StockResult", "line variant_id ok")
+
+# Validation d'une ligne de panier (voir validate_cart_lines)
+LineAvailability = namedtuple(
+    "LineAvailability", "line variant_id available max_quantity price"
+)
+
+
+class InsufficientStockError(Exception):
+    """Lignes d'un panier payé qui n'ont plus assez de stock."""
+
+    def __init__(self, lines):
+        self.lines = list(lines)
+        super().__init__(f"Stock insuffisant pour {len(self.lines)} ligne(s)")
+
+
+def _resolve_variants(lines):
+    """
+    Variante visée par chaque ligne, en une requête.
+
+    Une ligne sans taille prend la première variante ayant assez de stock
+    (à défaut la première en stock), comme get_variant_by_size.
+
+    Returns:
+        list: Identifiant de variante (ou None) par ligne
+    """
+    from store.models import ProductVariant
+
+    product_ids = {line.product_id for line in lines}
+    variants = list(
+        ProductVariant.objects.filter(product_id__in=product_ids)
+        .order_by("pk")
+        .values_list("pk", "product_id", "size", "stock")
+    )
+    by_size = {(product_id, size): pk for pk, product_id, size, _ in variants}
+
+    resolved = []
+    for line in lines:
+        if line.size:
+            resolved.append(by_size.get((line.product_id, line.size)))
+            continue
+        in_stock = [
+            (pk, stock)
+            for pk, product_id, _, stock in variants
+            if product_id == line.product_id and stock > 0
+        ]
+        enough = [pk for pk, stock in in_stock if stock >= line.quantity]
+        resolved.append(enough[0] if enough else (in_stock[0][0] if in_stock else None))
+    return resolved
+
+
+def _held_quantity(reference=None, variant="pk", user=None):
+    """Quantité réservée par les autres paiements et acheteurs, pour OuterRef(variant)."""
+    from store.models import StockReservation
+
+    holds = StockReservation.objects.filter(
+        variant=OuterRef(variant), expires_at__gt=timezone.now()
+    )
+    if reference:
+        holds = holds.exclude(reference=reference)
+    if getattr(user, "pk", None) is not None:
+        # Les réservations de l'acheteur lui-même restent disponibles
+        holds = holds.exclude(user_id=user.pk)
+    return Coalesce(
+        Subquery(
+            holds.order_by()
+            .values("variant")
+            .annotate(total=Sum("quantity"))
+            .values("total")
+        ),
+        0,
+    )
+
+
+def available_stock(variant_ids, reference=None, user=None):
+    """
+    Stock disponible des variantes : stock moins les réservations actives.
+
+    Args:
+        variant_ids: Variantes à lire
+        reference: Paiement dont les propres réservations restent disponibles
+        user: Acheteur dont les propres réservations restent disponibles
+
+    Returns:
+        dict: {id de variante: quantité disponible (>= 0)}
+    """
+    from store.models import ProductVariant
+
+    rows = (
+        ProductVariant.objects.filter(pk__in=variant_ids)
+        .annotate(held=_held_quantity(reference, user=user))
+        .values_list("pk", "stock", "held")
+    )
+    return {pk: max(stock - held, 0) for pk, stock, held in rows}
+
+
+def validate_cart_lines(lines, reference=None, user=None):
+    """
+    Disponibilité, quantité maximale et prix de plusieurs lignes, en une requête.
+
+    Le stock disponible tient compte des réservations des autres paiements
+    et des autres acheteurs.
+    Les lignes visant la même variante se partagent son stock, dans l'ordre
+    reçu. Une ligne sans taille vise la variante la plus disponible.
+
+    Args:
+        lines: Objets portant product_id, size et quantity (Order, StockLine)
+        reference: Paiement dont les propres réservations restent disponibles
+        user: Acheteur dont les propres réservations restent disponibles
+
+    Returns:
+        list[LineAvailability]: Un résultat par ligne, dans l'ordre reçu ;
+            ``price`` (prix unitaire de la variante, à défaut du produit) est
+            None si le produit n'existe plus
+    """
+    from store.models import Product
+
+    lines = list(lines)
+    rows = (
+        Product.objects.filter(pk__in={line.product_id for line in lines})
+        .values_list(
+            "pk",
+            "price",
+            "variants__pk",
+            "variants__size",
+            "variants__stock",
+            "variants__price",
+        )
+        .annotate(held=_held_quantity(reference, variant="variants__pk", user=user))
+        .order_by("pk", "variants__pk")
+    )
+
+    prices, variants, remaining = {}, {}, {}
+    for product_id, price, variant_id, size, stock, variant_price, held in rows:
+        prices[product_id] = price
+        if variant_id is not None:
+            variants.setdefault(product_id, []).append(
+                (variant_id, size, variant_price)
+            )
+            remaining[variant_id] = max(stock - held, 0)
+
+    results = []
+    for line in lines:
+        candidates = variants.get(line.product_id, [])
+        if line.size:
+            candidates = [variant for variant in candidates if variant[1] == line.size]
+        else:
+            candidates = sorted(candidates, key=lambda variant: -remaining[variant[0]])
+
+        if not candidates:
+            results.append(
+                LineAvailability(line, None, False, 0, prices.get(line.product_id))
+            )
+            continue
+
+        variant_id, _, variant_price = candidates[0]
+        max_quantity = remaining[variant_id]
+        available = 0 < line.quantity <= max_quantity
+        if available:
+            remaining[variant_id] -= line.quantity
+        results.append(
+            LineAvailability(
+                line,
+                variant_id,
+                available,
+                max_quantity,
+                variant_price or prices[line.product_id],
+            )
+        )
+    return results
+
+
+def decrement_stock(lines, reference=None, user=None):
+    """
+    Décrémente le stock de plusieurs lignes (panier) de façon atomique.
+
+    Le stock réservé par d'autres paiements n'est pas vendu ; les
+    réservations de ``reference`` et de ``user`` sont consommées.
+
+    Args:
+        lines: Objets portant product_id, size et quantity (Order, StockLine)
+        reference: Paiement confirmé (ses réservations sont supprimées)
+        user: Acheteur (ses réservations sont supprimées)
+
+    Returns:
+        list[StockResult]: Un résultat par ligne ; ``ok`` est faux si la
+            variante n'existe pas ou n'a plus assez de stock
+    """
+    from store.models import InventoryMovement, Order, ProductVariant
+
+    lines = list(lines)
+    if not lines:
+        return []
+
+    results = [None] * len(lines)
+    with transaction.atomic():
+        variant_ids = _resolve_variants(lines)
+
+        # Verrous pris dans l'ordre des variantes
+        order = sorted(range(len(lines)), key=lambda i: (variant_ids[i] or 0, i))
+        for index in order:
+            line, variant_id = lines[index], variant_ids[index]
+            ok = (
+                variant_id is not None
+                and line.quantity > 0
+                and ProductVariant.objects.filter(
+                    pk=variant_id,
+                    stock__gte=_held_quantity(reference, user=user) + line.quantity,
+                ).update(stock=F("stock") - line.quantity)
+                == 1
+            )
+            results[index] = StockResult(line, variant_id, ok)
+
+        if reference or getattr(user, "pk", None) is not None:
+            release_reservations(reference, user=user)
+
+        sold = [result for result in results if result.ok]
+        if sold:
+            InventoryMovement.objects.bulk_create(
+                InventoryMovement(
+                    variant_id=result.variant_id,
+                    quantity=-result.line.quantity,
+                    reason=InventoryMovement.SALE,
+                    order=result.line if isinstance(result.line, Order) else None,
+                    note=_order_note(result.line),
+                )
+                for result in sold
+            )
+            deltas = {}
+            for result in sold:
+                deltas[result.variant_id] = (
+                    deltas.get(result.variant_id, 0) - result.line.quantity
+                )
+            _stock_changed(deltas)
+
+    return results
+
+
+def record_movements(movements):
+    """
+    Applique et journalise des mouvements de stock (import, annulation,
+    ajustement) : un UPDATE par variante, un INSERT pour tout le lot.
+
+    Args:
+        movements: Instances InventoryMovement non sauvegardées
+
+    Returns:
+        list: Les mouvements enregistrés
+    """
+    from store.models import InventoryMovement, ProductVariant
+
+    movements = [movement for movement in movements if movement.quantity]
+    if not movements:
+        return []
+
+    deltas = {}
+    for movement in movements:
+        deltas[movement.variant_id] = (
+            deltas.get(movement.variant_id, 0) + movement.quantity
+        )
+
+    with transaction.atomic():
+        # Verrous pris dans l'ordre des variantes
+        for variant_id in sorted(deltas):
+            ProductVariant.objects.filter(pk=variant_id).update(
+                stock=F("stock") + deltas[variant_id]
+            )
+        InventoryMovement.objects.bulk_create(movements)
+        _stock_changed(deltas)
+
+    return movements
+
+
+def _order_note(line):
+    """Référence de la commande recopiée dans le mouvement : la clé étrangère
+    devient NULL si la commande est supprimée (annulation)."""
+    from store.models import Order
+
+    return f"Commande #{line.pk}" if isinstance(line, Order) else ""
+
+
+def ledger_started_at():
+    """
+    Début du journal : soldes d'ouverture (migration) ou premier mouvement.
+
+    Returns:
+        datetime | None: None si le journal est vide
+    """
+    from store.models import InventoryMovement, InventorySnapshot
+
+    starts = [
+        InventorySnapshot.objects.aggregate(start=Min("taken_at"))["start"],
+        InventoryMovement.objects.aggregate(start=Min("created_at"))["start"],
+    ]
+    starts = [start for start in starts if start is not None]
+    return min(starts) if starts else None
+
+
+def restock_order(order, user=None, note=""):
+    """
+    Remet en stock une commande annulée (mouvements ``cancellation``).
+
+    Les variantes sont celles des ventes journalisées de la commande. Une
+    commande sans vente journalisée n'est remise en stock (variante de sa
+    taille) que si elle est antérieure au journal ; sinon son stock n'a
+    jamais été décrémenté et rien n'est remis.
+
+    Returns:
+        list: Les mouvements enregistrés
+    """
+    from store.models import InventoryMovement
+
+    # Journal en ajout seul : les ventes sont retrouvées par leur commande
+    sales = list(
+        InventoryMovement.objects.filter(
+            order=order, reason=InventoryMovement.SALE
+        ).values_list("variant_id", "quantity")
+    )
+
+    if not sales:
+        started_at = ledger_started_at()
+        if (
+            started_at is None
+            or order.date_ordered is None
+            or order.date_ordered >= started_at
+        ):
+            logger.warning(
+                "Commande %s sans vente journalisée : aucune remise en stock",
+                order.pk,
+            )
+            return []
+        (variant_id,) = _resolve_variants([order])
+        sales = [(variant_id, -order.quantity)] if variant_id else []
+
+    return record_movements(
+        InventoryMovement(
+            variant_id=variant_id,
+            quantity=-quantity,
+            reason=InventoryMovement.CANCELLATION,
+            order=order,
+            user=user,
+            note=note,
+        )
+        for variant_id, quantity in sales
+    )
+
+
+def _stock_changed(deltas):
+    """
+    Effets des signaux de ProductVariant, une fois pour le lot : résumé de
+    stock des produits, étiquettes de cache, et version de l'inventaire si
+    une variante passe en rupture ou revient en stock.
+
+    Args:
+        deltas: {id de variante: variation de stock appliquée}
+    """
+    from store.cache_tags import instance_tags, invalidate_tags
+    from store.models import Product, ProductVariant
+    from store.performance_utils import bump_inventory_version
+
+    rows = ProductVariant.objects.filter(pk__in=deltas).values_list(
+        "pk", "product_id", "stock"
+    )
+    product_ids, flipped = set(), False
+    for variant_id, product_id, stock in rows:
+        product_ids.add(product_id)
+        flipped |= (stock > 0) != (stock - deltas[variant_id] > 0)
+
+    Product.refresh_stock_summary(product_ids)
+
+    tags = []
+    for product_id in product_ids:
+        tags.extend(instance_tags("product", product_id))
+    if flipped:
+        tags.append("inventory")
+        bump_inventory_version()
+    invalidate_tags(*tags)
+
+
+def reserve_stock(lines, reference, user=None, ttl=None):
+    """
+    Retient le stock d'un panier pendant le paiement.
+
+    Les réservations précédentes de ``reference`` (et de ``user`` : un
+    nouveau PaymentIntent pour le même panier) sont remplacées. Les
+    variantes sont verrouillées dans l'ordre des identifiants le temps du
+    calcul, pour que deux paniers ne retiennent pas la même unité.
+
+    Args:
+        lines: Objets portant product_id, size et quantity (Order, StockLine)
+        reference: Identifiant du paiement (PaymentIntent)
+        user: Acheteur (optionnel)
+        ttl: Durée de la réservation en secondes (défaut :
+            settings.STOCK_RESERVATION_TTL)
+
+    Returns:
+        list[StockResult]: Un résultat par ligne ; seules les lignes ``ok``
+            sont réservées
+    """
+    from store.models import Order, ProductVariant, StockReservation
+
+    lines = list(lines)
+    if ttl is None:
+        ttl = getattr(settings, "STOCK_RESERVATION_TTL", 15 * 60)
+    expires_at = timezone.now() + timedelta(seconds=ttl)
+
+    with transaction.atomic():
+        release_reservations(reference, user=user)
+        variant_ids = _resolve_variants(lines)
+
+        ids = sorted({pk for pk in variant_ids if pk is not None})
+        list(
+            ProductVariant.objects.select_for_update().filter(pk__in=ids).order_by("pk")
+        )
+        available = available_stock(ids)
+
+        results, reservations = [], []
+        for line, variant_id in zip(lines, variant_ids):
+            ok = (
+                variant_id is not None
+                and line.quantity > 0
+                and available.get(variant_id, 0) >= line.quantity
+            )
+            if ok:
+                available[variant_id] -= line.quantity
+                reservations.append(
+                    StockReservation(
+                        variant_id=variant_id,
+                        order=line if isinstance(line, Order) else None,
+                        user=user,
+                        quantity=line.quantity,
+                        reference=reference,
+                        expires_at=expires_at,
+                    )
+                )
+            results.append(StockResult(line, variant_id, ok))
+
+        StockReservation.objects.bulk_create(reservations)
+
+    return results
+
+
+def release_reservations(reference=None, user=None):
+    """
+    Libère les réservations d'un paiement et/ou d'un acheteur.
+
+    Returns:
+        int: Nombre de réservations supprimées
+    """
+    from store.models import StockReservation
+
+    condition = Q(pk__in=[])
+    if reference:
+        condition |= Q(reference=reference)
+    if user is not None:
+        condition |= Q(user=user)
+    deleted, _ = StockReservation.objects.filter(condition).delete()
+    return deleted
+
+
+def release_expired_reservations(batch_size=SWEEP_BATCH_SIZE):
+    """
+    Supprime les réservations expirées, par lots de ``batch_size`` lignes.
+
+    Returns:
+        int: Nombre de réservations supprimées
+    """
+    from store.models import StockReservation
+
+    now = timezone.now()
+    total = 0
+    while True:
+        ids = list(
+            StockReservation.objects.filter(expires_at__lte=now).values_list(
+                "pk", flat=True
+            )[:batch_size]
+        )
+        if not ids:
+            return total
+        deleted, _ = StockReservation.objects.filter(pk__in=ids).delete()
+        total += deleted
+
+
+def _latest_snapshots(variant_ids=None):
+    """{id de variante: (stock, last_movement_id)} du dernier instantané."""
+    from store.models import InventorySnapshot
+
+    snapshots = InventorySnapshot.objects.order_by("last_movement_id")
+    if variant_ids is not None:
+        snapshots = snapshots.filter(variant_id__in=variant_ids)
+    # Trié par mouvement : le dernier instantané de chaque variante l'emporte
+    return {
+        variant_id: (stock, last_id)
+        for variant_id, stock, last_id in snapshots.values_list(
+            "variant_id", "stock", "last_movement_id"
+        )
+    }
+
+
+def _compacted_until():
+    """Dernier mouvement replié dans les instantanés (0 si aucun)."""
+    from store.models import InventorySnapshot
+
+    return (
+        InventorySnapshot.objects.aggregate(last=Max("last_movement_id"))["last"] or 0
+    )
+
+
+def ledger_stock(variant_ids=None):
+    """
+    Stock recalculé depuis le journal : dernier instantané + mouvements
+    suivants (peu nombreux après compaction).
+
+    Returns:
+        dict: {id de variante: stock selon le journal}
+    """
+    from store.models import InventoryMovement
+
+    balances = {
+        variant_id: stock
+        for variant_id, (stock, _) in _latest_snapshots(variant_ids).items()
+    }
+    movements = InventoryMovement.objects.filter(id__gt=_compacted_until())
+    if variant_ids is not None:
+        movements = movements.filter(variant_id__in=variant_ids)
+    for variant_id, total in (
+        movements.order_by()
+        .values("variant_id")
+        .annotate(total=Sum("quantity"))
+        .values_list("variant_id", "total")
+    ):
+        balances[variant_id] = balances.get(variant_id, 0) + total
+    return balances
+
+
+def reconcile(variant_ids=None):
+    """
+    Variantes dont le stock (projection) diffère du journal.
+
+    Returns:
+        dict: {id de variante: (stock de la variante, stock selon le journal)}
+    """
+    from store.models import ProductVariant
+
+    balances = ledger_stock(variant_ids)
+    variants = ProductVariant.objects.all()
+    if variant_ids is not None:
+        variants = variants.filter(pk__in=variant_ids)
+    return {
+        variant_id: (stock, balances.get(variant_id, 0))
+        for variant_id, stock in variants.values_list("pk", "stock")
+        if stock != balances.get(variant_id, 0)
+    }
+
+
+def compact_ledger(before, prune_before=None):
+    """
+    Replie les mouvements antérieurs à ``before`` dans des instantanés.
+
+    Chaque variante ayant bougé reçoit un instantané (stock après le dernier
+    mouvement replié). Les mouvements restent consultables ; ceux antérieurs
+    à ``prune_before`` et déjà repliés sont supprimés.
+
+    Returns:
+        tuple: (instantanés créés, mouvements supprimés)
+    """
+    from store.models import InventoryMovement, InventorySnapshot
+
+    with transaction.atomic():
+        start = _compacted_until()
+        boundary = InventoryMovement.objects.filter(
+            id__gt=start, created_at__lt=before
+        ).aggregate(last=Max("id"))["last"]
+
+        created = 0
+        if boundary is not None:
+            totals = list(
+                InventoryMovement.objects.filter(id__gt=start, id__lte=boundary)
+                .order_by()
+                .values("variant_id")
+                .annotate(total=Sum("quantity"), count=Count("id"))
+                .values_list("variant_id", "total", "count")
+            )
+            previous = _latest_snapshots([variant_id for variant_id, _, _ in totals])
+            snapshots = InventorySnapshot.objects.bulk_create(
+                (
+                    InventorySnapshot(
+                        variant_id=variant_id,
+                        stock=previous.get(variant_id, (0, 0))[0] + total,
+                        last_movement_id=boundary,
+                        movement_count=count,
+                    )
+                    for variant_id, total, count in totals
+                ),
+                batch_size=SWEEP_BATCH_SIZE,
+            )
+            created = len(snapshots)
+
+        pruned = 0
+        if prune_before is not None:
+            pruned, _ = InventoryMovement.objects.filter(
+                id__lte=_compacted_until(), created_at__lt=prune_before
+            ).delete()
+
+    return created, pruned
@@ -0,0 +1,76 @@
+import pickle
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from store import cache_codec
+from store.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare la taille et le temps de relecture des valeurs de l'accueil "
+        "entre le pickle du cache et store.cache_codec"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=200,
+            help="Nombre de relectures mesurées par valeur (défaut : 200)",
+        )
+
+    def payloads(self):
+        """Valeurs de même forme que celles mises en cache par l'accueil."""
+        hero_products = list(
+            Product.objects.select_related("category")
+            .filter(category__is_active=True)
+            .order_by("-popularity_score", "-rating", "-created_at")[:20]
+        )
+        products_by_category = {
+            category.slug: list(
+                Product.objects.select_related("category")
+                .filter(category=category)
+                .order_by("-created_at")[:5]
+            )
+            for category in Category.objects.filter(is_active=True)[:6]
+        }
+        featured_products = list(
+            Product.objects.only("id", "name", "slug", "price", "thumbnail")
+            .filter(is_in_stock=True)
+            .order_by("-created_at")[:10]
+        )
+        return {
+            "hero_products": hero_products,
+            "products_by_category": products_by_category,
+            "featured_products": featured_products,
+        }
+
+    def handle(self, *args, **options):
+        repeat = max(options["repeat"], 1)
+
+        header = (
+            f"{'valeur':<22}{'pickle (o)':>12}{'codec (o)':>12}"
+            f"{'pickle (µs)':>14}{'codec (µs)':>13}"
+        )
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+
+        for name, value in self.payloads().items():
+            pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            encoded = cache_codec.dumps(value)
+
+            pickle_time = timeit.timeit(lambda: pickle.loads(pickled), number=repeat)
+            codec_time = timeit.timeit(
+                lambda: cache_codec.loads(encoded), number=repeat
+            )
+
+            self.stdout.write(
+                f"{name:<22}{len(pickled):>12}{len(encoded):>12}"
+                f"{pickle_time / repeat * 1e6:>14.1f}{codec_time / repeat * 1e6:>13.1f}"
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(f"✅ Mesures sur {repeat} relecture(s) par valeur")
+        )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from store.recommendations import build_copurchases
+
+
+class Command(BaseCommand):
+    help = (
+        "Compte les produits achetés ensemble (paniers par utilisateur et par jour) "
+        "et met à jour les recommandations ; à lancer chaque jour"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Tout recalculer depuis le premier achat",
+        )
+
+    def handle(self, *args, **options):
+        run = build_copurchases(full=options["full"])
+
+        if run is None:
+            self.stdout.write("Aucun nouveau jour d'achats à traiter")
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ {run.baskets} panier(s) analysé(s), {run.pairs} paire(s) mise(s) "
+                f"à jour jusqu'au {run.processed_through:%d/%m/%Y}"
+            )
+        )
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from store.similarity import rebuild_similar_products, refresh_similar_products
+
+
+class Command(BaseCommand):
+    help = "Précalcule la table des produits similaires (catégorie, prix, nom)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--product",
+            type=int,
+            action="append",
+            dest="product_ids",
+            help="Recalcul incrémental autour d'un produit (option répétable)",
+        )
+
+    def handle(self, *args, **options):
+        product_ids = options.get("product_ids")
+
+        if product_ids:
+            written = refresh_similar_products(product_ids)
+        else:
+            written = rebuild_similar_products()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"✅ {written} lien(s) de produits similaires enregistré(s)")
+        )
@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from store.inventory import compact_ledger, reconcile
+
+
+class Command(BaseCommand):
+    help = (
+        "Replie les anciens mouvements de stock dans des instantanés et signale "
+        "les variantes dont le stock diffère du journal (ex. chaque nuit)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=7,
+            help="Replier les mouvements de plus de N jours (défaut : 7)",
+        )
+        parser.add_argument(
+            "--prune-days",
+            type=int,
+            default=None,
+            help="Supprimer les mouvements repliés de plus de N jours "
+            "(défaut : conservés)",
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        prune_days = options["prune_days"]
+        created, pruned = compact_ledger(
+            now - timedelta(days=options["days"]),
+            prune_before=now - timedelta(days=prune_days) if prune_days else None,
+        )
+
+        for variant_id, (stock, ledger) in reconcile().items():
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Variante {variant_id} : stock {stock}, journal {ledger}"
+                )
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ {created} instantané(s) créé(s), {pruned} mouvement(s) supprimé(s)"
+            )
+        )
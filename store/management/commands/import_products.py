@@ -1,5 +1,7 @@
 from django.core.management.base import BaseCommand
-from store.models import Product, Category, ProductVariant
+from store.models import Product, Category, ProductVariant, InventoryMovement
+from store.cache_tags import instance_tags, invalidate_tags
+from store.performance_utils import bump_inventory_version
 from django.utils.text import slugify
 import os
 import random
@@ -100,6 +102,25 @@ class Command(BaseCommand):
                 variants.append(ProductVariant(product=product, size=size, stock=stock, price=product.price))
         if variants:
             ProductVariant.objects.bulk_create(variants)
+            # bulk_create ne déclenche pas les signaux : stock initial journalisé ici.
+            # Variantes relues : sous MySQL, bulk_create ne renseigne pas les clés
+            InventoryMovement.objects.bulk_create(
+                InventoryMovement(
+                    variant_id=variant_id,
+                    quantity=stock,
+                    reason=InventoryMovement.IMPORT,
+                    note="import_products",
+                )
+                for variant_id, stock in product.variants.filter(
+                    size__in=[variant.size for variant in variants]
+                ).values_list("pk", "stock")
+                if stock
+            )
+            # ... ni le résumé de stock du produit, ni la version de l'inventaire
+            # (nouvelles tailles) : mis à jour ici, une fois pour le produit
+            Product.refresh_stock_summary([product.pk])
+            invalidate_tags(*instance_tags("product", product.pk), "inventory")
+            bump_inventory_version()
 
     def add_variants_to_existing_products(self):
         """Ajoute les variantes XS, S, M, L, XL (stock 30) à tous les produits sauf chaussures et accessoires.
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from store.search import backend, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche plein texte des produits"
+
+    def handle(self, *args, **options):
+        engine = backend()
+        if engine is None:
+            self.stdout.write(
+                self.style.WARNING(
+                    "⚠️  Moteur de base de données sans index plein texte, "
+                    "la recherche utilise icontains"
+                )
+            )
+            return
+
+        count = rebuild_index()
+        self.stdout.write(
+            self.style.SUCCESS(f"✅ {count} produit(s) indexé(s) ({engine})")
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from store.inventory import SWEEP_BATCH_SIZE, release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = (
+        "Supprime les réservations de stock expirées (paiements abandonnés) "
+        "par lots (à lancer périodiquement, ex. toutes les 5 minutes)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=SWEEP_BATCH_SIZE,
+            help=f"Réservations supprimées par requête (défaut : {SWEEP_BATCH_SIZE})",
+        )
+
+    def handle(self, *args, **options):
+        released = release_expired_reservations(max(options["batch_size"], 1))
+
+        self.stdout.write(
+            self.style.SUCCESS(f"✅ {released} réservation(s) expirée(s) supprimée(s)")
+        )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.models import Product
+
+
+class Command(BaseCommand):
+    help = "Recalcule en masse le résumé de stock des produits depuis leurs variantes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--product",
+            type=int,
+            action="append",
+            dest="product_ids",
+            help="Limiter à un produit (option répétable)",
+        )
+
+    def handle(self, *args, **options):
+        product_ids = options.get("product_ids")
+
+        with transaction.atomic():
+            updated = Product.refresh_stock_summary(product_ids)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"✅ Résumé de stock recalculé pour {updated} produit(s)")
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from store.popularity import POPULARITY_HALF_LIFE_HOURS, fold_popularity
+
+
+class Command(BaseCommand):
+    help = (
+        "Replie les ventes et consultations récentes dans le score de popularité "
+        "des produits (à lancer périodiquement, ex. toutes les heures)"
+    )
+
+    def handle(self, *args, **options):
+        updated = fold_popularity()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Popularité mise à jour pour {updated} produit(s) "
+                f"(demi-vie {POPULARITY_HALF_LIFE_HOURS} h)"
+            )
+        )
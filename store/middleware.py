@@ -0,0 +1,299 @@
+"""
+Middlewares de la boutique.
+
+``CartSummaryMiddleware`` expose ``request.cart_summary`` : le résumé du
+panier (``store.views.get_cart_summary``) calculé au premier accès puis
+partagé par le context processor ``cart_info``, les tags ``cart_tags`` et les
+vues ``cart`` / ``checkout`` d'une même requête. Toute modification du
+panier (signaux de Order et Cart.orders) le fait recalculer au prochain
+accès. Le badge et les compteurs n'ont besoin que des totaux
+(``RequestCartSummary.counts``) : une seule ligne Cart, sans les articles.
+
+``PageCacheMiddleware`` met en cache le HTML des vues décorées par
+``page_cache`` pour les visiteurs anonymes (GET). La clé combine hôte,
+chemin, paramètres normalisés et langue. Chaque page porte des étiquettes
+(store.cache_tags) : une modification du catalogue change leur version et
+la page est recalculée. Après ``PAGE_CACHE_TIMEOUT``, la page périmée reste
+servie pendant ``PAGE_CACHE_STALE_TIMEOUT`` aux autres visiteurs pendant
+qu'une requête la recalcule. L'en-tête ``X-Cache`` indique HIT, MISS ou
+STALE.
+
+Une réponse n'est pas mise en cache si elle pose un cookie, utilise un jeton
+CSRF (formulaire) ou si la requête a des messages en attente.
+"""
+
+import hashlib
+import itertools
+import time
+from collections.abc import Mapping
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils import translation
+
+# Clés du résumé servies sans charger les articles (voir counts)
+CART_COUNT_KEYS = ("total_items", "total_price", "is_empty")
+
+# Incrémenté à chaque modification de panier dans le processus
+_cart_generation = itertools.count(1)
+_current_generation = 0
+
+
+def bump_cart_generation():
+    """Invalide les résumés de panier mémorisés par les requêtes en cours."""
+    global _current_generation
+
+    _current_generation = next(_cart_generation)
+
+
+class RequestCartSummary(Mapping):
+    """Résumé du panier de la requête, calculé paresseusement."""
+
+    def __init__(self, user):
+        self._user = user
+        self._data = None
+        self._counts = None
+        self._generation = None
+
+    def _check_generation(self):
+        if self._generation != _current_generation:
+            self._generation = _current_generation
+            self.invalidate()
+
+    def _get(self):
+        self._check_generation()
+        if self._data is None:
+            from store.views import get_cart_summary
+
+            self._data = get_cart_summary(self._user)
+        return self._data
+
+    def counts(self):
+        """total_items, total_price, is_empty (lecture de la seule ligne Cart)."""
+        self._check_generation()
+        if self._data is not None:
+            return {key: self._data[key] for key in CART_COUNT_KEYS}
+        if self._counts is None:
+            from store.carts import get_cart_counts
+
+            self._counts = get_cart_counts(self._user)
+        return self._counts
+
+    def invalidate(self):
+        self._data = None
+        self._counts = None
+
+    def __getitem__(self, key):
+        return self._get()[key]
+
+    def __iter__(self):
+        return iter(self._get())
+
+    def __len__(self):
+        return len(self._get())
+
+
+def get_request_cart_summary(request):
+    """
+    Résumé du panier de la requête, calculé au premier accès.
+
+    Returns:
+        Mapping: orders, total_items, total_price, is_empty (et cart)
+    """
+    summary = getattr(request, "cart_summary", None)
+    if summary is None:
+        # Middleware absent : mémorisé tout de même pour la requête
+        summary = request.cart_summary = RequestCartSummary(request.user)
+    return summary
+
+
+class CartSummaryMiddleware:
+    """Installe ``request.cart_summary`` (après AuthenticationMiddleware)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.cart_summary = RequestCartSummary(request.user)
+        return self.get_response(request)
+
+
+PAGE_CACHE_PREFIX = "page:"
+PAGE_CACHE_HEADER = "X-Cache"
+
+# Paramètres de suivi sans effet sur le contenu
+IGNORED_QUERY_PARAMS = {"fbclid", "gclid", "msclkid"}
+
+PAGE_CACHE_LOCK_TIMEOUT = 30
+
+
+def page_cache(tags=(), on_hit=None):
+    """
+    Rend une vue éligible au cache de pages anonymes.
+
+    Args:
+        tags: Étiquettes d'invalidation communes à toutes les pages de la vue
+            (la vue peut en ajouter avec add_page_cache_tags)
+        on_hit: Appelée avec (request, meta) quand la page est servie depuis
+            le cache ; ``meta`` est le dict ``request.page_cache_meta``
+            renseigné par la vue lors du rendu
+    """
+
+    def decorator(view_func):
+        view_func.page_cache = {"tags": tuple(tags), "on_hit": on_hit}
+        return view_func
+
+    return decorator
+
+
+def add_page_cache_tags(request, *tags):
+    """Ajoute des étiquettes à la page en cours de rendu (ex. product:42)."""
+    if hasattr(request, "_page_cache"):
+        request._page_cache["tags"].update(tags)
+
+
+def normalized_query(request):
+    """Paramètres triés, sans valeurs vides ni paramètres de suivi."""
+    params = sorted(
+        (key, value)
+        for key, values in request.GET.lists()
+        if key not in IGNORED_QUERY_PARAMS and not key.startswith("utm_")
+        for value in values
+        if value != ""
+    )
+    return urlencode(params)
+
+
+def page_cache_key(request):
+    raw = "|".join(
+        (
+            request.get_host(),
+            request.path,
+            normalized_query(request),
+            translation.get_language() or settings.LANGUAGE_CODE,
+        )
+    )
+    return f"{PAGE_CACHE_PREFIX}{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def _is_cacheable_request(request):
+    if request.method not in ("GET", "HEAD"):
+        return False
+    if not getattr(settings, "PAGE_CACHE_ENABLED", True):
+        return False
+    if request.user.is_authenticated:
+        return False
+    # Messages en attente : la page les affiche et les consomme
+    return len(get_messages(request)) == 0
+
+
+def _is_cacheable_response(request, response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        # Jeton CSRF propre au visiteur dans la page
+        and not request.META.get("CSRF_COOKIE_NEEDS_UPDATE")
+        and not response.has_header("Cache-Control")
+    )
+
+
+class PageCacheMiddleware:
+    """
+    Cache de pages pour les visiteurs anonymes.
+
+    À placer avant SessionMiddleware, CsrfViewMiddleware et
+    MessageMiddleware pour voir les cookies qu'ils posent.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        state = getattr(request, "_page_cache", None)
+        if state is None or state.get("hit"):
+            return response
+
+        if _is_cacheable_response(request, response):
+            self._store(request, state, response)
+        if state.get("locked"):
+            cache.delete(f"lock:{state['key']}")
+        response[PAGE_CACHE_HEADER] = "MISS"
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        from store.cache_tags import get_tag_versions
+
+        options = getattr(view_func, "page_cache", None)
+        if options is None or not _is_cacheable_request(request):
+            return None
+
+        key = page_cache_key(request)
+        tags = set(options["tags"])
+        state = request._page_cache = {
+            "key": key,
+            "tags": tags,
+            # Versions lues avant le rendu : une modification pendant le rendu
+            # rend la page invalide au prochain accès
+            "versions": get_tag_versions(tags),
+        }
+        request.page_cache_meta = {}
+
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        if get_tag_versions(entry["tags"]) != entry["versions"]:
+            # Étiquette invalidée : page purgée
+            return None
+
+        if time.time() < entry["expires"]:
+            status = "HIT"
+        elif not cache.add(f"lock:{key}", 1, PAGE_CACHE_LOCK_TIMEOUT):
+            # Une autre requête recalcule la page
+            status = "STALE"
+        else:
+            state["locked"] = True
+            return None
+
+        state["hit"] = True
+        if options["on_hit"] is not None:
+            options["on_hit"](request, entry["meta"])
+
+        response = HttpResponse(
+            entry["content"],
+            status=entry["status"],
+            content_type=entry["content_type"],
+        )
+        response[PAGE_CACHE_HEADER] = status
+        return response
+
+    def _store(self, request, state, response):
+        from store.cache_tags import get_tag_versions
+
+        timeout = getattr(settings, "PAGE_CACHE_TIMEOUT", 60)
+        stale_timeout = getattr(settings, "PAGE_CACHE_STALE_TIMEOUT", 300)
+
+        versions = dict(state["versions"])
+        # Étiquettes ajoutées par la vue pendant le rendu
+        added = state["tags"] - set(versions)
+        if added:
+            versions.update(get_tag_versions(added))
+
+        cache.set(
+            state["key"],
+            {
+                "content": response.content,
+                "status": response.status_code,
+                "content_type": response["Content-Type"],
+                "tags": sorted(versions),
+                "versions": versions,
+                "meta": getattr(request, "page_cache_meta", {}),
+                "expires": time.time() + timeout,
+            },
+            timeout + stale_timeout,
+        )
@@ -0,0 +1,66 @@
+from django.db import migrations
+
+# Requêtes figées à l'état du schéma de cette migration : le code de
+# store.search peut évoluer sans casser les anciennes migrations
+PG_POPULATE_SQL = """
+    UPDATE store_product AS p
+    SET search_vector =
+        setweight(to_tsvector('french'::regconfig, coalesce(p.name, '')), 'A')
+        || setweight(to_tsvector('french'::regconfig, coalesce(c.name, '')), 'B')
+        || setweight(
+            to_tsvector('french'::regconfig, coalesce(p.description, '')), 'C'
+        )
+    FROM store_product AS p2
+    LEFT JOIN store_category AS c ON c.id = p2.category_id
+    WHERE p.id = p2.id
+"""
+
+SQLITE_POPULATE_SQL = """
+    INSERT INTO store_product_fts (rowid, name, description, category_name)
+    SELECT p.id, p.name, coalesce(p.description, ''), coalesce(c.name, '')
+    FROM store_product AS p
+    LEFT JOIN store_category AS c ON c.id = p.category_id
+"""
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute(
+            "ALTER TABLE store_product ADD COLUMN IF NOT EXISTS search_vector tsvector"
+        )
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS store_product_search_vector_gin "
+            "ON store_product USING gin (search_vector)"
+        )
+        schema_editor.execute(PG_POPULATE_SQL)
+    elif vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS store_product_fts USING fts5("
+            "name, description, category_name, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute("DELETE FROM store_product_fts")
+        schema_editor.execute(SQLITE_POPULATE_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS store_product_search_vector_gin")
+        schema_editor.execute(
+            "ALTER TABLE store_product DROP COLUMN IF EXISTS search_vector"
+        )
+    elif vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS store_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:09
+
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def populate_stock_summary(apps, schema_editor):
+    Product = apps.get_model("store", "Product")
+    ProductVariant = apps.get_model("store", "ProductVariant")
+
+    variants = ProductVariant.objects.filter(product=OuterRef("pk"))
+    in_stock_variants = variants.filter(stock__gt=0)
+
+    Product.objects.update(
+        total_stock=Coalesce(
+            Subquery(
+                variants.order_by()
+                .values("product")
+                .annotate(total=Sum("stock"))
+                .values("total")
+            ),
+            0,
+        ),
+        in_stock_variant_count=Coalesce(
+            Subquery(
+                in_stock_variants.order_by()
+                .values("product")
+                .annotate(count=Count("id"))
+                .values("count")
+            ),
+            0,
+        ),
+        is_in_stock=Exists(in_stock_variants),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0002_product_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="in_stock_variant_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="is_in_stock",
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="total_stock",
+            field=models.IntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["is_in_stock", "-created_at"], name="product_stock_recent_idx"
+            ),
+        ),
+        migrations.RunPython(populate_stock_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0003_product_stock_summary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SimilarProduct",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("rank", models.PositiveSmallIntegerField()),
+                ("score", models.FloatField()),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similar_links",
+                        to="store.product",
+                    ),
+                ),
+                (
+                    "similar",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="similar_to",
+                        to="store.product",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Produit similaire",
+                "verbose_name_plural": "Produits similaires",
+                "ordering": ["product", "rank"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("product", "rank"), name="similar_product_rank_unique"
+                    )
+                ],
+            },
+        ),
+    ]
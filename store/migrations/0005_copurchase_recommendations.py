@@ -0,0 +1,139 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0004_similar_products"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BoughtTogether",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("rank", models.PositiveSmallIntegerField()),
+                ("count", models.PositiveIntegerField()),
+            ],
+            options={
+                "verbose_name": "Produit acheté avec",
+                "verbose_name_plural": "Produits achetés avec",
+                "ordering": ["product", "rank"],
+            },
+        ),
+        migrations.CreateModel(
+            name="CoPurchaseCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "verbose_name": "Achat groupé",
+                "verbose_name_plural": "Achats groupés",
+            },
+        ),
+        migrations.CreateModel(
+            name="CoPurchaseRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "processed_through",
+                    models.DateField(
+                        help_text="Dernier jour d'achats inclus dans les comptages"
+                    ),
+                ),
+                ("baskets", models.PositiveIntegerField(default=0)),
+                ("pairs", models.PositiveIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "Calcul des achats groupés",
+                "verbose_name_plural": "Calculs des achats groupés",
+                "ordering": ["-processed_through", "-id"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="order",
+            index=models.Index(
+                fields=["user", "ordered", "date_ordered"],
+                name="order_user_history_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="boughttogether",
+            name="other",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="bought_with",
+                to="store.product",
+            ),
+        ),
+        migrations.AddField(
+            model_name="boughttogether",
+            name="product",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="bought_together_links",
+                to="store.product",
+            ),
+        ),
+        migrations.AddField(
+            model_name="copurchasecount",
+            name="product_a",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="store.product",
+            ),
+        ),
+        migrations.AddField(
+            model_name="copurchasecount",
+            name="product_b",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="store.product",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="boughttogether",
+            constraint=models.UniqueConstraint(
+                fields=("product", "rank"), name="bought_together_rank_unique"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="copurchasecount",
+            constraint=models.UniqueConstraint(
+                fields=("product_a", "product_b"), name="copurchase_pair_unique"
+            ),
+        ),
+    ]
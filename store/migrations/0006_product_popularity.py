@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0005_copurchase_recommendations"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="pending_sales",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="pending_views",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="popularity_score",
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="popularity_updated_at",
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["-popularity_score", "-created_at"],
+                name="product_popularity_idx",
+            ),
+        ),
+    ]
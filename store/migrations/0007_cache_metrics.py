@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0006_product_popularity"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CacheMetric",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("prefix", models.CharField(max_length=200, unique=True)),
+                ("hits", models.PositiveBigIntegerField(default=0)),
+                ("misses", models.PositiveBigIntegerField(default=0)),
+                ("sets", models.PositiveBigIntegerField(default=0)),
+                ("deletes", models.PositiveBigIntegerField(default=0)),
+                (
+                    "get_time",
+                    models.FloatField(
+                        default=0, help_text="Durée cumulée des lectures (s)"
+                    ),
+                ),
+                (
+                    "set_time",
+                    models.FloatField(
+                        default=0, help_text="Durée cumulée des écritures (s)"
+                    ),
+                ),
+                ("bytes_written", models.PositiveBigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Métrique de cache",
+                "verbose_name_plural": "Métriques de cache",
+                "ordering": ["prefix"],
+            },
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0007_cache_metrics"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockReservation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("quantity", models.PositiveIntegerField()),
+                (
+                    "reference",
+                    models.CharField(
+                        db_index=True,
+                        help_text="Identifiant du paiement (PaymentIntent)",
+                        max_length=255,
+                    ),
+                ),
+                ("expires_at", models.DateTimeField(db_index=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "order",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="store.order",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "variant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reservations",
+                        to="store.productvariant",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Réservation de stock",
+                "verbose_name_plural": "Réservations de stock",
+                "indexes": [
+                    models.Index(
+                        fields=["variant", "expires_at"], name="reservation_active_idx"
+                    )
+                ],
+            },
+        ),
+    ]
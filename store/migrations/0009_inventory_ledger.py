@@ -0,0 +1,151 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:43
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_opening_snapshots(apps, schema_editor):
+    """Stock actuel de chaque variante comme solde d'ouverture du journal."""
+    ProductVariant = apps.get_model("store", "ProductVariant")
+    InventorySnapshot = apps.get_model("store", "InventorySnapshot")
+
+    InventorySnapshot.objects.bulk_create(
+        (
+            InventorySnapshot(variant_id=variant_id, stock=stock, last_movement_id=0)
+            for variant_id, stock in ProductVariant.objects.values_list(
+                "pk", "stock"
+            ).iterator(chunk_size=2000)
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0008_stock_reservations"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InventoryMovement",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "quantity",
+                    models.IntegerField(
+                        help_text="Variation du stock (négative pour une sortie)"
+                    ),
+                ),
+                (
+                    "reason",
+                    models.CharField(
+                        choices=[
+                            ("sale", "Vente"),
+                            ("cancellation", "Annulation"),
+                            ("import", "Import"),
+                            ("adjustment", "Ajustement manuel"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("note", models.CharField(blank=True, max_length=255)),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        db_index=True, default=django.utils.timezone.now
+                    ),
+                ),
+                (
+                    "order",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="inventory_movements",
+                        to="store.order",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "variant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="movements",
+                        to="store.productvariant",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Mouvement de stock",
+                "verbose_name_plural": "Mouvements de stock",
+                "ordering": ["-id"],
+                "indexes": [
+                    models.Index(fields=["variant", "id"], name="movement_variant_idx")
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="InventorySnapshot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("stock", models.IntegerField()),
+                (
+                    "last_movement_id",
+                    models.BigIntegerField(
+                        default=0,
+                        help_text="Dernier mouvement replié dans l'instantané",
+                    ),
+                ),
+                ("movement_count", models.PositiveIntegerField(default=0)),
+                ("taken_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "variant",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="snapshots",
+                        to="store.productvariant",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Instantané de stock",
+                "verbose_name_plural": "Instantanés de stock",
+                "ordering": ["-last_movement_id"],
+                "indexes": [
+                    models.Index(
+                        fields=["variant", "last_movement_id"],
+                        name="snapshot_variant_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(create_opening_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,197 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Paniers traités par lot
+CHUNK_SIZE = 500
+
+
+def copy_cart_lines(apps, schema_editor):
+    """Lignes CartItem et totaux des paniers depuis la table M2M, par lots."""
+    Cart = apps.get_model("store", "Cart")
+    CartItem = apps.get_model("store", "CartItem")
+    Order = apps.get_model("store", "Order")
+    ProductVariant = apps.get_model("store", "ProductVariant")
+    CartOrder = Cart.orders.through
+
+    # Une commande dans plusieurs paniers : gardée dans le premier
+    seen_orders = set()
+    last_pk = 0
+    while True:
+        cart_ids = list(
+            Cart.objects.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:CHUNK_SIZE]
+        )
+        if not cart_ids:
+            break
+        last_pk = cart_ids[-1]
+
+        # Seules les commandes non payées sont des lignes de panier
+        rows = list(
+            CartOrder.objects.filter(cart_id__in=cart_ids, order__ordered=False)
+            .order_by("cart_id", "order_id")
+            .values_list(
+                "cart_id",
+                "order_id",
+                "order__product_id",
+                "order__size",
+                "order__quantity",
+                "order__product__price",
+            )
+        )
+        variants = {
+            (product_id, size): pk
+            for pk, product_id, size in ProductVariant.objects.filter(
+                product_id__in={row[2] for row in rows}
+            ).values_list("pk", "product_id", "size")
+        }
+
+        items, merged, duplicates = {}, [], []
+        totals = {}
+        for cart_id, order_id, product_id, size, quantity, price in rows:
+            if order_id in seen_orders:
+                continue
+            seen_orders.add(order_id)
+            variant_id = variants.get((product_id, size))
+            count, subtotal = totals.get(cart_id, (0, 0))
+            totals[cart_id] = (count + quantity, subtotal + quantity * price)
+
+            key = (cart_id, variant_id) if variant_id else (cart_id, None, order_id)
+            if key in items:
+                # Deux commandes de la même variante : fusionnées dans la première
+                items[key].quantity += quantity
+                merged.append(items[key])
+                duplicates.append(order_id)
+                continue
+            items[key] = CartItem(
+                cart_id=cart_id,
+                order_id=order_id,
+                product_id=product_id,
+                variant_id=variant_id,
+                quantity=quantity,
+            )
+
+        for item in merged:
+            Order.objects.filter(pk=item.order_id).update(quantity=item.quantity)
+        if duplicates:
+            Order.objects.filter(pk__in=duplicates).delete()
+
+        CartItem.objects.bulk_create(items.values(), batch_size=CHUNK_SIZE)
+        Cart.objects.bulk_update(
+            [
+                Cart(pk=cart_id, item_count=count, subtotal=subtotal)
+                for cart_id, (count, subtotal) in totals.items()
+            ],
+            ["item_count", "subtotal"],
+            batch_size=CHUNK_SIZE,
+        )
+
+
+def restore_cart_orders(apps, schema_editor):
+    """Retour arrière : lignes recopiées dans la table M2M automatique."""
+    Cart = apps.get_model("store", "Cart")
+    CartItem = apps.get_model("store", "CartItem")
+    CartOrder = Cart.orders.through
+
+    CartOrder.objects.bulk_create(
+        (
+            CartOrder(cart_id=cart_id, order_id=order_id)
+            for cart_id, order_id in CartItem.objects.values_list(
+                "cart_id", "order_id"
+            ).iterator(chunk_size=2000)
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("store", "0009_inventory_ledger"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cart",
+            name="item_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="cart",
+            name="subtotal",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.CreateModel(
+            name="CartItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("quantity", models.PositiveIntegerField(default=1)),
+                ("added_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "cart",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="items",
+                        to="store.cart",
+                    ),
+                ),
+                (
+                    "order",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="cart_item",
+                        to="store.order",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="store.product",
+                    ),
+                ),
+                (
+                    "variant",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="store.productvariant",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Ligne de panier",
+                "verbose_name_plural": "Lignes de panier",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("cart", "variant"), name="cart_item_variant_unique"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(copy_cart_lines, restore_cart_orders),
+        # La table M2M automatique est remplacée par CartItem
+        migrations.RemoveField(
+            model_name="cart",
+            name="orders",
+        ),
+        migrations.AddField(
+            model_name="cart",
+            name="orders",
+            field=models.ManyToManyField(
+                blank=True, through="store.CartItem", to="store.order"
+            ),
+        ),
+    ]
@@ -1,10 +1,12 @@
-from django.db import models
-from django.db.models.signals import post_save, post_delete
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed, post_save, post_delete
 from django.dispatch import receiver
-from django.core.cache import cache
 from django.utils import timezone
 from django.urls import reverse
 from shop.settings import AUTH_USER_MODEL
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 # Category model for organizing products
@@ -50,11 +52,7 @@ class Category(models.Model):
     @property
     def product_count(self):
         """Nombre de produits en stock dans cette catégorie"""
-        return (
-            Product.objects.filter(category=self, variants__stock__gt=0)
-            .distinct()
-            .count()
-        )
+        return Product.objects.filter(category=self, is_in_stock=True).count()
 
     @property
     def total_product_count(self):
@@ -67,11 +65,24 @@ class Category(models.Model):
 
     @property
     def background_gradient(self):
+        """Gradient CSS de la couleur thème (mémorisé dans le cache local)"""
+        from store.near_cache import near_cache
+
+        color = str(self.color_theme)
+        return near_cache.get_or_compute(
+            f"category_gradient:{color}",
+            lambda: self.gradient_for(color),
+            None,
+            remote=False,
+        )
+
+    @staticmethod
+    def gradient_for(color_theme):
         """Génère un gradient CSS basé sur la couleur thème"""
         import colorsys
 
         # Convertir hex en RGB
-        hex_color = str(self.color_theme).lstrip("#")
+        hex_color = str(color_theme).lstrip("#")
         rgb = tuple(int(hex_color[i : i + 2], 16) for i in (0, 2, 4))
 
         # Convertir en HSL pour éclaircir
@@ -81,7 +92,7 @@ class Category(models.Model):
         lighter_rgb = colorsys.hls_to_rgb(h, min(1, l + 0.2), s)
         lighter_hex = "#" + "".join(f"{int(c*255):02x}" for c in lighter_rgb)
 
-        return f"linear-gradient(135deg, {self.color_theme}, " f"{lighter_hex})"
+        return f"linear-gradient(135deg, {color_theme}, " f"{lighter_hex})"
 
 
 # products
@@ -114,24 +125,118 @@ class Product(models.Model):
     rating = models.FloatField(default=0)  # note moyenne sur 5
     review_count = models.PositiveIntegerField(default=0)
 
+    # Résumé du stock des variantes, maintenu par les signaux de ProductVariant
+    total_stock = models.IntegerField(default=0, db_index=True, editable=False)
+    in_stock_variant_count = models.PositiveIntegerField(default=0, editable=False)
+    is_in_stock = models.BooleanField(default=False, db_index=True, editable=False)
+
+    # Popularité : compteurs en attente, repliés avec décroissance dans
+    # popularity_score par update_popularity (voir store.popularity)
+    pending_sales = models.PositiveIntegerField(default=0, editable=False)
+    pending_views = models.PositiveIntegerField(default=0, editable=False)
+    popularity_score = models.FloatField(default=0, editable=False)
+    popularity_updated_at = models.DateTimeField(null=True, editable=False)
+
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(
+                fields=["is_in_stock", "-created_at"], name="product_stock_recent_idx"
+            ),
+            models.Index(
+                fields=["-popularity_score", "-created_at"],
+                name="product_popularity_idx",
+            ),
+        ]
+
+    # Colonnes écrites uniquement par UPDATE ... SET colonne = expression
+    # (résumé de stock, popularité) : jamais par une sauvegarde complète
+    DERIVED_FIELDS = frozenset(
+        {
+            "total_stock",
+            "in_stock_variant_count",
+            "is_in_stock",
+            "pending_sales",
+            "pending_views",
+            "popularity_score",
+            "popularity_updated_at",
+        }
+    )
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Les valeurs en mémoire des colonnes dérivées peuvent être périmées
+        # (UPDATE concurrents) : une sauvegarde complète (admin, import) ne
+        # les réécrit pas
+        if (
+            not args
+            and not self._state.adding
+            and kwargs.get("update_fields") is None
+            and not kwargs.get("force_insert")
+        ):
+            skipped = self.DERIVED_FIELDS | self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in skipped
+                and field.attname not in skipped
+            ]
+        super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse("store:product_detail", kwargs={"slug": self.slug})
 
     @property
     def is_available(self):
         """Vérifie si le produit est disponible en stock via ses variantes"""
-        return self.variants.filter(stock__gt=0).exists()
+        return self.is_in_stock
 
-    @property
-    def total_stock(self):
-        """Retourne le stock total de toutes les variantes"""
-        return sum(variant.stock for variant in self.variants.all())
+    @classmethod
+    def refresh_stock_summary(cls, product_ids=None):
+        """
+        Recalcule total_stock, in_stock_variant_count et is_in_stock depuis
+        les variantes, en une seule requête UPDATE.
+
+        Args:
+            product_ids: Produits à recalculer (None = tout le catalogue)
+
+        Returns:
+            int: Nombre de produits mis à jour
+        """
+        from django.db.models import Count, Exists, OuterRef, Subquery, Sum
+        from django.db.models.functions import Coalesce
+
+        variants = ProductVariant.objects.filter(product=OuterRef("pk"))
+        in_stock_variants = variants.filter(stock__gt=0)
+
+        queryset = cls.objects.all()
+        if product_ids is not None:
+            queryset = queryset.filter(pk__in=product_ids)
+
+        return queryset.update(
+            total_stock=Coalesce(
+                Subquery(
+                    variants.order_by()
+                    .values("product")
+                    .annotate(total=Sum("stock"))
+                    .values("total")
+                ),
+                0,
+            ),
+            in_stock_variant_count=Coalesce(
+                Subquery(
+                    in_stock_variants.order_by()
+                    .values("product")
+                    .annotate(count=Count("id"))
+                    .values("count")
+                ),
+                0,
+            ),
+            is_in_stock=Exists(in_stock_variants),
+        )
 
     @property
     def formatted_price(self):
@@ -147,27 +252,50 @@ class Product(models.Model):
 
     def reduce_stock(self, size, quantity):
         """
-        Réduit le stock de la variante correspondante
+        Réduit le stock de la variante correspondante (UPDATE conditionnel)
         Retourne True si réussi, False sinon
         """
-        variant = self.get_variant_by_size(size)
-        if variant and variant.stock >= quantity:
-            variant.stock -= quantity
-            variant.save()
-            return True
-        return False
+        from store.inventory import StockLine, decrement_stock
+
+        (result,) = decrement_stock([StockLine(self.pk, size, quantity)])
+        if result.ok:
+            self.refresh_from_db(
+                fields=["total_stock", "in_stock_variant_count", "is_in_stock"]
+            )
+        return result.ok
 
     def get_stock_for_size(self, size):
         """Retourne le stock disponible pour une taille donnée"""
         variant = self.get_variant_by_size(size)
         return variant.stock if variant else 0
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Prix lu en base : save() recalcule les paniers si il change
+        instance._loaded_price = instance.__dict__.get("price")
+        # Nom, prix et catégorie lus : voisins recalculés seulement s'ils changent
+        instance._loaded_similarity = instance.similarity_values()
+        return instance
+
+    def similarity_values(self):
+        """Nom, prix et catégorie, tels que chargés (None si différé)"""
+        return tuple(
+            self.__dict__.get(field) for field in ("name", "price", "category_id")
+        )
+
+    def similarity_changed(self):
+        """Nom, prix ou catégorie modifié depuis la lecture"""
+        previous = getattr(self, "_loaded_similarity", None)
+        return previous is None or previous != self.similarity_values()
+
 
 class ProductVariant(models.Model):
     product = models.ForeignKey(
         Product, on_delete=models.CASCADE, related_name="variants"
     )
     size = models.CharField(max_length=8)
+    # Projection du journal InventoryMovement (voir store.inventory)
     stock = models.IntegerField(default=0)
     price = models.DecimalField(
         max_digits=10,
@@ -185,13 +313,243 @@ class ProductVariant(models.Model):
     def __str__(self):
         return f"{self.product.name} - {self.size}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Stock lu en base : save() journalise l'écart (ajustement manuel)
+        instance._loaded_stock = instance.__dict__.get("stock")
+        instance._loaded_size = instance.__dict__.get("size")
+        return instance
+
+    def inventory_changed(self):
+        """Taille ou disponibilité (stock nul ou non) modifiée depuis la lecture"""
+        previous = getattr(self, "_loaded_stock", None)
+        if previous is None or getattr(self, "_loaded_size", None) != self.size:
+            return True
+        return (previous > 0) != (self.stock > 0)
+
+
+class InventoryMovement(models.Model):
+    """Mouvement de stock d'une variante (journal en ajout seul)"""
+
+    SALE = "sale"
+    CANCELLATION = "cancellation"
+    IMPORT = "import"
+    ADJUSTMENT = "adjustment"
+    REASON_CHOICES = [
+        (SALE, "Vente"),
+        (CANCELLATION, "Annulation"),
+        (IMPORT, "Import"),
+        (ADJUSTMENT, "Ajustement manuel"),
+    ]
+
+    variant = models.ForeignKey(
+        ProductVariant, on_delete=models.CASCADE, related_name="movements"
+    )
+    quantity = models.IntegerField(help_text="Variation du stock (négative pour une sortie)")
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    order = models.ForeignKey(
+        "Order",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="inventory_movements",
+    )
+    user = models.ForeignKey(
+        AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True
+    )
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ["-id"]
+        verbose_name = "Mouvement de stock"
+        verbose_name_plural = "Mouvements de stock"
+        indexes = [
+            # Historique d'une variante et mouvements postérieurs à un instantané
+            models.Index(fields=["variant", "id"], name="movement_variant_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity:+d} × {self.variant} ({self.get_reason_display()})"
+
+
+class InventorySnapshot(models.Model):
+    """Stock d'une variante après les mouvements jusqu'à last_movement_id inclus"""
+
+    variant = models.ForeignKey(
+        ProductVariant, on_delete=models.CASCADE, related_name="snapshots"
+    )
+    stock = models.IntegerField()
+    last_movement_id = models.BigIntegerField(
+        default=0, help_text="Dernier mouvement replié dans l'instantané"
+    )
+    movement_count = models.PositiveIntegerField(default=0)
+    taken_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["-last_movement_id"]
+        verbose_name = "Instantané de stock"
+        verbose_name_plural = "Instantanés de stock"
+        indexes = [
+            models.Index(
+                fields=["variant", "last_movement_id"], name="snapshot_variant_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.variant} : {self.stock} (≤ #{self.last_movement_id})"
+
+
+class SimilarProduct(models.Model):
+    """Voisin précalculé d'un produit (voir store.similarity)"""
 
-# Invalidation du cache des produits vedettes à chaque modification ou suppression d'un produit
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="similar_links"
+    )
+    similar = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="similar_to"
+    )
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ["product", "rank"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "rank"], name="similar_product_rank_unique"
+            )
+        ]
+        verbose_name = "Produit similaire"
+        verbose_name_plural = "Produits similaires"
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.similar_id} (#{self.rank})"
+
+
+# Invalidation du cache par étiquettes, regroupée et appliquée après le commit
 @receiver([post_save, post_delete], sender=Product)
-def invalidate_featured_products_cache(sender, instance, **kwargs):
-    for limit in [10, 20, 50]:
-        cache_key = f"featured_products_{limit}"
-        cache.delete(cache_key)
+def invalidate_product_cache_tags(sender, instance, **kwargs):
+    from store.cache_tags import instance_tags, invalidate_tags
+
+    invalidate_tags(
+        *instance_tags("product", instance.pk),
+        f"category:{instance.category_id}",
+        "catalog",
+    )
+
+
+@receiver([post_save, post_delete], sender=ProductVariant)
+def invalidate_variant_cache_tags(sender, instance, **kwargs):
+    from store.cache_tags import instance_tags, invalidate_tags
+    from store.performance_utils import bump_inventory_version
+
+    tags = instance_tags("product", instance.product_id)
+    # Un simple changement de quantité ne touche que les pages du produit ;
+    # avant record_variant_stock_change, qui recale _loaded_stock
+    if "created" not in kwargs or instance.inventory_changed():
+        tags = (*tags, "inventory")
+        bump_inventory_version()
+    invalidate_tags(*tags)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_cache_tags(sender, instance, **kwargs):
+    from store.cache_tags import instance_tags, invalidate_tags
+
+    invalidate_tags(*instance_tags("category", instance.pk), "catalog")
+
+
+# Nouvelle version du catalogue : facettes et index en mémoire à reconstruire
+# (les variantes font évoluer la version de l'inventaire, voir plus haut)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+def bump_catalog_version_on_write(sender, instance, **kwargs):
+    from store.performance_utils import bump_catalog_version
+
+    bump_catalog_version()
+
+
+# Maintien du résumé de stock du produit dans la transaction de la variante
+@receiver([post_save, post_delete], sender=ProductVariant)
+def update_product_stock_summary(sender, instance, **kwargs):
+    Product.refresh_stock_summary([instance.product_id])
+
+    # Garder à jour l'instance produit déjà chargée par l'appelant
+    if ProductVariant.product.is_cached(instance):
+        try:
+            instance.product.refresh_from_db(
+                fields=["total_stock", "in_stock_variant_count", "is_in_stock"]
+            )
+        except Product.DoesNotExist:
+            pass
+
+
+# Journal des modifications de stock faites par save() (admin, commandes)
+@receiver(post_save, sender=ProductVariant)
+def record_variant_stock_change(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = 0 if created else getattr(instance, "_loaded_stock", None)
+    if previous is not None and instance.stock != previous:
+        InventoryMovement.objects.create(
+            variant=instance,
+            quantity=instance.stock - previous,
+            reason=InventoryMovement.IMPORT if created else InventoryMovement.ADJUSTMENT,
+        )
+    instance._loaded_stock = instance.stock
+    instance._loaded_size = instance.size
+
+
+# Synchronisation de l'index de recherche plein texte
+@receiver(post_save, sender=Product)
+def update_product_search_index(sender, instance, **kwargs):
+    from store.search import index_products
+
+    try:
+        index_products([instance.pk])
+    except Exception as e:
+        logger.error("Erreur indexation recherche produit %s: %s", instance.pk, e)
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_search_index(sender, instance, **kwargs):
+    from store.search import remove_products
+
+    try:
+        remove_products([instance.pk])
+    except Exception as e:
+        logger.error("Erreur désindexation produit %s: %s", instance.pk, e)
+
+
+# Recalcul incrémental des produits similaires, regroupé après le commit
+@receiver(post_save, sender=Product)
+def refresh_product_similarities(
+    sender, instance, created, update_fields=None, **kwargs
+):
+    from store.similarity import SIMILARITY_FIELDS, queue_similarity_refresh
+
+    if update_fields is not None and not SIMILARITY_FIELDS & set(update_fields):
+        return
+    if not created and not instance.similarity_changed():
+        return
+
+    instance._loaded_similarity = instance.similarity_values()
+    queue_similarity_refresh([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def update_category_search_index(sender, instance, created, **kwargs):
+    # Le nom de la catégorie fait partie du document indexé de ses produits
+    if created:
+        return
+
+    from store.search import index_products
+
+    try:
+        index_products(instance.product_set.values_list("id", flat=True))
+    except Exception as e:
+        logger.error("Erreur réindexation catégorie %s: %s", instance.pk, e)
 
 
 # Articles (Orders)
@@ -223,6 +581,13 @@ class Order(models.Model):
                 check=models.Q(quantity__gt=0), name="positive_quantity"
             )
         ]
+        indexes = [
+            # Historique des commandes et lecture des achats par utilisateur/date
+            models.Index(
+                fields=["user", "ordered", "date_ordered"],
+                name="order_user_history_idx",
+            ),
+        ]
 
     def __str__(self):
         size_info = f" (taille: {self.size})" if self.size else ""
@@ -241,6 +606,107 @@ class Order(models.Model):
         return f"{self.total_price:.2f} €"
 
 
+class StockReservation(models.Model):
+    """Stock retenu pendant un paiement en cours (voir store.inventory)"""
+
+    variant = models.ForeignKey(
+        ProductVariant, on_delete=models.CASCADE, related_name="reservations"
+    )
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, null=True, blank=True, related_name="+"
+    )
+    user = models.ForeignKey(
+        AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True
+    )
+    quantity = models.PositiveIntegerField()
+    reference = models.CharField(
+        max_length=255, db_index=True, help_text="Identifiant du paiement (PaymentIntent)"
+    )
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Réservation de stock"
+        verbose_name_plural = "Réservations de stock"
+        indexes = [
+            # Somme des réservations actives d'une variante
+            models.Index(
+                fields=["variant", "expires_at"], name="reservation_active_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} × {self.variant} ({self.reference})"
+
+
+# Achats groupés (voir store.recommendations)
+
+
+class CoPurchaseCount(models.Model):
+    """Nombre de paniers contenant les deux produits (paire avec product_a < product_b)"""
+
+    product_a = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    product_b = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product_a", "product_b"], name="copurchase_pair_unique"
+            )
+        ]
+        verbose_name = "Achat groupé"
+        verbose_name_plural = "Achats groupés"
+
+    def __str__(self):
+        return f"{self.product_a_id} + {self.product_b_id}: {self.count}"
+
+
+class BoughtTogether(models.Model):
+    """Top-K des produits achetés avec un produit, lu par la fiche et le panier"""
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="bought_together_links"
+    )
+    other = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="bought_with"
+    )
+    rank = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ["product", "rank"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "rank"], name="bought_together_rank_unique"
+            )
+        ]
+        verbose_name = "Produit acheté avec"
+        verbose_name_plural = "Produits achetés avec"
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.other_id} (#{self.rank})"
+
+
+class CoPurchaseRun(models.Model):
+    """Passage de build_copurchases : jours d'achats déjà comptés"""
+
+    processed_through = models.DateField(
+        help_text="Dernier jour d'achats inclus dans les comptages"
+    )
+    baskets = models.PositiveIntegerField(default=0)
+    pairs = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-processed_through", "-id"]
+        verbose_name = "Calcul des achats groupés"
+        verbose_name_plural = "Calculs des achats groupés"
+
+    def __str__(self):
+        return f"Achats groupés jusqu'au {self.processed_through}"
+
+
 # Panier (Cart)
 
 # - Utilisateur
@@ -251,7 +717,11 @@ class Order(models.Model):
 
 class Cart(models.Model):
     user = models.ForeignKey(AUTH_USER_MODEL, on_delete=models.CASCADE)
-    orders = models.ManyToManyField(Order, blank=True)
+    orders = models.ManyToManyField(Order, blank=True, through="CartItem")
+    # Totaux des lignes, maintenus dans la transaction de chaque écriture
+    # (voir store.carts) : le badge du panier se lit sur cette seule ligne
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True, null=True)
     updated_at = models.DateTimeField(auto_now=True, null=True)
 
@@ -266,15 +736,12 @@ class Cart(models.Model):
     @property
     def total_items(self):
         """Nombre total d'articles dans le panier"""
-        return sum(order.quantity for order in self.orders.filter(ordered=False))
+        return self.item_count
 
     @property
     def total_price(self):
         """Prix total du panier"""
-        return sum(
-            order.quantity * order.product.price
-            for order in self.orders.filter(ordered=False)
-        )
+        return self.subtotal
 
     @property
     def formatted_total(self):
@@ -284,14 +751,55 @@ class Cart(models.Model):
     @property
     def is_empty(self):
         """Vérifie si le panier est vide"""
-        return not self.orders.filter(ordered=False).exists()
+        return self.item_count == 0
+
+    def refresh_totals(self):
+        """Recalcule item_count et subtotal depuis les lignes du panier"""
+        from store.carts import refresh_cart_totals
+
+        refresh_cart_totals(Cart.objects.filter(pk=self.pk))
+        self.refresh_from_db(fields=["item_count", "subtotal", "updated_at"])
 
     def clear(self):
-        """Vide le panier"""
-        for order in self.orders.all():
-            if not order.ordered:
-                order.delete()
-        self.orders.clear()
+        """Vide le panier (commandes non payées supprimées en une requête)"""
+        with transaction.atomic():
+            Order.objects.filter(cart_item__cart=self).delete()
+            self.refresh_totals()
+
+
+class CartItem(models.Model):
+    """Ligne de panier : une commande non payée (table de Cart.orders)"""
+
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name="items")
+    order = models.OneToOneField(
+        Order, on_delete=models.CASCADE, related_name="cart_item"
+    )
+    # Recopiés de la commande (voir store.carts.sync_cart_items)
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, null=True, related_name="+"
+    )
+    variant = models.ForeignKey(
+        ProductVariant,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    quantity = models.PositiveIntegerField(default=1)
+    added_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Ligne de panier"
+        verbose_name_plural = "Lignes de panier"
+        constraints = [
+            # Une ligne par variante : la quantité s'ajoute à la ligne existante
+            models.UniqueConstraint(
+                fields=["cart", "variant"], name="cart_item_variant_unique"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} × {self.product_id} (panier {self.cart_id})"
 
 
 class Wishlist(models.Model):
@@ -309,3 +817,131 @@ class Wishlist(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.product.name}"
+
+
+class CacheMetric(models.Model):
+    """Compteurs d'accès au cache par préfixe de clé (voir store.cache_metrics)"""
+
+    prefix = models.CharField(max_length=200, unique=True)
+    hits = models.PositiveBigIntegerField(default=0)
+    misses = models.PositiveBigIntegerField(default=0)
+    sets = models.PositiveBigIntegerField(default=0)
+    deletes = models.PositiveBigIntegerField(default=0)
+    get_time = models.FloatField(default=0, help_text="Durée cumulée des lectures (s)")
+    set_time = models.FloatField(default=0, help_text="Durée cumulée des écritures (s)")
+    bytes_written = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["prefix"]
+        verbose_name = "Métrique de cache"
+        verbose_name_plural = "Métriques de cache"
+
+    def __str__(self):
+        return self.prefix
+
+    @property
+    def hit_ratio(self):
+        """Part des lectures servies par le cache (0 à 1)"""
+        reads = self.hits + self.misses
+        return self.hits / reads if reads else 0
+
+    @property
+    def avg_get_ms(self):
+        reads = self.hits + self.misses
+        return self.get_time * 1000 / reads if reads else 0
+
+    @property
+    def avg_set_ms(self):
+        return self.set_time * 1000 / self.sets if self.sets else 0
+
+    @property
+    def avg_value_size(self):
+        """Taille moyenne des valeurs écrites (octets)"""
+        return self.bytes_written // self.sets if self.sets else 0
+
+
+@receiver([post_save, post_delete], sender=Order)
+def invalidate_order_cache_tags(sender, instance, **kwargs):
+    from store.cache_tags import invalidate_tags
+    from store.middleware import bump_cart_generation
+
+    bump_cart_generation()
+    invalidate_tags(f"cart:{instance.user_id}", f"sales:{instance.product_id}")
+
+
+@receiver(m2m_changed, sender=Cart.orders.through)
+def invalidate_cart_cache_tags(sender, instance, action, **kwargs):
+    from store.cache_tags import invalidate_tags
+    from store.middleware import bump_cart_generation
+
+    if action.startswith("post_"):
+        bump_cart_generation()
+        if isinstance(instance, Cart):
+            invalidate_tags(f"cart:{instance.user_id}")
+
+
+# Lignes et totaux du panier maintenus dans la transaction de l'écriture
+@receiver(m2m_changed, sender=Cart.orders.through)
+def maintain_cart_items(sender, instance, action, reverse, pk_set, **kwargs):
+    from store.carts import refresh_cart_totals, sync_cart_items
+
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if action == "post_add":
+        if reverse:
+            sync_cart_items(CartItem.objects.filter(order=instance))
+        else:
+            sync_cart_items(CartItem.objects.filter(cart=instance, order_id__in=pk_set))
+
+    if reverse:
+        refresh_cart_totals(Cart.objects.filter(user_id=instance.user_id))
+    else:
+        instance.refresh_totals()
+
+
+@receiver(post_save, sender=Order)
+def sync_order_cart_item(sender, instance, created, raw=False, **kwargs):
+    from store.carts import refresh_cart_totals
+
+    if created or raw:
+        return
+
+    lines = CartItem.objects.filter(order=instance)
+    with transaction.atomic():
+        if instance.ordered:
+            # Commande payée : elle quitte le panier
+            changed = lines.delete()[0]
+        else:
+            changed = lines.exclude(quantity=instance.quantity).update(
+                quantity=instance.quantity
+            )
+        if changed:
+            refresh_cart_totals(Cart.objects.filter(user_id=instance.user_id))
+
+
+@receiver(post_delete, sender=Order)
+def refresh_cart_after_order_delete(sender, instance, **kwargs):
+    from store.carts import refresh_cart_totals
+
+    # La ligne de panier est supprimée en cascade
+    if not instance.ordered:
+        refresh_cart_totals(Cart.objects.filter(user_id=instance.user_id))
+
+
+@receiver(post_save, sender=Product)
+def reprice_carts(sender, instance, created, raw=False, **kwargs):
+    from store.carts import refresh_cart_totals
+
+    previous = getattr(instance, "_loaded_price", None)
+    if not (created or raw) and previous is not None and instance.price != previous:
+        refresh_cart_totals(Cart.objects.filter(items__product=instance))
+    instance._loaded_price = instance.price
+
+
+@receiver([post_save, post_delete], sender=Wishlist)
+def invalidate_wishlist_cache_tags(sender, instance, **kwargs):
+    from store.cache_tags import invalidate_tags
+
+    invalidate_tags(f"wishlist:{instance.user_id}")
@@ -0,0 +1,140 @@
+"""
+Cache local (near-cache) devant le cache partagé.
+
+Certaines données sont lues à chaque rendu (catégories du menu, catégories
+vedettes) : avec un cache partagé (Redis), chaque lecture coûte un
+aller-retour réseau. ``NearCache`` garde les dernières valeurs dans la
+mémoire du worker : LRU borné (``NEAR_CACHE_MAX_ENTRIES``), TTL court
+(``NEAR_CACHE_TTL``).
+
+À l'échéance du TTL, la valeur n'est pas rechargée d'office : l'empreinte des
+versions de ses étiquettes (store.cache_tags) est relue en une lecture
+groupée et, si elle n'a pas changé, l'entrée est simplement prolongée. Une
+invalidation faite dans ce worker retire immédiatement les entrées
+concernées ; les autres workers les retirent à réception du message
+(store.invalidation_bus), au plus tard à l'échéance du TTL.
+
+Les accès sont comptés dans CacheMetric sous le préfixe ``local:<clé>``, à
+côté des lectures du cache partagé (préfixe de la clé seule) : l'admin montre
+ainsi la part servie localement et celle servie par le cache partagé.
+"""
+
+import threading
+import time
+import weakref
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+
+from store.cache_metrics import record
+
+LOCAL_METRIC_PREFIX = "local:"
+
+_Entry = namedtuple("_Entry", "value tags stamp expires")
+
+_instances = weakref.WeakSet()
+
+
+class NearCache:
+    """LRU en mémoire du worker, validé par les versions d'étiquettes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        _instances.add(self)
+
+    @property
+    def ttl(self):
+        return getattr(settings, "NEAR_CACHE_TTL", 10)
+
+    @property
+    def max_entries(self):
+        return getattr(settings, "NEAR_CACHE_MAX_ENTRIES", 512)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, value, tags, stamp):
+        entry = _Entry(value, frozenset(tags), stamp, time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute, timeout, tags=(), remote=True):
+        """
+        Valeur locale si elle est fraîche, sinon cache partagé puis calcul.
+
+        Args:
+            key: Clé de cache
+            compute: Fonction sans argument calculant la valeur
+            timeout: Durée de vie dans le cache partagé (secondes)
+            tags: Étiquettes d'invalidation (voir store.cache_tags)
+            remote: False pour une valeur calculée localement sans cache
+                partagé (calcul pur, jamais invalidé)
+
+        Returns:
+            La valeur locale, partagée ou fraîchement calculée
+        """
+        from store.cache_tags import tag_stamp, tagged_key
+        from store.invalidation_bus import ensure_subscribed
+        from store.performance_utils import get_or_compute
+
+        ensure_subscribed()
+        start = time.perf_counter()
+        metric_key = f"{LOCAL_METRIC_PREFIX}{key}"
+
+        entry = self._get(key)
+        if entry is not None and entry.expires > time.monotonic():
+            record(metric_key, hits=1, get_time=time.perf_counter() - start)
+            return entry.value
+
+        stamp = tag_stamp(tags)
+        # Sans étiquette, seule une valeur purement locale reste valide
+        if entry is not None and (tags or not remote) and entry.stamp == stamp:
+            self._put(key, entry.value, tags, stamp)
+            record(metric_key, hits=1, get_time=time.perf_counter() - start)
+            return entry.value
+
+        record(metric_key, misses=1, get_time=time.perf_counter() - start)
+        if remote:
+            value = get_or_compute(tagged_key(key, tags, stamp), compute, timeout)
+        else:
+            value = compute()
+        self._put(key, value, tags, stamp)
+        return value
+
+    def discard_tags(self, tags):
+        """Retire les entrées portant l'une des étiquettes."""
+        tags = set(tags)
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry.tags & tags]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def discard_tags(tags):
+    """Retire les entrées étiquetées de tous les caches locaux du worker."""
+    return sum(near_cache.discard_tags(tags) for near_cache in list(_instances))
+
+
+def discard_all():
+    """Vide tous les caches locaux du worker."""
+    for near_cache in list(_instances):
+        near_cache.clear()
+
+
+near_cache = NearCache()
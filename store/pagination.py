@@ -0,0 +1,193 @@
+"""
+Pagination par curseur (keyset) pour les listes du catalogue et du compte.
+
+Au lieu d'OFFSET/LIMIT, chaque page filtre sur la clé de tri du dernier
+élément vu (plus l'identifiant pour départager). Le coût d'une page reste
+constant quelle que soit sa profondeur, et aucun COUNT n'est exécuté tant
+que le template n'accède pas à ``page.count``.
+
+Les jetons ``next_cursor`` / ``previous_cursor`` sont opaques et signés.
+Les colonnes de tri sont des champs du modèle ; les valeurs NULL d'une
+colonne nullable (``created_at``, ``date_ordered``) sont placées en fin de
+liste et encodées telles quelles dans le jeton.
+"""
+
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from django.utils.functional import cached_property
+
+CURSOR_SALT = "store.pagination.cursor"
+
+
+class KeysetPage:
+    """Page de résultats produite par KeysetPaginator."""
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    @cached_property
+    def next_cursor(self):
+        if not self.has_next:
+            return None
+        return self.paginator.encode_cursor(self.object_list[-1], "next")
+
+    @cached_property
+    def previous_cursor(self):
+        if not self.has_previous:
+            return None
+        return self.paginator.encode_cursor(self.object_list[0], "prev")
+
+    @cached_property
+    def count(self):
+        """Nombre total de résultats (COUNT exécuté uniquement à la demande)."""
+        return self.paginator.count
+
+
+class KeysetPaginator:
+    """
+    Paginator par curseur.
+
+    Args:
+        queryset: QuerySet à paginer
+        per_page: Nombre d'éléments par page
+        ordering: Champs de tri, ex. ("-created_at",) ; l'identifiant est
+            ajouté automatiquement comme critère de départage
+    """
+
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.model = queryset.model
+
+        fields = [field for field in ordering if field.lstrip("-") not in ("pk", "id")]
+        last_desc = fields[-1].startswith("-") if fields else True
+        fields.append("-pk" if last_desc else "pk")
+        self.ordering = [(field.lstrip("-"), field.startswith("-")) for field in fields]
+        self.nullable = {name for name, _ in self.ordering if self._field(name).null}
+
+    @cached_property
+    def count(self):
+        return self.queryset.count()
+
+    def _field(self, name):
+        if name == "pk":
+            return self.model._meta.pk
+        return self.model._meta.get_field(name)
+
+    def encode_cursor(self, obj, direction):
+        """Jeton opaque signé pointant sur ``obj``."""
+        values = [
+            (
+                None
+                if getattr(obj, self._field(name).attname) is None
+                else self._field(name).value_to_string(obj)
+            )
+            for name, _ in self.ordering
+        ]
+        return signing.dumps({"k": values, "d": direction}, salt=CURSOR_SALT)
+
+    def decode_cursor(self, cursor):
+        """
+        Décode un jeton ; retourne (valeurs, direction) ou (None, "next")
+        si le jeton est absent ou invalide.
+        """
+        if not cursor:
+            return None, "next"
+        try:
+            payload = signing.loads(cursor, salt=CURSOR_SALT)
+            values = [
+                None if value is None else self._field(name).to_python(value)
+                for (name, _), value in zip(self.ordering, payload["k"], strict=True)
+            ]
+            if any(
+                value is None and name not in self.nullable
+                for (name, _), value in zip(self.ordering, values)
+            ):
+                raise ValueError("clé nulle sur une colonne non nullable")
+        except (signing.BadSignature, KeyError, TypeError, ValueError, ValidationError):
+            return None, "next"
+        direction = "prev" if payload.get("d") == "prev" else "next"
+        return values, direction
+
+    def _after(self, values, reverse=False):
+        """
+        Condition « strictement après la clé » dans l'ordre (ou l'ordre inverse).
+
+        Les NULL sont en fin d'ordre : après une valeur viennent les valeurs
+        suivantes puis les NULL ; en sens inverse, les NULL viennent d'abord.
+        """
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, desc), value in zip(self.ordering, values):
+            descending = desc != reverse
+            lookup = f"{name}__lt" if descending else f"{name}__gt"
+            if value is None:
+                # NULL : rien après en sens direct, toutes les valeurs en sens inverse
+                after = Q(**{f"{name}__isnull": False}) if reverse else None
+                same = Q(**{f"{name}__isnull": True})
+            else:
+                after = Q(**{lookup: value})
+                if name in self.nullable and not reverse:
+                    after |= Q(**{f"{name}__isnull": True})
+                same = Q(**{name: value})
+            if after is not None:
+                condition |= equal & after
+            equal &= same
+        return condition
+
+    def _order_by(self, reverse=False):
+        ordering = []
+        for name, desc in self.ordering:
+            descending = desc != reverse
+            if name in self.nullable:
+                # NULL en fin de liste en sens direct, en tête en sens inverse
+                expression = F(name).desc if descending else F(name).asc
+                ordering.append(
+                    expression(nulls_first=True)
+                    if reverse
+                    else expression(nulls_last=True)
+                )
+            else:
+                ordering.append(f"-{name}" if descending else name)
+        return ordering
+
+    def get_page(self, cursor=None):
+        """
+        Retourne la page désignée par ``cursor`` (première page par défaut).
+
+        Returns:
+            KeysetPage: Page avec has_next/has_previous et les jetons voisins
+        """
+        values, direction = self.decode_cursor(cursor)
+        reverse = direction == "prev"
+
+        queryset = self.queryset.order_by(*self._order_by(reverse))
+        if values is not None:
+            queryset = queryset.filter(self._after(values, reverse))
+
+        rows = list(queryset[: self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+
+        if reverse:
+            rows.reverse()
+            return KeysetPage(rows, self, has_next=True, has_previous=has_more)
+        return KeysetPage(
+            rows, self, has_next=has_more, has_previous=values is not None
+        )
@@ -3,11 +3,226 @@ Utilitaires de performance pour les vues de la boutique.
 Fonctions de mise en cache et optimisations de requêtes.
 """
 
+import math
+import random
+import time
+import uuid
+
 from django.core.cache import cache
 from django.conf import settings
+from django.db import transaction
 from store.models import Product, Cart, Order
+from store import cache_codec
+from store.cache_tags import invalidate_tags, tagged_key
 from django.db.models import Prefetch
 
+CATALOG_VERSION_KEY = "catalog_version"
+INVENTORY_VERSION_KEY = "inventory_version"
+
+# Compteurs locaux : le cache peut être désactivé (DummyCache) ou propre au worker
+_local_catalog_version = 0
+_local_inventory_version = 0
+
+
+def get_catalog_version():
+    """
+    Retourne la version courante du catalogue.
+
+    Returns:
+        tuple: (version partagée dans le cache, version locale au processus)
+    """
+    from store.invalidation_bus import ensure_subscribed
+
+    # Les modifications faites par les autres serveurs arrivent par le canal
+    ensure_subscribed()
+    return cache.get(CATALOG_VERSION_KEY, 0), _local_catalog_version
+
+
+def bump_catalog_version():
+    """
+    Incrémente la version du catalogue après une écriture (produit,
+    catégorie). Les caches dérivés du catalogue se reconstruisent au prochain
+    accès.
+
+    Appliqué après le commit : un autre worker ne peut pas reconstruire un
+    index sous la nouvelle version à partir de données non validées.
+    """
+    transaction.on_commit(_apply_catalog_bump)
+
+
+def _apply_catalog_bump():
+    bump_local_catalog_version()
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.set(CATALOG_VERSION_KEY, 1, None)
+
+
+def bump_local_catalog_version():
+    """Invalide les caches dérivés du catalogue de ce seul worker."""
+    global _local_catalog_version
+
+    _local_catalog_version += 1
+
+
+def get_inventory_version():
+    """
+    Retourne la version de l'inventaire : tailles des variantes et
+    disponibilité (stock nul ou non). Une vente qui ne vide aucune variante
+    ne la change pas.
+
+    Returns:
+        tuple: (version partagée dans le cache, version locale au processus)
+    """
+    from store.invalidation_bus import ensure_subscribed
+
+    ensure_subscribed()
+    return cache.get(INVENTORY_VERSION_KEY, 0), _local_inventory_version
+
+
+def bump_inventory_version():
+    """
+    Incrémente la version de l'inventaire (variante créée, supprimée, rupture),
+    après le commit comme bump_catalog_version.
+    """
+    transaction.on_commit(_apply_inventory_bump)
+
+
+def _apply_inventory_bump():
+    bump_local_inventory_version()
+    try:
+        cache.incr(INVENTORY_VERSION_KEY)
+    except ValueError:
+        cache.set(INVENTORY_VERSION_KEY, 1, None)
+
+
+def bump_local_inventory_version():
+    """Invalide les index dérivés de l'inventaire de ce seul worker."""
+    global _local_inventory_version
+
+    _local_inventory_version += 1
+
+
+# Attente maximale d'un worker quand un autre calcule une clé absente (secondes),
+# par intervalles croissants de COMPUTE_POLL_FIRST à COMPUTE_POLL_MAX
+COMPUTE_LOCK_WAIT = 0.5
+COMPUTE_POLL_FIRST = 0.01
+COMPUTE_POLL_MAX = 0.1
+COMPUTE_LOCK_TIMEOUT = 30
+
+ENTRY_FIELDS = ("value", "delta", "expires")
+
+
+def _read_entry(key, codec):
+    """Enveloppe en cache, valeur décodée (None si absente ou illisible)."""
+    entry = cache.get(key)
+    if not isinstance(entry, dict) or any(field not in entry for field in ENTRY_FIELDS):
+        # Absente, ou valeur brute d'un ancien format : à recalculer
+        return None
+    if codec is not None:
+        try:
+            entry = dict(entry, value=codec.loads(entry["value"]))
+        except ValueError:
+            # Écrite par un autre déploiement : à recalculer
+            return None
+    return entry
+
+
+def _acquire_lock(lock_key):
+    """Jeton du verrou si ce worker l'obtient, None sinon."""
+    token = uuid.uuid4().hex
+    return token if cache.add(lock_key, token, COMPUTE_LOCK_TIMEOUT) else None
+
+
+def _release_lock(lock_key, token):
+    """Libère le verrou s'il porte encore notre jeton (il a pu expirer et
+    être repris par un autre worker pendant un calcul trop long)."""
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+def get_or_compute(
+    key, compute, timeout, stale_timeout=None, beta=1.0, tags=(), codec=None
+):
+    """
+    Lecture du cache protégée contre l'effet de meute (cache stampede).
+
+    - Verrou par clé partagé entre workers (``cache.add``) : un seul worker
+      recalcule une valeur expirée ou absente. Suppose un ``add`` atomique
+      (Redis, base de données) ; FileBasedCache ne le garantit pas.
+    - Recalcul anticipé probabiliste (XFetch) : plus l'échéance approche et
+      plus le calcul est long, plus un accès a de chances de recalculer avant
+      l'expiration.
+    - Valeur périmée servie pendant ``stale_timeout`` secondes après l'échéance
+      aux workers qui n'ont pas le verrou, pendant la revalidation.
+
+    Args:
+        key: Clé de cache
+        compute: Fonction sans argument qui calcule la valeur
+        timeout: Durée de fraîcheur (secondes)
+        stale_timeout: Durée supplémentaire pendant laquelle la valeur périmée
+            peut être servie (défaut : ``timeout``)
+        beta: Intensité du recalcul anticipé (0 = désactivé)
+        tags: Étiquettes d'invalidation (voir store.cache_tags)
+        codec: Sérialisation de la valeur (ex. store.cache_codec) à la place
+            du pickle du backend
+
+    Returns:
+        La valeur en cache ou fraîchement calculée
+    """
+    if stale_timeout is None:
+        stale_timeout = timeout
+    if tags:
+        key = tagged_key(key, tags)
+    lock_key = f"lock:{key}"
+
+    def refresh():
+        start = time.monotonic()
+        value = compute()
+        delta = time.monotonic() - start
+        stored = codec.dumps(value) if codec is not None else value
+        cache.set(
+            key,
+            {"value": stored, "delta": delta, "expires": time.time() + timeout},
+            timeout + stale_timeout,
+        )
+        return value
+
+    entry = _read_entry(key, codec)
+    if entry is not None:
+        # XFetch : échéance avancée de delta × beta × -ln(U), U uniforme dans ]0, 1]
+        early = entry["delta"] * beta * -math.log(1.0 - random.random())
+        if time.time() + early < entry["expires"]:
+            return entry["value"]
+
+        token = _acquire_lock(lock_key)
+        if token is None:
+            # Un autre worker revalide : servir la valeur périmée
+            return entry["value"]
+        try:
+            return refresh()
+        finally:
+            _release_lock(lock_key, token)
+
+    # Clé absente : un seul calcul, les autres attendent brièvement son résultat
+    token = _acquire_lock(lock_key)
+    if token is not None:
+        try:
+            return refresh()
+        finally:
+            _release_lock(lock_key, token)
+
+    deadline = time.monotonic() + COMPUTE_LOCK_WAIT
+    pause = COMPUTE_POLL_FIRST
+    while time.monotonic() + pause < deadline:
+        time.sleep(pause)
+        entry = _read_entry(key, codec)
+        if entry is not None:
+            return entry["value"]
+        pause = min(pause * 2, COMPUTE_POLL_MAX)
+    # Calcul trop long ou worker disparu : calculer sans attendre davantage
+    return compute()
+
 
 def get_featured_products(limit=10):
     """
@@ -17,23 +232,24 @@ def get_featured_products(limit=10):
         limit: Nombre de produits à retourner
 
     Returns:
-        QuerySet: Produits optimisés pour l'affichage
+        list: Produits optimisés pour l'affichage
     """
-    cache_key = f"featured_products_{limit}"
-    products = cache.get(cache_key)
 
-    if products is None:
-        products = (
+    def compute():
+        return list(
             Product.objects.only("id", "name", "slug", "price", "thumbnail")
-            .filter(variants__stock__gt=0)  # Seulement les produits en stock
-            .distinct()
+            .filter(is_in_stock=True)  # Seulement les produits en stock (indexé)
             .order_by("-created_at")[:limit]
         )
 
-        # Mise en cache pour 15 minutes
-        cache.set(cache_key, products, 60 * 15)
-
-    return products
+    # Mise en cache pour 15 minutes
+    return get_or_compute(
+        f"featured_products_{limit}",
+        compute,
+        60 * 15,
+        tags=("catalog", "inventory"),
+        codec=cache_codec,
+    )
 
 
 def get_cart_summary_cached(user):
@@ -49,19 +265,18 @@ def get_cart_summary_cached(user):
     if not user.is_authenticated:
         return {"orders": [], "total_items": 0, "total_price": 0, "is_empty": True}
 
-    cache_key = f"cart_summary_{user.id}"
-    cart_data = cache.get(cache_key)
-
-    if cart_data is None:
-        # Importer ici pour éviter les imports circulaires
-        from store.views import get_cart_summary
+    # Importer ici pour éviter les imports circulaires
+    from store.views import get_cart_summary
 
-        cart_data = get_cart_summary(user)
-
-        # Mise en cache courte (2 minutes) car le panier change fréquemment
-        cache.set(cache_key, cart_data, 60 * 2)
-
-    return cart_data
+    # Mise en cache courte (2 minutes) car le panier change fréquemment ;
+    # pas de valeur périmée : le panier doit refléter les dernières actions
+    return get_or_compute(
+        f"cart_summary_{user.id}",
+        lambda: get_cart_summary(user),
+        60 * 2,
+        stale_timeout=0,
+        tags=(f"cart:{user.id}", "catalog"),
+    )
 
 
 def invalidate_cart_cache(user):
@@ -73,8 +288,7 @@ def invalidate_cart_cache(user):
         user: Utilisateur Django
     """
     if user.is_authenticated:
-        cache_key = f"cart_summary_{user.id}"
-        cache.delete(cache_key)
+        invalidate_tags(f"cart:{user.id}")
 
 
 def get_optimized_cart_for_user(user):
@@ -117,10 +331,8 @@ def get_product_stats_cached(product_id):
     Returns:
         dict: Statistiques du produit
     """
-    cache_key = f"product_stats_{product_id}"
-    stats = cache.get(cache_key)
 
-    if stats is None:
+    def compute():
         from django.db.models import Count, Sum
 
         # Calculer les statistiques
@@ -129,17 +341,20 @@ def get_product_stats_cached(product_id):
             count=Count("id"), total_quantity=Sum("quantity")
         )
 
-        stats = {
+        return {
             "total_sales": total_orders["count"] or 0,
             "total_quantity_sold": total_orders["total_quantity"] or 0,
-            "stock_status": "en_stock" if product.stock > 0 else "epuise",
+            "stock_status": "en_stock" if product.is_in_stock else "epuise",
             "last_updated": product.updated_at,
         }
 
-        # Cache plus long pour les stats (30 minutes)
-        cache.set(cache_key, stats, 60 * 30)
-
-    return stats
+    # Cache plus long pour les stats (30 minutes)
+    return get_or_compute(
+        f"product_stats_{product_id}",
+        compute,
+        60 * 30,
+        tags=(f"product:{product_id}", f"sales:{product_id}"),
+    )
 
 
 # Décorateur pour mesurer les performances des vues
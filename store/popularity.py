@@ -0,0 +1,180 @@
+"""
+Popularité des produits à partir des ventes et des consultations.
+
+Les événements incrémentent des compteurs en attente sur le produit
+(``pending_sales``, ``pending_views``) : une requête UPDATE par produit pour
+les ventes, et un tampon par worker vidé par lots pour les consultations.
+Chaque worker vide lui-même son tampon : tous les ``VIEW_FLUSH_COUNT`` vues,
+au plus ``VIEW_FLUSH_SECONDS`` après une vue (minuteur) et à l'arrêt du
+processus. ``update_popularity`` ne voit que les vues déjà écrites.
+``update_popularity`` replie périodiquement ces compteurs dans
+``popularity_score`` (colonne indexée) avec une décroissance exponentielle :
+
+    score = score × 0,5^(écoulé / demi-vie) + ventes × SALE_WEIGHT + vues × VIEW_WEIGHT
+
+Le score mesure donc la demande récente ; l'accueil, le tri « popularité » de
+la boutique et les pages catégorie le lisent directement.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.db import connection
+from django.db.models import ExpressionWrapper, F, FloatField
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+POPULARITY_HALF_LIFE_HOURS = 72
+
+SALE_WEIGHT = 10.0
+VIEW_WEIGHT = 1.0
+
+# Le tampon des consultations est vidé tous les N vues ou toutes les N secondes
+VIEW_FLUSH_COUNT = 50
+VIEW_FLUSH_SECONDS = 60
+
+_lock = threading.Lock()
+_pending_views = Counter()
+_last_flush = time.monotonic()
+_flush_timer = None
+
+
+def _increment(field, counts):
+    """Ajoute des quantités à un compteur : une requête par quantité distincte."""
+    from store.models import Product
+
+    by_amount = {}
+    for product_id, amount in counts.items():
+        by_amount.setdefault(amount, []).append(product_id)
+
+    for amount, product_ids in by_amount.items():
+        Product.objects.filter(id__in=product_ids).update(**{field: F(field) + amount})
+
+
+def record_sales(orders):
+    """
+    Compte les ventes d'une commande finalisée.
+
+    Args:
+        orders: Lignes Order payées (product_id et quantity)
+    """
+    quantities = Counter()
+    for order in orders:
+        quantities[order.product_id] += order.quantity
+    _increment("pending_sales", quantities)
+
+
+def record_view(product_id):
+    """Compte une consultation de fiche produit (tampon du worker)."""
+    with _lock:
+        _pending_views[product_id] += 1
+        due = (
+            sum(_pending_views.values()) >= VIEW_FLUSH_COUNT
+            or time.monotonic() - _last_flush >= VIEW_FLUSH_SECONDS
+        )
+        if not due:
+            _schedule_flush()
+    if due:
+        flush_views()
+
+
+def _schedule_flush():
+    """Minuteur du worker : les vues sont écrites même sans vue suivante."""
+    global _flush_timer
+
+    # Appelée sous _lock ; après un fork, le minuteur du parent n'existe plus
+    if _flush_timer is not None and _flush_timer.is_alive():
+        return
+    _flush_timer = threading.Timer(VIEW_FLUSH_SECONDS, _flush_in_background)
+    _flush_timer.daemon = True
+    _flush_timer.start()
+
+
+def _flush_in_background():
+    try:
+        flush_views()
+    except Exception as e:
+        logger.error("Écriture des consultations en attente impossible: %s", e)
+    finally:
+        # Connexion propre au thread du minuteur
+        connection.close()
+
+
+@atexit.register
+def _flush_at_exit():
+    if not _pending_views:
+        return
+    try:
+        flush_views()
+    except Exception as e:
+        logger.error("Consultations en attente perdues à l'arrêt: %s", e)
+
+
+def flush_views():
+    """
+    Écrit les consultations en attente du worker.
+
+    Returns:
+        int: Nombre de consultations écrites
+    """
+    global _pending_views, _last_flush
+
+    with _lock:
+        counts, _pending_views = _pending_views, Counter()
+        _last_flush = time.monotonic()
+
+    _increment("pending_views", counts)
+    return sum(counts.values())
+
+
+def decay_factor(elapsed_seconds):
+    """Facteur de décroissance pour une durée écoulée."""
+    return 0.5 ** (max(elapsed_seconds, 0) / (POPULARITY_HALF_LIFE_HOURS * 3600))
+
+
+def fold_popularity(now=None):
+    """
+    Replie les compteurs en attente dans popularity_score.
+
+    Chaque UPDATE lit et remet à zéro les compteurs dans la même instruction :
+    un incrément concurrent est soit replié, soit conservé pour le suivant.
+
+    Returns:
+        int: Nombre de produits mis à jour
+    """
+    from store.models import Product
+
+    now = now or timezone.now()
+    # Tampon de ce processus seulement : les workers vident le leur eux-mêmes
+    flush_views()
+
+    updated = 0
+    stamps = (
+        Product.objects.order_by()
+        .values_list("popularity_updated_at", flat=True)
+        .distinct()
+    )
+    for stamp in list(stamps):
+        if stamp is None:
+            products, decay = Product.objects.filter(popularity_updated_at=None), 1.0
+        else:
+            products = Product.objects.filter(popularity_updated_at=stamp)
+            decay = decay_factor((now - stamp).total_seconds())
+
+        updated += products.update(
+            popularity_score=ExpressionWrapper(
+                F("popularity_score") * decay
+                + F("pending_sales") * SALE_WEIGHT
+                + F("pending_views") * VIEW_WEIGHT,
+                output_field=FloatField(),
+            ),
+            pending_sales=0,
+            pending_views=0,
+            popularity_updated_at=now,
+        )
+
+    return updated
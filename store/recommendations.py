@@ -0,0 +1,320 @@
+"""
+Recommandations « achetés ensemble » construites depuis l'historique des commandes.
+
+Un panier est l'ensemble des produits commandés (``ordered=True``) par un
+utilisateur le même jour. Les lignes sont lues en flux, triées par
+utilisateur et date ; les paires de chaque lot de paniers sont comptées de
+façon vectorisée (NumPy si disponible), puis ajoutées en base par upsert
+dans ``CoPurchaseCount`` (matrice creuse de co-occurrence). La mémoire reste
+bornée : au plus ``MAX_PENDING_PAIRS`` paires distinctes en attente.
+
+Les ``BOUGHT_TOGETHER_STORED`` meilleurs voisins de chaque produit touché
+sont ensuite recopiés dans ``BoughtTogether``, lu par la fiche produit et
+le panier. Chaque passage enregistre le dernier jour compté
+(``CoPurchaseRun``) : le passage quotidien ne lit que les nouveaux jours.
+
+Les jours sont traités par lots de ``DAYS_PER_COMMIT``, chacun dans sa
+propre transaction avec la mise à jour de ``CoPurchaseRun`` : les verrous
+restent courts et un passage interrompu reprend après le dernier lot validé.
+"""
+
+import heapq
+from collections import Counter
+from datetime import datetime, time, timedelta
+from itertools import combinations
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, Min, OuterRef, Q, Sum
+from django.utils import timezone
+
+try:
+    import numpy as np
+except ImportError:  # Dépendance optionnelle
+    np = None
+
+# Voisins conservés par produit
+BOUGHT_TOGETHER_STORED = 12
+
+# Au-delà, un panier (commande en gros) ne compte que ses premiers produits
+MAX_BASKET_SIZE = 50
+
+STREAM_CHUNK_SIZE = 5000
+BASKETS_PER_BATCH = 10_000
+MAX_PENDING_PAIRS = 200_000
+
+# Jours d'achats comptés par transaction
+DAYS_PER_COMMIT = 30
+
+
+def day_start(day):
+    """Début de journée (heure locale) utilisable dans un filtre sur date_ordered."""
+    start = datetime.combine(day, time.min)
+    return timezone.make_aware(start) if settings.USE_TZ else start
+
+
+def iter_baskets(start=None, end=None):
+    """
+    Parcourt en flux les paniers, jour ``start`` inclus, jour ``end`` exclu.
+
+    Yields:
+        list: Identifiants des produits distincts d'un panier (au moins deux)
+    """
+    from store.models import Order
+
+    queryset = Order.objects.filter(ordered=True, date_ordered__isnull=False)
+    if start is not None:
+        queryset = queryset.filter(date_ordered__gte=day_start(start))
+    if end is not None:
+        queryset = queryset.filter(date_ordered__lt=day_start(end))
+
+    rows = (
+        queryset.order_by("user_id", "date_ordered")
+        .values_list("user_id", "date_ordered", "product_id")
+        .iterator(chunk_size=STREAM_CHUNK_SIZE)
+    )
+
+    current, products = None, set()
+    for user_id, date_ordered, product_id in rows:
+        if timezone.is_aware(date_ordered):
+            key = (user_id, timezone.localdate(date_ordered))
+        else:
+            key = (user_id, date_ordered.date())
+        if key != current:
+            if len(products) > 1:
+                yield sorted(products)[:MAX_BASKET_SIZE]
+            current, products = key, set()
+        products.add(product_id)
+
+    if len(products) > 1:
+        yield sorted(products)[:MAX_BASKET_SIZE]
+
+
+def count_pairs(baskets):
+    """
+    Compte les paires (a, b), a < b, d'un lot de paniers triés.
+
+    Returns:
+        Counter: {(a, b): nombre de paniers}
+    """
+    if np is None:
+        counts = Counter()
+        for basket in baskets:
+            counts.update(combinations(basket, 2))
+        return counts
+
+    firsts, seconds = [], []
+    for basket in baskets:
+        ids = np.asarray(basket, dtype=np.int64)
+        i, j = np.triu_indices(len(ids), 1)
+        firsts.append(ids[i])
+        seconds.append(ids[j])
+    if not firsts:
+        return Counter()
+
+    # Une paire = un entier 64 bits (a << 32 | b) : comptage par np.unique
+    keys = (np.concatenate(firsts) << 32) | np.concatenate(seconds)
+    unique, counts = np.unique(keys, return_counts=True)
+    return Counter(
+        {
+            (int(key >> 32), int(key & 0xFFFFFFFF)): int(count)
+            for key, count in zip(unique, counts)
+        }
+    )
+
+
+def flush_pairs(pairs):
+    """Ajoute des comptages à CoPurchaseCount (upsert additif)."""
+    from store.models import CoPurchaseCount
+
+    table = connection.ops.quote_name(CoPurchaseCount._meta.db_table)
+    insert = (
+        f"INSERT INTO {table} (product_a_id, product_b_id, count) VALUES (%s, %s, %s)"
+    )
+    if connection.vendor == "mysql":
+        sql = f"{insert} ON DUPLICATE KEY UPDATE count = count + VALUES(count)"
+    else:
+        sql = (
+            f"{insert} ON CONFLICT (product_a_id, product_b_id) "
+            f"DO UPDATE SET count = {table}.count + excluded.count"
+        )
+
+    rows = [(a, b, count) for (a, b), count in pairs.items()]
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), 1000):
+            cursor.executemany(sql, rows[start : start + 1000])
+
+
+def store_bought_together(product_ids, limit=BOUGHT_TOGETHER_STORED, batch_size=200):
+    """
+    Recopie le top-K des voisins des produits donnés dans BoughtTogether.
+
+    Returns:
+        int: Nombre de lignes écrites
+    """
+    from store.models import BoughtTogether, CoPurchaseCount
+
+    product_ids = sorted(set(product_ids))
+    written = 0
+
+    for start in range(0, len(product_ids), batch_size):
+        chunk = product_ids[start : start + batch_size]
+        heaps = {pk: [] for pk in chunk}
+
+        def push(pk, other, count):
+            # Tas borné à ``limit`` éléments par produit
+            entry = (count, -other)
+            if len(heaps[pk]) < limit:
+                heapq.heappush(heaps[pk], entry)
+            elif entry > heaps[pk][0]:
+                heapq.heapreplace(heaps[pk], entry)
+
+        rows = (
+            CoPurchaseCount.objects.filter(
+                Q(product_a_id__in=chunk) | Q(product_b_id__in=chunk)
+            )
+            .values_list("product_a_id", "product_b_id", "count")
+            .iterator(chunk_size=STREAM_CHUNK_SIZE)
+        )
+        for a, b, count in rows:
+            if a in heaps:
+                push(a, b, count)
+            if b in heaps:
+                push(b, a, count)
+
+        links = [
+            BoughtTogether(product_id=pk, other_id=-neg_id, rank=rank, count=count)
+            for pk, heap in heaps.items()
+            for rank, (count, neg_id) in enumerate(sorted(heap, reverse=True), 1)
+        ]
+        BoughtTogether.objects.filter(product_id__in=chunk).delete()
+        BoughtTogether.objects.bulk_create(links, batch_size=1000)
+        written += len(links)
+
+    return written
+
+
+def first_order_day():
+    """Jour du premier achat, ou None s'il n'y en a aucun."""
+    from store.models import Order
+
+    first = Order.objects.filter(ordered=True, date_ordered__isnull=False).aggregate(
+        first=Min("date_ordered")
+    )["first"]
+    if first is None:
+        return None
+    return timezone.localdate(first) if timezone.is_aware(first) else first.date()
+
+
+def count_baskets(start, end):
+    """
+    Compte les paniers des jours ``start`` (inclus) à ``end`` (exclu) et
+    met à jour les voisins des produits touchés.
+
+    Returns:
+        tuple: (paniers lus, paires mises à jour)
+    """
+    affected = set()
+    pending = Counter()
+    batch = []
+    baskets = pairs = 0
+
+    def flush():
+        nonlocal pairs, pending
+        flush_pairs(pending)
+        for a, b in pending:
+            affected.update((a, b))
+        pairs += len(pending)
+        pending = Counter()
+
+    for basket in iter_baskets(start, end):
+        batch.append(basket)
+        baskets += 1
+        if len(batch) >= BASKETS_PER_BATCH:
+            pending.update(count_pairs(batch))
+            batch = []
+            if len(pending) >= MAX_PENDING_PAIRS:
+                flush()
+
+    pending.update(count_pairs(batch))
+    flush()
+    store_bought_together(affected)
+    return baskets, pairs
+
+
+def build_copurchases(full=False, today=None):
+    """
+    Compte les paniers des jours pas encore traités (jusqu'à hier inclus).
+
+    Une reconstruction complète remet les comptages à zéro puis remplace les
+    voisins au fil des lots : la fiche produit garde les anciens en attendant.
+
+    Args:
+        full: Tout recalculer depuis le premier achat
+        today: Jour courant (exclu, car incomplet) ; par défaut aujourd'hui
+
+    Returns:
+        CoPurchaseRun ou None si aucun nouveau jour n'est à traiter
+    """
+    from store.models import BoughtTogether, CoPurchaseCount, CoPurchaseRun
+
+    end = today or timezone.localdate()
+    last_run = None if full else CoPurchaseRun.objects.first()
+    if last_run is not None:
+        start = last_run.processed_through + timedelta(days=1)
+        if start >= end:
+            return None
+    else:
+        # Les marqueurs sont supprimés avec les comptages : une reprise après
+        # interruption repart du dernier lot de cette reconstruction
+        with transaction.atomic():
+            CoPurchaseCount.objects.all().delete()
+            CoPurchaseRun.objects.all().delete()
+        start = min(first_order_day() or end, end - timedelta(days=1))
+
+    run = CoPurchaseRun(baskets=0, pairs=0)
+    while start < end:
+        stop = min(start + timedelta(days=DAYS_PER_COMMIT), end)
+        with transaction.atomic():
+            baskets, pairs = count_baskets(start, stop)
+            run.baskets += baskets
+            run.pairs += pairs
+            run.processed_through = stop - timedelta(days=1)
+            run.save()
+        start = stop
+
+    if last_run is None:
+        # Voisins dont la paire n'existe plus après la reconstruction
+        BoughtTogether.objects.exclude(
+            Exists(
+                CoPurchaseCount.objects.filter(
+                    Q(product_a=OuterRef("product"), product_b=OuterRef("other"))
+                    | Q(product_a=OuterRef("other"), product_b=OuterRef("product"))
+                )
+            )
+        ).delete()
+
+    return run
+
+
+def cart_recommendations(product_ids, limit=4):
+    """
+    Produits souvent achetés avec le contenu du panier (hors panier).
+
+    Returns:
+        QuerySet: Produits en stock, les plus co-achetés d'abord
+    """
+    from store.models import Product
+
+    product_ids = list(product_ids)
+    if not product_ids:
+        return Product.objects.none()
+
+    return (
+        Product.objects.filter(
+            bought_with__product_id__in=product_ids, is_in_stock=True
+        )
+        .exclude(id__in=product_ids)
+        .annotate(together=Sum("bought_with__count"))
+        .order_by("-together", "id")[:limit]
+    )
@@ -0,0 +1,230 @@
+"""
+Index de recherche plein texte pour le catalogue.
+
+PostgreSQL : colonne ``search_vector`` (tsvector) indexée en GIN sur
+``store_product``. SQLite : table virtuelle FTS5 ``store_product_fts`` dont le
+rowid est l'identifiant du produit. Les deux index couvrent le nom, la
+description et le nom de la catégorie, et sont tenus à jour depuis les signaux
+de ``store.models``.
+
+Sur un autre moteur (MySQL), la recherche retombe sur ``icontains``.
+"""
+
+import logging
+import re
+
+from django.db import connection
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+# Configuration linguistique PostgreSQL (stemming français)
+SEARCH_CONFIG = "french"
+
+# Nombre maximal de résultats classés remontés par l'index SQLite
+SQLITE_MAX_RESULTS = 1000
+
+FTS_TABLE = "store_product_fts"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+_PG_DOCUMENT_SQL = """
+    setweight(to_tsvector(%s::regconfig, coalesce(p.name, '')), 'A')
+    || setweight(to_tsvector(%s::regconfig, coalesce(c.name, '')), 'B')
+    || setweight(to_tsvector(%s::regconfig, coalesce(p.description, '')), 'C')
+"""
+
+
+def backend():
+    """Retourne le moteur d'index utilisable : 'postgresql', 'sqlite' ou None."""
+    if connection.vendor in ("postgresql", "sqlite"):
+        return connection.vendor
+    return None
+
+
+def tokenize(query):
+    """Découpe une saisie utilisateur en mots sûrs (sans syntaxe FTS)."""
+    return [token.lower() for token in _TOKEN_RE.findall(query or "")][:10]
+
+
+def ensure_index():
+    """
+    Crée la table FTS5 si elle n'existe pas encore (SQLite uniquement).
+    Utile en développement et dans les tests lancés sans migrations.
+    """
+    if backend() != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "name, description, category_name, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+
+
+def index_products(product_ids):
+    """
+    Met à jour l'index pour les produits donnés.
+
+    Args:
+        product_ids: Identifiants des produits à (ré)indexer
+    """
+    product_ids = [int(pk) for pk in product_ids]
+    engine = backend()
+    if not product_ids or engine is None:
+        return
+
+    placeholders = ", ".join(["%s"] * len(product_ids))
+    with connection.cursor() as cursor:
+        if engine == "postgresql":
+            cursor.execute(
+                f"""
+                UPDATE store_product AS p
+                SET search_vector = {_PG_DOCUMENT_SQL}
+                FROM store_product AS p2
+                LEFT JOIN store_category AS c ON c.id = p2.category_id
+                WHERE p.id = p2.id AND p.id IN ({placeholders})
+                """,
+                [SEARCH_CONFIG] * 3 + product_ids,
+            )
+        else:
+            ensure_index()
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})",
+                product_ids,
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO {FTS_TABLE} (rowid, name, description, category_name)
+                SELECT p.id, p.name, coalesce(p.description, ''), coalesce(c.name, '')
+                FROM store_product AS p
+                LEFT JOIN store_category AS c ON c.id = p.category_id
+                WHERE p.id IN ({placeholders})
+                """,
+                product_ids,
+            )
+
+
+def remove_products(product_ids):
+    """Retire des produits supprimés de l'index SQLite."""
+    product_ids = [int(pk) for pk in product_ids]
+    if not product_ids or backend() != "sqlite":
+        # Sur PostgreSQL, la colonne disparaît avec la ligne
+        return
+
+    ensure_index()
+    placeholders = ", ".join(["%s"] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", product_ids
+        )
+
+
+def rebuild_index():
+    """
+    Reconstruit entièrement l'index.
+
+    Returns:
+        int: Nombre de produits indexés
+    """
+    engine = backend()
+    if engine is None:
+        return 0
+
+    with connection.cursor() as cursor:
+        if engine == "postgresql":
+            cursor.execute(
+                f"""
+                UPDATE store_product AS p
+                SET search_vector = {_PG_DOCUMENT_SQL}
+                FROM store_product AS p2
+                LEFT JOIN store_category AS c ON c.id = p2.category_id
+                WHERE p.id = p2.id
+                """,
+                [SEARCH_CONFIG] * 3,
+            )
+        else:
+            ensure_index()
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(
+                f"""
+                INSERT INTO {FTS_TABLE} (rowid, name, description, category_name)
+                SELECT p.id, p.name, coalesce(p.description, ''), coalesce(c.name, '')
+                FROM store_product AS p
+                LEFT JOIN store_category AS c ON c.id = p.category_id
+                """
+            )
+        return cursor.rowcount
+
+
+def search_products(queryset, query):
+    """
+    Filtre un QuerySet de produits par pertinence.
+
+    Le QuerySet retourné est annoté avec ``search_rank`` (plus élevé = plus
+    pertinent) et déjà trié par pertinence ; un ``order_by`` ultérieur
+    remplace ce tri.
+
+    Args:
+        queryset: QuerySet de Product à filtrer
+        query: Saisie de l'utilisateur
+
+    Returns:
+        QuerySet: Produits correspondants, classés par pertinence
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return queryset
+
+    engine = backend()
+
+    if engine == "postgresql":
+        tsquery = " & ".join(f"{token}:*" for token in tokens)
+        match_sql = "store_product.search_vector @@ to_tsquery(%s::regconfig, %s)"
+        return (
+            queryset.filter(
+                id__in=RawSQL(
+                    f"SELECT id FROM store_product WHERE {match_sql}",
+                    (SEARCH_CONFIG, tsquery),
+                )
+            )
+            .annotate(
+                search_rank=RawSQL(
+                    "ts_rank(store_product.search_vector, "
+                    "to_tsquery(%s::regconfig, %s))",
+                    (SEARCH_CONFIG, tsquery),
+                    output_field=FloatField(),
+                )
+            )
+            .order_by("-search_rank", "-created_at")
+        )
+
+    if engine == "sqlite":
+        ensure_index()
+        match = " ".join(f'"{token}"*' for token in tokens)
+        with connection.cursor() as cursor:
+            # bm25() : plus petit = plus pertinent ; poids nom > catégorie > description
+            cursor.execute(
+                f"SELECT rowid, bm25({FTS_TABLE}, 10.0, 2.0, 5.0) AS score "
+                f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY score LIMIT %s",
+                [match, SQLITE_MAX_RESULTS],
+            )
+            ranked = cursor.fetchall()
+
+        if not ranked:
+            return queryset.none()
+
+        rank_case = Case(
+            *[When(id=pk, then=Value(-score)) for pk, score in ranked],
+            output_field=FloatField(),
+        )
+        return (
+            queryset.filter(id__in=[pk for pk, _ in ranked])
+            .annotate(search_rank=rank_case)
+            .order_by("-search_rank", "-created_at")
+        )
+
+    # Moteur sans index dédié : ancien comportement
+    return queryset.filter(Q(name__icontains=query) | Q(description__icontains=query))
@@ -0,0 +1,205 @@
+"""
+Produits similaires précalculés.
+
+Le score entre deux produits combine la catégorie, la proximité de prix et
+les mots communs du nom. Les candidats d'un produit sont limités à sa
+catégorie, aux produits partageant un mot du nom et à ses voisins de prix :
+aucune comparaison de tous les produits deux à deux.
+
+Les meilleurs voisins sont stockés dans ``SimilarProduct`` ; ``product_detail``
+les lit par une seule requête sur l'index (product, rank). La table est
+construite par ``build_similar_products`` puis recalculée partiellement
+quand le nom, le prix ou la catégorie d'un produit change : une fois par
+transaction pour tous les produits modifiés, et seulement pour ces produits et
+ceux qui les listaient. Un produit qui devient proche d'un autre sans y figurer
+encore n'y apparaît qu'à la reconstruction complète (commande planifiée).
+"""
+
+import bisect
+import heapq
+import logging
+import threading
+
+from django.db import transaction
+
+from store.suggestions import split_words
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+# Voisins stockés par produit (la fiche n'affiche que ceux en stock)
+SIMILAR_PRODUCTS_STORED = 12
+
+# Voisins de prix examinés de part et d'autre dans la liste triée par prix
+PRICE_NEIGHBOURS = 20
+
+CATEGORY_WEIGHT = 3.0
+PRICE_WEIGHT = 2.0
+NAME_WEIGHT = 2.0
+
+# Champs dont la modification change les voisins d'un produit
+SIMILARITY_FIELDS = {"name", "price", "category", "category_id"}
+
+
+def name_tokens(name):
+    """Mots significatifs du nom (3 lettres et plus, sans accents)."""
+    return frozenset(word for word in split_words(name) if len(word) >= 3)
+
+
+class SimilarityModel:
+    """Catalogue chargé une fois en mémoire pour le calcul des voisins."""
+
+    def __init__(self, rows):
+        """
+        Args:
+            rows: Tuples (id, category_id, price, name) des produits
+        """
+        self.products = {}
+        self.by_category = {}
+        self.by_token = {}
+
+        for pk, category_id, price, name in rows:
+            tokens = name_tokens(name)
+            self.products[pk] = (category_id, float(price), tokens)
+            if category_id is not None:
+                self.by_category.setdefault(category_id, set()).add(pk)
+            for token in tokens:
+                self.by_token.setdefault(token, set()).add(pk)
+
+        self.price_order = sorted(
+            (price, pk) for pk, (_, price, _) in self.products.items()
+        )
+
+    @classmethod
+    def load(cls):
+        from store.models import Product
+
+        return cls(
+            Product.objects.order_by().values_list("id", "category_id", "price", "name")
+        )
+
+    def score(self, pk, other):
+        category_a, price_a, tokens_a = self.products[pk]
+        category_b, price_b, tokens_b = self.products[other]
+
+        score = 0.0
+        if category_a is not None and category_a == category_b:
+            score += CATEGORY_WEIGHT
+        highest = max(price_a, price_b)
+        if highest > 0:
+            score += PRICE_WEIGHT * (1 - abs(price_a - price_b) / highest)
+        if tokens_a and tokens_b:
+            score += NAME_WEIGHT * len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+        return score
+
+    def candidates(self, pk):
+        category_id, price, tokens = self.products[pk]
+        candidates = set(self.by_category.get(category_id, ()))
+        for token in tokens:
+            candidates |= self.by_token[token]
+
+        position = bisect.bisect_left(self.price_order, (price, pk))
+        for _, other in self.price_order[
+            max(0, position - PRICE_NEIGHBOURS) : position + PRICE_NEIGHBOURS + 1
+        ]:
+            candidates.add(other)
+
+        candidates.discard(pk)
+        return candidates
+
+    def neighbours(self, pk, limit=SIMILAR_PRODUCTS_STORED):
+        """
+        Returns:
+            list: [(identifiant, score)] du plus au moins similaire
+        """
+        scored = ((self.score(pk, other), -other) for other in self.candidates(pk))
+        return [(-neg_id, score) for score, neg_id in heapq.nlargest(limit, scored)]
+
+
+def store_neighbours(model, product_ids):
+    """
+    Remplace les voisins stockés des produits donnés.
+
+    Returns:
+        int: Nombre de lignes écrites
+    """
+    from store.models import SimilarProduct
+
+    product_ids = [pk for pk in product_ids if pk in model.products]
+    rows = [
+        SimilarProduct(product_id=pk, similar_id=other, rank=rank, score=score)
+        for pk in product_ids
+        for rank, (other, score) in enumerate(model.neighbours(pk), 1)
+    ]
+
+    with transaction.atomic():
+        SimilarProduct.objects.filter(product_id__in=product_ids).delete()
+        SimilarProduct.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def rebuild_similar_products(batch_size=500):
+    """
+    Recalcule la table complète, par lots de produits.
+
+    Returns:
+        int: Nombre de lignes écrites
+    """
+    model = SimilarityModel.load()
+    product_ids = sorted(model.products)
+    written = 0
+    for start in range(0, len(product_ids), batch_size):
+        written += store_neighbours(model, product_ids[start : start + batch_size])
+    return written
+
+
+def refresh_similar_products(product_ids):
+    """
+    Recalcul incrémental après modification de produits : les produits
+    eux-mêmes et ceux qui les listaient déjà.
+
+    Returns:
+        int: Nombre de lignes écrites
+    """
+    from store.models import SimilarProduct
+
+    model = SimilarityModel.load()
+    affected = {pk for pk in product_ids if pk in model.products}
+    affected |= set(
+        SimilarProduct.objects.filter(similar_id__in=product_ids).values_list(
+            "product_id", flat=True
+        )
+    )
+    return store_neighbours(model, sorted(affected))
+
+
+def _pending():
+    if not hasattr(_local, "product_ids"):
+        _local.product_ids = set()
+    return _local.product_ids
+
+
+def _flush_pending():
+    product_ids = _pending()
+    if not product_ids:
+        return
+    # Vider avant le calcul : les rappels suivants de la transaction sont sans effet
+    pending = sorted(product_ids)
+    product_ids.clear()
+    try:
+        refresh_similar_products(pending)
+    except Exception as e:
+        logger.error("Erreur calcul produits similaires %s: %s", pending, e)
+
+
+def queue_similarity_refresh(product_ids):
+    """
+    Programme le recalcul des voisins après le commit.
+
+    Tous les produits modifiés dans une même transaction (import, édition en
+    masse dans l'admin) sont recalculés ensemble : le catalogue n'est chargé
+    qu'une fois.
+    """
+    _pending().update(product_ids)
+    transaction.on_commit(_flush_pending)
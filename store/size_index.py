@@ -0,0 +1,104 @@
+"""
+Index inversé taille -> produits disponibles.
+
+Chaque worker lit une fois les variantes (produit, taille, stock) et garde :
+- pour chaque taille, l'ensemble des produits qui l'ont en stock ;
+- pour chaque produit, la liste ordonnée de ses tailles avec leur
+  disponibilité (matrice affichée sur les cartes du listing).
+
+L'index sert la liste des tailles proposées, la matrice des cartes et les
+ids passés à l'index NumPy du catalogue. En SQL, le filtre « taille » de
+``product_list`` reste une sous-requête ``EXISTS`` sur les variantes en
+stock, sans liste d'ids. L'index est reconstruit quand la version de l'inventaire
+change (variante créée, supprimée, renommée, ou passée en rupture / remise
+en stock) ; les ventes qui ne vident pas une variante ne le touchent pas.
+"""
+
+import logging
+import threading
+
+from store.performance_utils import get_inventory_version
+
+logger = logging.getLogger(__name__)
+
+# Ordre d'affichage des tailles de vêtements ; les autres (pointures...) suivent
+SIZE_ORDER = ("XXS", "XS", "S", "M", "L", "XL", "XXL", "XXXL")
+
+_lock = threading.Lock()
+_index = None
+
+
+def size_sort_key(size):
+    """Clé de tri : tailles lettres, puis numériques croissantes, puis le reste."""
+    normalized = size.strip().upper()
+    if normalized in SIZE_ORDER:
+        return (0, SIZE_ORDER.index(normalized), "")
+    try:
+        return (1, float(normalized.replace(",", ".")), "")
+    except ValueError:
+        return (2, 0, normalized)
+
+
+class SizeIndex:
+    """Disponibilité des tailles par produit et produits par taille."""
+
+    def __init__(self, rows, version=None):
+        """
+        Args:
+            rows: Tuples (product_id, size, stock) des variantes
+            version: Version du catalogue au moment de la construction
+        """
+        self.version = version
+        self.products_by_size = {}
+        product_sizes = {}
+
+        for product_id, size, stock in rows:
+            available = stock > 0
+            product_sizes.setdefault(product_id, {})[size] = available
+            if available:
+                self.products_by_size.setdefault(size, set()).add(product_id)
+
+        self.sizes = sorted(
+            {size for sizes in product_sizes.values() for size in sizes},
+            key=size_sort_key,
+        )
+        self.matrix = {
+            product_id: [
+                (size, sizes[size]) for size in sorted(sizes, key=size_sort_key)
+            ]
+            for product_id, sizes in product_sizes.items()
+        }
+
+    @classmethod
+    def build(cls):
+        from store.models import ProductVariant
+
+        version = get_inventory_version()
+        rows = ProductVariant.objects.order_by().values_list(
+            "product_id", "size", "stock"
+        )
+        return cls(list(rows), version)
+
+    def product_ids(self, size):
+        """Identifiants des produits ayant ``size`` en stock."""
+        return self.products_by_size.get(size, set())
+
+    def availability(self, product_id):
+        """Matrice d'une carte produit : [(taille, disponible)] ordonnée."""
+        return self.matrix.get(product_id, [])
+
+
+def get_size_index():
+    """Retourne l'index du worker, reconstruit si le catalogue a changé."""
+    global _index
+
+    version = get_inventory_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+
+    with _lock:
+        if _index is None or _index.version != version:
+            _index = SizeIndex.build()
+            logger.info("Index des tailles reconstruit: %s tailles", len(_index.sizes))
+        return _index
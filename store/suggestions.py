@@ -0,0 +1,219 @@
+"""
+Index de suggestions tolérant aux fautes de frappe.
+
+Construit en mémoire (par worker) à partir des noms de produits et de
+catégories actives : une liste triée de mots pour les préfixes (bisect) et
+un BK-tree sur la distance de Levenshtein pour les mots mal orthographiés.
+Une fois construit, il répond sans toucher à la base ; il est reconstruit
+quand la version du catalogue change.
+"""
+
+import bisect
+import logging
+import threading
+import unicodedata
+
+from django.urls import reverse
+
+from store.performance_utils import get_catalog_version
+
+logger = logging.getLogger(__name__)
+
+MAX_SUGGESTIONS = 8
+
+_lock = threading.Lock()
+_index = None
+
+
+def normalize(text):
+    """Minuscules sans accents, pour comparer « Robe d'été » et « robe dete »."""
+    text = unicodedata.normalize("NFKD", str(text or "").lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def split_words(text):
+    """Mots normalisés d'un libellé (alphanumériques uniquement)."""
+    cleaned = "".join(char if char.isalnum() else " " for char in normalize(text))
+    return cleaned.split()
+
+
+def levenshtein(a, b, max_distance):
+    """
+    Distance d'édition entre a et b, ou max_distance + 1 si elle la dépasse
+    (calcul abandonné dès que toute la ligne dépasse le seuil).
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != char_b),
+                )
+            )
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+class BKTree:
+    """BK-tree : recherche des mots à distance d'édition bornée."""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, word):
+        if self.root is None:
+            self.root = (word, {})
+            return
+
+        node = self.root
+        while True:
+            distance = levenshtein(word, node[0], len(word) + len(node[0]))
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (word, {})
+                return
+            node = child
+
+    def search(self, word, max_distance):
+        """Retourne [(distance, mot)] pour les mots à distance <= max_distance."""
+        if self.root is None:
+            return []
+
+        results = []
+        stack = [self.root]
+        while stack:
+            node_word, children = stack.pop()
+            # Distance exacte nécessaire pour élaguer correctement les branches
+            distance = levenshtein(word, node_word, len(word) + len(node_word))
+            if distance <= max_distance:
+                results.append((distance, node_word))
+            low, high = distance - max_distance, distance + max_distance
+            stack.extend(child for d, child in children.items() if low <= d <= high)
+        return results
+
+
+class SuggestionIndex:
+    """Index des libellés de produits et catégories."""
+
+    def __init__(self, entries, version=None):
+        """
+        Args:
+            entries: Liste de dicts {"label", "type", "url"}
+            version: Version du catalogue au moment de la construction
+        """
+        self.version = version
+        self.entries = entries
+        self.labels = sorted(
+            (normalize(entry["label"]), position)
+            for position, entry in enumerate(entries)
+        )
+        self.words = {}
+        for position, entry in enumerate(entries):
+            for word in split_words(entry["label"]):
+                self.words.setdefault(word, set()).add(position)
+        self.sorted_words = sorted(self.words)
+        self.tree = BKTree()
+        for word in self.sorted_words:
+            self.tree.add(word)
+
+    @classmethod
+    def build(cls):
+        from store.models import Category, Product
+
+        version = get_catalog_version()
+        entries = [
+            {
+                "label": name,
+                "type": "category",
+                "url": f"{reverse('store:product_list')}?category={slug}",
+            }
+            for name, slug in Category.objects.filter(is_active=True).values_list(
+                "name", "slug"
+            )
+        ]
+        entries += [
+            {
+                "label": name,
+                "type": "product",
+                "url": reverse("store:product_detail", kwargs={"slug": slug}),
+            }
+            for name, slug in Product.objects.order_by().values_list("name", "slug")
+        ]
+        return cls(entries, version)
+
+    def _prefix_positions(self, prefix):
+        """Libellés ou mots commençant par ``prefix``, dans l'ordre alphabétique."""
+        positions = []
+
+        start = bisect.bisect_left(self.labels, (prefix,))
+        for label, position in self.labels[start:]:
+            if not label.startswith(prefix):
+                break
+            positions.append(position)
+
+        start = bisect.bisect_left(self.sorted_words, prefix)
+        for word in self.sorted_words[start:]:
+            if not word.startswith(prefix):
+                break
+            positions.extend(sorted(self.words[word]))
+        return positions
+
+    def suggest(self, query, limit=MAX_SUGGESTIONS):
+        """
+        Suggestions pour une saisie : préfixes d'abord, puis correspondances
+        approchées du dernier mot saisi.
+
+        Returns:
+            list: Entrées {"label", "type", "url"}
+        """
+        prefix = normalize(query).strip()
+        if not prefix:
+            return []
+
+        positions = self._prefix_positions(prefix)
+
+        if len(positions) < limit:
+            words = split_words(query)
+            if words and len(words[-1]) >= 3:
+                word = words[-1]
+                max_distance = 1 if len(word) <= 5 else 2
+                for _, match in sorted(self.tree.search(word, max_distance)):
+                    positions.extend(sorted(self.words[match]))
+
+        suggestions, seen = [], set()
+        for position in positions:
+            if position in seen:
+                continue
+            seen.add(position)
+            suggestions.append(self.entries[position])
+            if len(suggestions) >= limit:
+                break
+        return suggestions
+
+
+def get_suggestion_index():
+    """Retourne l'index du worker, reconstruit si le catalogue a changé."""
+    global _index
+
+    version = get_catalog_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+
+    with _lock:
+        if _index is None or _index.version != version:
+            _index = SuggestionIndex.build()
+            logger.info(
+                "Index de suggestions reconstruit: %s libellés", len(_index.entries)
+            )
+        return _index
@@ -1,15 +1,18 @@
 from django import template
-from store.views import get_cart_summary
+from store.carts import get_cart_counts
+from store.middleware import get_request_cart_summary
 
 register = template.Library()
 
 
-@register.simple_tag
-def get_cart_info(user):
+@register.simple_tag(takes_context=True)
+def get_cart_info(context, user):
     """
     Retourne les informations du panier pour l'utilisateur connecté.
+    Seuls les totaux sont lus (une ligne Cart), pas les articles.
 
     Args:
+        context: Contexte du template (résumé mémorisé de la requête)
         user: L'utilisateur Django
 
     Returns:
@@ -23,7 +26,11 @@ def get_cart_info(user):
             "formatted_total": "0.00 €",
         }
 
-    cart_data = get_cart_summary(user)
+    request = context.get("request")
+    if request is not None and request.user == user:
+        cart_data = dict(get_request_cart_summary(request).counts())
+    else:
+        cart_data = get_cart_counts(user)
 
     # Ajouter le prix formaté
     cart_data["formatted_total"] = f"{cart_data['total_price']:.2f} €"
@@ -31,13 +38,13 @@ def get_cart_info(user):
     return cart_data
 
 
-@register.inclusion_tag("store/cart_badge.html")
-def cart_badge(user):
+@register.inclusion_tag("store/cart_badge.html", takes_context=True)
+def cart_badge(context, user):
     """
     Tag d'inclusion pour afficher le badge du panier.
     Utilise un template séparé pour une meilleure réutilisabilité.
     """
-    cart_info = get_cart_info(user)
+    cart_info = get_cart_info(context, user)
     return {"cart_info": cart_info}
 
 
@@ -0,0 +1,99 @@
+from django import template
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
+
+from store.fragments import FRAGMENT_TIMEOUT, fragment_key, render_product_fragments
+
+register = template.Library()
+
+# Dégradés des visuels de remplacement (produit sans photo), choisis par produit
+PLACEHOLDER_PALETTES = (
+    ("#34495E, #2C3E50", "shirt", "#1ABC9C, #16A085", "suit-club-fill"),
+    ("#E74C3C, #C0392B", "bag", "#8E44AD, #7D3C98", "handbag-fill"),
+    ("#F39C12, #E67E22", "gem", "#F4D03F, #F8C471", "star-fill"),
+    ("#3498DB, #2980B9", "water", "#3498DB, #2980B9", "droplet"),
+    ("#8E44AD, #7D3C98", "flower1", "#E74C3C, #C0392B", "flower2"),
+    ("#1ABC9C, #16A085", "star", "#F39C12, #D68910", "brightness-high"),
+)
+
+
+@register.simple_tag
+def product_fragments(items, template_name, attr=None):
+    """
+    Cartes produit mises en cache pour toute une page (une lecture groupée).
+
+    Usage:
+        {% product_fragments products "store/fragments/product_card.html" as cards %}
+        {% for product in products %}{{ cards|fragment:product }}{% endfor %}
+
+    Args:
+        items: Produits, ou objets les portant (voir attr)
+        template_name: Template de la carte
+        attr: Attribut donnant le produit (ex. "product" pour la wishlist)
+    """
+    products = [getattr(item, attr) for item in items] if attr else list(items)
+    return render_product_fragments(template_name, products)
+
+
+@register.filter
+def fragment(cards, product):
+    """Carte d'un produit dans le résultat de product_fragments."""
+    return cards.get(getattr(product, "pk", product), "")
+
+
+@register.filter
+def placeholder_palette(product):
+    """(dégradé, icône, dégradé survol, icône survol) stables pour un produit."""
+    return PLACEHOLDER_PALETTES[product.pk % len(PLACEHOLDER_PALETTES)]
+
+
+class CachedFragmentNode(template.Node):
+    def __init__(self, nodelist, name, vary_on, tags):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+        self.tags = tags
+
+    def render(self, context):
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        tags = [tag.resolve(context) for tag in self.tags]
+        key = fragment_key(self.name, vary_on, tags)
+
+        content = cache.get(key)
+        if content is None:
+            content = self.nodelist.render(context)
+            cache.set(key, content, FRAGMENT_TIMEOUT)
+        return mark_safe(content)
+
+
+@register.tag
+def cachedfragment(parser, token):
+    """
+    Met en cache un bloc, invalidé par des étiquettes (store.cache_tags).
+
+    Usage:
+        {% cachedfragment "category_nav" category_slug tags="category:*" %}
+        ...
+        {% endcachedfragment %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' attend au moins un nom de fragment"
+        )
+
+    name = bits[1].strip("\"'")
+    vary_on, tags = [], []
+    for bit in bits[2:]:
+        if bit.startswith("tags="):
+            tags.extend(
+                parser.compile_filter(f'"{tag}"')
+                for tag in bit[len("tags=") :].strip("\"'").split(",")
+                if tag
+            )
+        else:
+            vary_on.append(parser.compile_filter(bit))
+
+    nodelist = parser.parse(("endcachedfragment",))
+    parser.delete_first_token()
+    return CachedFragmentNode(nodelist, name, vary_on, tags)
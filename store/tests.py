@@ -3,10 +3,11 @@ Tests unitaires robustes pour l'application store.
 Tests des modèles, vues et fonctions critiques du e-commerce.
 """
 
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.db import transaction
+from django.utils import timezone
 from decimal import Decimal
 from unittest.mock import patch, MagicMock
 import json
@@ -34,6 +35,16 @@ class BaseTestCase(TestCase):
 
     def setUp(self):
         """Configuration initiale pour chaque test"""
+        from store.performance_utils import (
+            bump_local_catalog_version,
+            bump_local_inventory_version,
+        )
+
+        # Chaque test part d'index en mémoire neufs : la transaction du test
+        # n'est jamais validée, les versions ne changent donc pas au commit
+        bump_local_catalog_version()
+        bump_local_inventory_version()
+
         # Créer un utilisateur de test
         try:
             self.user = User.objects.create_user(
@@ -525,3 +536,1894 @@ class StorePerformanceTest(BaseTestCase):
         created_count = Product.objects.filter(name__startswith="Product ").count()
         self.assertEqual(created_count, 10)
 
+
+
+class ProductSearchTest(BaseTestCase):
+    """Tests de l'index de recherche plein texte"""
+
+    def setUp(self):
+        super().setUp()
+        self.shirt = Product.objects.create(
+            name="Chemise en lin",
+            slug="chemise-lin",
+            price=Decimal("49.00"),
+            description="Coupe droite, parfaite pour l'été",
+            category=self.category,
+        )
+        self.dress = Product.objects.create(
+            name="Robe d'été",
+            slug="robe-ete",
+            price=Decimal("59.00"),
+            description="Robe légère qui se porte avec une chemise",
+        )
+
+    def test_search_ranks_name_matches_first(self):
+        """Un mot présent dans le nom passe avant une mention en description"""
+        from store.search import search_products
+
+        results = list(search_products(Product.objects.all(), "chemise"))
+        self.assertEqual(results, [self.shirt, self.dress])
+
+    def test_index_follows_product_and_category_updates(self):
+        """L'index suit les sauvegardes de produits et de catégories"""
+        from store.search import search_products
+
+        self.dress.name = "Pantalon large"
+        self.dress.save()
+        self.assertFalse(search_products(Product.objects.all(), "robe ete").exists())
+
+        self.category.name = "Nouveautés"
+        self.category.save()
+        results = search_products(Product.objects.all(), "nouveautes")
+        self.assertEqual(list(results), [self.shirt])
+
+    def test_product_list_uses_search_index(self):
+        """La boutique filtre via l'index et ignore la syntaxe FTS"""
+        response = self.client.get(reverse("store:product_list"), {"q": 'lin"*'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["products"]), [self.shirt])
+
+
+class ProductFacetsTest(BaseTestCase):
+    """Tests du moteur de facettes de la boutique"""
+
+    def setUp(self):
+        super().setUp()
+        self.other_category = Category.objects.create(name="Autre", slug="autre")
+        cheap = Product.objects.create(
+            name="Tee", slug="tee", price=Decimal("15.00"), category=self.category
+        )
+        ProductVariant.objects.create(product=cheap, size="M", stock=3)
+        Product.objects.create(
+            name="Veste", slug="veste", price=Decimal("120.00"), category=self.category
+        )
+        Product.objects.create(
+            name="Sac", slug="sac", price=Decimal("60.00"), category=self.other_category
+        )
+
+    def test_single_grouped_query(self):
+        """Toutes les statistiques proviennent d'une seule requête"""
+        from store.facets import facet_rows, summarize_facets
+
+        with self.assertNumQueries(1):
+            rows = facet_rows(Product.objects.all())
+
+        facets = summarize_facets(rows)
+        self.assertEqual(facets["total"], 3)
+        self.assertEqual(facets["in_stock"], 1)
+        self.assertEqual(facets["out_of_stock"], 2)
+        self.assertEqual(facets["price_range"]["min_price"], Decimal("15.00"))
+        self.assertEqual(facets["price_range"]["max_price"], Decimal("120.00"))
+        self.assertEqual(
+            facets["categories"], {self.category.id: 2, self.other_category.id: 1}
+        )
+        self.assertEqual(
+            [bucket["count"] for bucket in facets["price_buckets"]], [1, 0, 1, 1, 0]
+        )
+
+    def test_category_and_stock_filters_applied_on_rows(self):
+        """Catégorie et stock sont dérivés des mêmes lignes"""
+        from store.facets import facet_rows, summarize_facets
+
+        rows = facet_rows(Product.objects.all())
+        facets = summarize_facets(rows, category_id=self.category.id, stock_filter="out")
+        self.assertEqual(facets["total"], 1)
+        self.assertEqual(facets["in_stock"], 0)
+        # Les effectifs par catégorie ignorent la catégorie sélectionnée
+        self.assertEqual(
+            facets["categories"], {self.category.id: 1, self.other_category.id: 1}
+        )
+
+    def test_product_list_uses_facets(self):
+        """La boutique expose les facettes et pagine sans COUNT séparé"""
+        response = self.client.get(
+            reverse("store:product_list"), {"category": self.category.slug}
+        )
+        self.assertEqual(response.context["total_products"], 2)
+        self.assertEqual(response.context["in_stock_count"], 1)
+        self.assertEqual(response.context["products"].paginator.count, 2)
+
+    def test_bucket_links_exclude_upper_edge(self):
+        """Un prix sur une borne n'apparaît que sous sa tranche"""
+        Product.objects.create(
+            name="Ceinture", slug="ceinture", price=Decimal("50.00"),
+            category=self.category,
+        )
+        url = reverse("store:product_list")
+        lower = self.client.get(url, {"price_min": 25, "price_below": 50})
+        upper = self.client.get(url, {"price_min": 50, "price_below": 100})
+
+        self.assertEqual(lower.context["total_products"], 0)
+        self.assertEqual(upper.context["total_products"], 2)
+        self.assertEqual(
+            [bucket["count"] for bucket in upper.context["price_buckets"]],
+            [0, 0, 2, 0, 0],
+        )
+
+
+class KeysetPaginationTest(BaseTestCase):
+    """Tests de la pagination par curseur"""
+
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            Product.objects.create(
+                name=f"Produit {i}",
+                slug=f"produit-{i}",
+                price=Decimal("10.00") * (i % 2 + 1),
+            )
+
+    def test_walk_forward_and_back(self):
+        """Les jetons suivant/précédent parcourent toutes les lignes sans doublon"""
+        from store.pagination import KeysetPaginator
+
+        paginator = KeysetPaginator(Product.objects.all(), 2, ("price",))
+        expected = list(Product.objects.order_by("price", "pk"))
+
+        seen, page = [], paginator.get_page()
+        seen += list(page)
+        while page.has_next:
+            page = paginator.get_page(page.next_cursor)
+            seen += list(page)
+        self.assertEqual(seen, expected)
+        self.assertFalse(page.has_next)
+
+        previous = paginator.get_page(page.previous_cursor)
+        self.assertEqual(list(previous), expected[2:4])
+        self.assertTrue(previous.has_next)
+
+    def test_no_count_unless_requested(self):
+        """Une page coûte une requête ; le COUNT n'a lieu qu'à la demande"""
+        from store.pagination import KeysetPaginator
+
+        paginator = KeysetPaginator(Product.objects.all(), 2, ("-created_at",))
+        with self.assertNumQueries(1):
+            page = paginator.get_page()
+            self.assertTrue(page.has_next)
+        with self.assertNumQueries(1):
+            self.assertEqual(page.count, 5)
+
+    def test_null_sort_values_walk_last(self):
+        """Les dates nulles sont parcourues en fin de liste, dans les deux sens"""
+        from store.pagination import KeysetPaginator
+
+        Product.objects.filter(name__in=["Produit 1", "Produit 3"]).update(
+            created_at=None
+        )
+        paginator = KeysetPaginator(Product.objects.all(), 2, ("-created_at",))
+
+        seen, pages = [], [paginator.get_page()]
+        while pages[-1].has_next:
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        for page in pages:
+            seen += [product.name for product in page]
+        self.assertEqual(len(set(seen)), 5)
+        self.assertEqual(set(seen[-2:]), {"Produit 1", "Produit 3"})
+
+        previous = paginator.get_page(pages[-1].previous_cursor)
+        self.assertEqual([p.name for p in previous], seen[2:4])
+
+    def test_tampered_cursor_returns_first_page(self):
+        """Un jeton invalide ramène à la première page"""
+        response = self.client.get(
+            reverse("store:product_list"), {"cursor": "falsifie", "sort": "name"}
+        )
+        self.assertTrue(response.context["cursor_mode"])
+        self.assertEqual(
+            [p.name for p in response.context["products"]],
+            [f"Produit {i}" for i in range(5)],
+        )
+
+    def test_order_history_and_wishlist_are_paginated(self):
+        """Historique et wishlist utilisent des pages par curseur"""
+        product = Product.objects.first()
+        for _ in range(12):
+            Order.objects.create(
+                user=self.user,
+                product=product,
+                ordered=True,
+                date_ordered=timezone.now(),
+            )
+        Wishlist.objects.create(user=self.user, product=product)
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse("store:order_history"))
+        orders = response.context["orders"]
+        self.assertEqual(len(orders), 10)
+        self.assertTrue(orders.has_next)
+        response = self.client.get(
+            reverse("store:order_history"), {"cursor": orders.next_cursor}
+        )
+        self.assertEqual(len(response.context["orders"]), 2)
+
+        response = self.client.get(reverse("store:wishlist"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["wishlist_items"]), 1)
+
+
+class ProductStockSummaryTest(BaseTestCase):
+    """Tests des colonnes de stock dénormalisées"""
+
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(
+            name="Pull", slug="pull", price=Decimal("40.00"), category=self.category
+        )
+
+    def test_summary_follows_variant_changes(self):
+        """Création, modification et suppression de variantes"""
+        small = ProductVariant.objects.create(product=self.product, size="S", stock=2)
+        ProductVariant.objects.create(product=self.product, size="M", stock=0)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.total_stock, 2)
+        self.assertEqual(self.product.in_stock_variant_count, 1)
+        self.assertTrue(self.product.is_in_stock)
+
+        self.assertTrue(self.product.reduce_stock("S", 2))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.total_stock, 0)
+        self.assertFalse(self.product.is_in_stock)
+
+        small.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.in_stock_variant_count, 0)
+
+    def test_repair_command_recomputes_in_bulk(self):
+        """La commande de réparation corrige un résumé désynchronisé"""
+        from django.core.management import call_command
+        from io import StringIO
+
+        ProductVariant.objects.create(product=self.product, size="M", stock=4)
+        Product.objects.update(total_stock=99, is_in_stock=False)
+        call_command("repair_stock_summary", stdout=StringIO())
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.total_stock, 4)
+        self.assertTrue(self.product.is_in_stock)
+        self.assertEqual(self.category.product_count, 1)
+
+    def test_stock_sort_does_not_duplicate_rows(self):
+        """Le tri par stock s'appuie sur la colonne, sans jointure"""
+        ProductVariant.objects.create(product=self.product, size="S", stock=1)
+        ProductVariant.objects.create(product=self.product, size="M", stock=1)
+        response = self.client.get(reverse("store:product_list"), {"sort": "-stock"})
+        self.assertEqual(list(response.context["products"]), [self.product])
+
+
+class CatalogIndexTest(BaseTestCase):
+    """Tests de l'index NumPy du catalogue"""
+
+    def setUp(self):
+        super().setUp()
+        from store import catalog_index
+
+        if catalog_index.np is None:
+            self.skipTest("NumPy n'est pas installé")
+
+        self.cheap = Product.objects.create(
+            name="Tee", slug="tee", price=Decimal("12.50"), category=self.category
+        )
+        ProductVariant.objects.create(product=self.cheap, size="M", stock=2)
+        self.expensive = Product.objects.create(
+            name="Manteau", slug="manteau", price=Decimal("180.00"), category=self.category
+        )
+        self.other = Product.objects.create(name="Sac", slug="sac", price=Decimal("60.00"))
+
+    def test_query_filters_and_sorts(self):
+        """Masques et tri reproduisent les filtres de la boutique"""
+        from store.catalog_index import CatalogIndex
+
+        index = CatalogIndex.build()
+        self.assertEqual(
+            list(index.query(sort="price")),
+            [self.cheap.id, self.other.id, self.expensive.id],
+        )
+        self.assertEqual(
+            list(index.query(category_id=self.category.id, sort="-price")),
+            [self.expensive.id, self.cheap.id],
+        )
+        self.assertEqual(list(index.query(stock_filter="in")), [self.cheap.id])
+        self.assertEqual(
+            list(index.query(price_min=12.5, price_max=60, sort="-price")),
+            [self.other.id, self.cheap.id],
+        )
+
+    def test_product_list_rebuilds_after_catalog_write(self):
+        """La boutique sert l'index et le reconstruit après une écriture"""
+        with self.settings(CATALOG_INDEX_ENABLED=True):
+            response = self.client.get(reverse("store:product_list"), {"sort": "price"})
+            self.assertEqual(
+                list(response.context["products"]),
+                [self.cheap, self.other, self.expensive],
+            )
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.other.price = Decimal("500.00")
+                self.other.save()
+            response = self.client.get(reverse("store:product_list"), {"sort": "price"})
+            self.assertEqual(
+                list(response.context["products"]),
+                [self.cheap, self.expensive, self.other],
+            )
+
+
+class SearchSuggestionsTest(BaseTestCase):
+    """Tests de l'index de suggestions tolérant aux fautes"""
+
+    def setUp(self):
+        super().setUp()
+        self.coat = Product.objects.create(
+            name="Manteau d'hiver", slug="manteau-hiver", price=Decimal("180.00")
+        )
+        self.dress = Product.objects.create(
+            name="Robe été", slug="robe-ete", price=Decimal("45.00")
+        )
+
+    def test_prefix_and_typo_suggestions(self):
+        """Préfixes, accents et fautes de frappe sont tolérés"""
+        from store.suggestions import SuggestionIndex
+
+        index = SuggestionIndex.build()
+        labels = lambda query: [entry["label"] for entry in index.suggest(query)]
+
+        self.assertEqual(labels("man"), ["Manteau d'hiver"])
+        self.assertEqual(labels("ete"), ["Robe été"])
+        self.assertEqual(labels("mantaeu"), ["Manteau d'hiver"])
+        self.assertIn("Test Category", labels("categroy"))
+        self.assertEqual(labels("zzz"), [])
+
+    def test_endpoint_serves_from_memory_and_refreshes(self):
+        """L'autocomplétion ne touche pas la base tant que le catalogue est stable"""
+        url = reverse("store:search_suggestions")
+        response = self.client.get(url, {"q": "robe"})
+        self.assertEqual(response.json()["suggestions"][0]["url"], "/store/product/robe-ete/")
+
+        with self.assertNumQueries(0):
+            self.client.get(url, {"q": "rob"})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dress.name = "Jupe plissée"
+            self.dress.save()
+        response = self.client.get(url, {"q": "jupe"})
+        self.assertEqual(
+            [entry["label"] for entry in response.json()["suggestions"]],
+            ["Jupe plissée"],
+        )
+
+
+class SizeIndexTest(BaseTestCase):
+    """Tests de l'index inversé des tailles"""
+
+    def setUp(self):
+        super().setUp()
+        self.tee = Product.objects.create(
+            name="Tee", slug="tee", price=Decimal("15.00"), category=self.category
+        )
+        ProductVariant.objects.create(product=self.tee, size="M", stock=3)
+        ProductVariant.objects.create(product=self.tee, size="S", stock=0)
+        self.pull = Product.objects.create(
+            name="Pull", slug="pull", price=Decimal("55.00")
+        )
+        ProductVariant.objects.create(product=self.pull, size="XL", stock=1)
+        ProductVariant.objects.create(product=self.pull, size="M", stock=0)
+
+    def test_index_and_availability_matrix(self):
+        """Seules les tailles en stock sont indexées ; la matrice est ordonnée"""
+        from store.size_index import SizeIndex
+
+        index = SizeIndex.build()
+        self.assertEqual(index.sizes, ["S", "M", "XL"])
+        self.assertEqual(index.product_ids("M"), {self.tee.id})
+        self.assertEqual(index.product_ids("S"), set())
+        self.assertEqual(index.availability(self.tee.id), [("S", False), ("M", True)])
+
+    def test_size_facets_grouped_query(self):
+        """Facette taille : une requête groupée, filtrée ensuite en Python"""
+        from store.facets import size_facet_rows, summarize_size_facets
+
+        sizes = ["S", "M", "XL"]
+        with self.assertNumQueries(1):
+            rows = size_facet_rows(Product.objects.all())
+        self.assertEqual(
+            summarize_size_facets(rows, sizes),
+            [
+                {"size": "S", "count": 0},
+                {"size": "M", "count": 1},
+                {"size": "XL", "count": 1},
+            ],
+        )
+        self.assertEqual(
+            summarize_size_facets(rows, sizes, category_id=self.category.id),
+            [
+                {"size": "S", "count": 0},
+                {"size": "M", "count": 1},
+                {"size": "XL", "count": 0},
+            ],
+        )
+
+    def test_product_list_size_filter_and_facet(self):
+        """Le filtre taille suit le stock des variantes"""
+        url = reverse("store:product_list")
+        response = self.client.get(url, {"size": "M"})
+        self.assertEqual(list(response.context["products"]), [self.tee])
+        self.assertEqual(response.context["total_products"], 1)
+        self.assertEqual(
+            response.context["products"][0].size_availability,
+            [("S", False), ("M", True)],
+        )
+        self.assertIn({"size": "XL", "count": 1}, response.context["size_facets"])
+
+        variant = self.pull.variants.get(size="M")
+        with self.captureOnCommitCallbacks(execute=True):
+            variant.stock = 4
+            variant.save()
+        response = self.client.get(url, {"size": "M", "sort": "price"})
+        self.assertEqual(list(response.context["products"]), [self.tee, self.pull])
+
+
+class SimilarProductsTest(BaseTestCase):
+    """Tests de la table des produits similaires"""
+
+    def setUp(self):
+        super().setUp()
+        self.shirt = Product.objects.create(
+            name="Chemise lin blanche", slug="chemise-lin", price=Decimal("40.00"),
+            category=self.category,
+        )
+        self.close = Product.objects.create(
+            name="Chemise lin bleue", slug="chemise-bleue", price=Decimal("42.00"),
+            category=self.category,
+        )
+        self.far = Product.objects.create(
+            name="Manteau laine", slug="manteau-laine", price=Decimal("300.00")
+        )
+        for product in (self.shirt, self.close, self.far):
+            ProductVariant.objects.create(product=product, size="M", stock=2)
+
+    def test_rebuild_ranks_neighbours(self):
+        """Catégorie, prix et nom rapprochent les produits"""
+        from store.models import SimilarProduct
+        from store.similarity import rebuild_similar_products
+
+        rebuild_similar_products()
+        neighbours = list(
+            SimilarProduct.objects.filter(product=self.shirt).values_list(
+                "similar_id", flat=True
+            )
+        )
+        self.assertEqual(neighbours, [self.close.id, self.far.id])
+
+    def test_product_detail_reads_table_and_refreshes_on_save(self):
+        """La fiche lit la table ; la sauvegarde d'un produit la recalcule"""
+        from store.similarity import rebuild_similar_products
+
+        rebuild_similar_products()
+        self.client.force_login(self.user)
+        url = reverse("store:product_detail", kwargs={"slug": self.shirt.slug})
+        response = self.client.get(url)
+        self.assertEqual(
+            list(response.context["similar_products"]), [self.close, self.far]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.far.name = "Chemise lin blanche"
+            self.far.price = Decimal("40.00")
+            self.far.category = self.category
+            self.far.save()
+        response = self.client.get(url)
+        self.assertEqual(
+            list(response.context["similar_products"]), [self.far, self.close]
+        )
+
+    def test_refresh_skipped_or_batched(self):
+        """Voisins recalculés si nom/prix/catégorie changent, une fois par transaction"""
+        shirt = Product.objects.get(pk=self.shirt.pk)
+        with patch("store.similarity.refresh_similar_products") as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                shirt.description = "Lin lavé"
+                shirt.save()
+            refresh.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    shirt.price = Decimal("41.00")
+                    shirt.save()
+                    close = Product.objects.get(pk=self.close.pk)
+                    close.name = "Chemise coton bleue"
+                    close.save()
+            refresh.assert_called_once()
+            (product_ids,) = refresh.call_args.args
+            self.assertLessEqual({self.shirt.id, self.close.id}, set(product_ids))
+
+
+class CoPurchaseRecommendationsTest(BaseTestCase):
+    """Tests des recommandations « achetés ensemble »"""
+
+    def setUp(self):
+        super().setUp()
+        self.tee, self.short, self.cap = [
+            Product.objects.create(name=name, slug=name, price=Decimal("20.00"))
+            for name in ("tee", "short", "casquette")
+        ]
+        for product in (self.tee, self.short, self.cap):
+            ProductVariant.objects.create(product=product, size="M", stock=5)
+        self.other_user = User.objects.create_user(
+            username="other", email="other@example.com", password="testpass123"
+        )
+        self.yesterday = timezone.now() - timezone.timedelta(days=1)
+        self.buy(self.user, [self.tee, self.short, self.cap], self.yesterday)
+        self.buy(self.other_user, [self.tee, self.short], self.yesterday)
+
+    def buy(self, user, products, when):
+        for product in products:
+            Order.objects.create(
+                user=user, product=product, ordered=True, date_ordered=when
+            )
+
+    def test_pairs_counted_per_basket(self):
+        """Les paires sont comptées par panier (utilisateur, jour)"""
+        from store.models import BoughtTogether, CoPurchaseCount
+        from store.recommendations import build_copurchases
+
+        run = build_copurchases()
+        self.assertEqual(run.baskets, 2)
+        self.assertEqual(
+            CoPurchaseCount.objects.get(
+                product_a=min(self.tee.id, self.short.id),
+                product_b=max(self.tee.id, self.short.id),
+            ).count,
+            2,
+        )
+        self.assertEqual(
+            list(
+                BoughtTogether.objects.filter(product=self.tee).values_list(
+                    "other_id", "count"
+                )
+            ),
+            [(self.short.id, 2), (self.cap.id, 1)],
+        )
+
+    def test_incremental_run_only_reads_new_days(self):
+        """Un second passage n'ajoute que les jours non traités"""
+        from store.models import CoPurchaseCount
+        from store.recommendations import build_copurchases
+
+        build_copurchases()
+        self.assertIsNone(build_copurchases())
+
+        self.buy(self.other_user, [self.short, self.cap], timezone.now())
+        tomorrow = timezone.localdate() + timezone.timedelta(days=1)
+        run = build_copurchases(today=tomorrow)
+        self.assertEqual(run.baskets, 1)
+        self.assertEqual(CoPurchaseCount.objects.get(product_a=self.tee, product_b=self.short).count, 2)
+        self.assertEqual(
+            CoPurchaseCount.objects.get(product_a=self.short, product_b=self.cap).count, 2
+        )
+
+    def test_interrupted_rebuild_resumes_after_last_batch(self):
+        """Chaque lot de jours est validé à part : une reprise ne recompte rien"""
+        from store import recommendations
+        from store.models import CoPurchaseCount, CoPurchaseRun
+
+        self.buy(self.other_user, [self.short, self.cap], self.yesterday - timezone.timedelta(days=2))
+        count_baskets = recommendations.count_baskets
+        yesterday = timezone.localdate(self.yesterday)
+
+        def fail_on_yesterday(start, end):
+            if start == yesterday:
+                raise RuntimeError("interruption")
+            return count_baskets(start, end)
+
+        with patch.object(recommendations, "DAYS_PER_COMMIT", 1):
+            with patch.object(recommendations, "count_baskets", fail_on_yesterday):
+                with self.assertRaises(RuntimeError):
+                    recommendations.build_copurchases(full=True)
+            self.assertEqual(
+                CoPurchaseRun.objects.get().processed_through,
+                yesterday - timezone.timedelta(days=1),
+            )
+            self.assertEqual(CoPurchaseCount.objects.count(), 1)
+
+            run = recommendations.build_copurchases()
+        self.assertEqual(run.baskets, 2)
+        self.assertEqual(
+            CoPurchaseCount.objects.get(product_a=self.short, product_b=self.cap).count, 2
+        )
+        self.assertEqual(
+            CoPurchaseCount.objects.get(product_a=self.tee, product_b=self.short).count, 2
+        )
+
+    def test_cart_and_detail_read_recommendations(self):
+        """La fiche et le panier lisent le top-K enregistré"""
+        from store.recommendations import build_copurchases, cart_recommendations
+
+        build_copurchases()
+        self.assertEqual(list(cart_recommendations([self.cap.id])), [self.tee, self.short])
+
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse("store:product_detail", kwargs={"slug": self.short.slug})
+        )
+        self.assertEqual(list(response.context["bought_together"]), [self.tee, self.cap])
+
+
+class PopularityTest(BaseTestCase):
+    """Tests des compteurs et du score de popularité"""
+
+    def setUp(self):
+        super().setUp()
+        self.hit = Product.objects.create(
+            name="Hit", slug="hit", price=Decimal("30.00"), category=self.category
+        )
+        self.quiet = Product.objects.create(
+            name="Calme", slug="calme", price=Decimal("30.00"), category=self.category
+        )
+
+    def test_fold_applies_counters_and_decay(self):
+        """Ventes et vues sont repliées puis décroissent avec le temps"""
+        from store.popularity import (
+            SALE_WEIGHT,
+            VIEW_WEIGHT,
+            flush_views,
+            fold_popularity,
+            record_sales,
+            record_view,
+        )
+
+        record_sales([Order(product=self.hit, quantity=2)])
+        record_view(self.hit.id)
+        flush_views()
+        now = timezone.now()
+        fold_popularity(now)
+
+        self.hit.refresh_from_db()
+        self.assertAlmostEqual(self.hit.popularity_score, 2 * SALE_WEIGHT + VIEW_WEIGHT)
+        self.assertEqual((self.hit.pending_sales, self.hit.pending_views), (0, 0))
+
+        fold_popularity(now + timezone.timedelta(hours=72))
+        self.hit.refresh_from_db()
+        self.assertAlmostEqual(self.hit.popularity_score, (2 * SALE_WEIGHT + VIEW_WEIGHT) / 2)
+
+    def test_popular_sort_and_trending(self):
+        """La boutique, les catégories et l'accueil lisent le score"""
+        from store.popularity import fold_popularity, record_sales
+
+        record_sales([Order(product=self.hit, quantity=1)])
+        fold_popularity()
+
+        response = self.client.get(reverse("store:product_list"), {"sort": "popular"})
+        self.assertEqual(list(response.context["products"]), [self.hit, self.quiet])
+
+        response = self.client.get(
+            reverse("store:category", kwargs={"category_slug": self.category.slug})
+        )
+        self.assertIn("sort=popular", response.url)
+
+        response = self.client.get(reverse("index"))
+        self.assertEqual(response.context["trending_products"][0], self.hit)
+
+    def test_buffered_views_flushed_without_next_view(self):
+        """Une vue isolée arme le minuteur du worker ; l'arrêt vide le tampon"""
+        from store import popularity
+
+        # Tampon des tests précédents (identifiants réutilisés)
+        popularity.flush_views()
+        self.quiet.refresh_from_db()
+        before = self.quiet.pending_views
+        with patch.object(popularity, "_flush_timer", None), patch(
+            "store.popularity.threading.Timer"
+        ) as timer:
+            popularity.record_view(self.quiet.id)
+        timer.assert_called_once_with(
+            popularity.VIEW_FLUSH_SECONDS, popularity._flush_in_background
+        )
+        timer.return_value.start.assert_called_once()
+
+        popularity._flush_at_exit()
+        self.quiet.refresh_from_db()
+        self.assertEqual(self.quiet.pending_views, before + 1)
+
+
+class CacheMetricsTest(BaseTestCase):
+    """Tests du cache instrumenté"""
+
+    def setUp(self):
+        super().setUp()
+        from store.cache_metrics import InstrumentedCache, flush_metrics
+
+        flush_metrics()
+        self.cache = InstrumentedCache(
+            "cache-metrics-test",
+            {"OPTIONS": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+        )
+
+    def test_key_prefix(self):
+        """Les parties variables des clés sont regroupées"""
+        from store.cache_metrics import key_prefix
+
+        self.assertEqual(key_prefix("featured_products_10"), "featured_products")
+        self.assertEqual(key_prefix("cart_summary_42"), "cart_summary")
+        self.assertEqual(key_prefix("global_categories"), "global_categories")
+        self.assertEqual(key_prefix("facets_3_1_ab12"), "facets")
+
+    def test_hits_misses_and_flush_to_admin_model(self):
+        """Les compteurs sont agrégés par préfixe puis écrits en base"""
+        from store.cache_metrics import flush_metrics, pending_metrics
+        from store.models import CacheMetric
+
+        self.assertIsNone(self.cache.get("cart_summary_1"))
+        self.cache.set("cart_summary_1", {"total": 3})
+        self.assertEqual(self.cache.get("cart_summary_1"), {"total": 3})
+        self.assertEqual(self.cache.get_many(["cart_summary_1", "cart_summary_2"]), {"cart_summary_1": {"total": 3}})
+
+        stats = pending_metrics()["cart_summary"]
+        self.assertEqual((stats["hits"], stats["misses"], stats["sets"]), (2, 2, 1))
+        self.assertGreater(stats["bytes_written"], 0)
+
+        flush_metrics()
+        metric = CacheMetric.objects.get(prefix="cart_summary")
+        self.assertEqual(metric.hit_ratio, 0.5)
+        self.assertEqual(pending_metrics(), {})
+
+        self.client.force_login(User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="adminpass123"
+        ))
+        response = self.client.get(reverse("admin:store_cachemetric_changelist"))
+        self.assertContains(response, "cart_summary")
+
+    @override_settings(
+        CACHE_METRICS_FLUSH_SECONDS=0, CACHE_METRICS_SIZE_SAMPLE_EVERY=3
+    )
+    def test_flush_after_commit_and_sampled_sizes(self):
+        """Pas d'écriture en base dans la transaction ; tailles échantillonnées"""
+        from store.cache_metrics import value_size
+        from store.models import CacheMetric
+
+        value = "x" * 100
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(4):
+                self.cache.set("facets_1", value)
+            self.assertFalse(CacheMetric.objects.filter(prefix="facets").exists())
+
+        metric = CacheMetric.objects.get(prefix="facets")
+        self.assertEqual(metric.sets, 4)
+        # 1re et 4e écritures mesurées, chacune pondérée par 3
+        self.assertEqual(metric.bytes_written, 2 * 3 * value_size(value))
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class GetOrComputeTest(BaseTestCase):
+    """Tests du cache protégé contre l'effet de meute"""
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return f"valeur {self.calls}"
+
+    def test_cached_until_expiry(self):
+        """La valeur est calculée une fois puis servie depuis le cache"""
+        from store.performance_utils import get_or_compute
+
+        self.assertEqual(get_or_compute("stampede_key", self.compute, 60, beta=0), "valeur 1")
+        self.assertEqual(get_or_compute("stampede_key", self.compute, 60, beta=0), "valeur 1")
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_served_while_another_worker_revalidates(self):
+        """Valeur périmée servie tant que le verrou est pris, recalcul sinon"""
+        import time
+        from django.core.cache import cache
+        from store.performance_utils import get_or_compute
+
+        cache.set(
+            "stampede_key",
+            {"value": "ancienne", "delta": 0.1, "expires": time.time() - 1},
+            60,
+        )
+        cache.add("lock:stampede_key", 1, 30)
+        self.assertEqual(get_or_compute("stampede_key", self.compute, 60), "ancienne")
+        self.assertEqual(self.calls, 0)
+
+        cache.delete("lock:stampede_key")
+        self.assertEqual(get_or_compute("stampede_key", self.compute, 60), "valeur 1")
+        self.assertFalse(cache.has_key("lock:stampede_key"))
+
+    def test_lock_of_another_worker_kept(self):
+        """Un verrou expiré puis repris par un autre worker n'est pas supprimé"""
+        from django.core.cache import cache
+        from store.performance_utils import get_or_compute
+
+        def slow_compute():
+            # Le verrou a expiré pendant le calcul et un autre worker l'a pris
+            cache.set("lock:stampede_key", "autre-worker", 30)
+            return self.compute()
+
+        self.assertEqual(get_or_compute("stampede_key", slow_compute, 60), "valeur 1")
+        self.assertEqual(cache.get("lock:stampede_key"), "autre-worker")
+
+    def test_old_format_entry_recomputed(self):
+        """Une valeur brute (ancien format) est recalculée, pas une erreur"""
+        from django.core.cache import cache
+        from store.performance_utils import get_or_compute
+
+        cache.set("stampede_key", ["ancien", "format"], 60)
+        self.assertEqual(get_or_compute("stampede_key", self.compute, 60), "valeur 1")
+        self.assertEqual(get_or_compute("stampede_key", self.compute, 60), "valeur 1")
+        self.assertEqual(self.calls, 1)
+
+    def test_probabilistic_early_recompute(self):
+        """Un calcul long est rafraîchi avant son échéance"""
+        import time
+        from django.core.cache import cache
+        from store.performance_utils import get_or_compute
+
+        cache.set(
+            "stampede_key",
+            {"value": "ancienne", "delta": 3600.0, "expires": time.time() + 5},
+            60,
+        )
+        with patch("store.performance_utils.random.random", return_value=0.5):
+            self.assertEqual(get_or_compute("stampede_key", self.compute, 60), "valeur 1")
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class CacheTagsTest(BaseTestCase):
+    """Tests de l'invalidation du cache par étiquettes"""
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+
+        cache.clear()
+        self.product = Product.objects.create(
+            name="Sweat tag",
+            slug="sweat-tag",
+            price=Decimal("45.00"),
+            description="Sweat",
+            category=self.category,
+        )
+
+    def test_variant_change_invalidates_tagged_entry(self):
+        """Une entrée étiquetée product:<id> est recalculée après une modification de variante"""
+        from store.performance_utils import get_or_compute
+
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        tags = (f"product:{self.product.pk}",)
+        self.assertEqual(get_or_compute("tagged_key", compute, 60, beta=0, tags=tags), 1)
+        self.assertEqual(get_or_compute("tagged_key", compute, 60, beta=0, tags=tags), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductVariant.objects.create(product=self.product, size="M", stock=3)
+
+        self.assertEqual(get_or_compute("tagged_key", compute, 60, beta=0, tags=tags), 2)
+
+    def test_bulk_edit_bumps_versions_once_after_commit(self):
+        """Les invalidations d'une transaction sont regroupées en une écriture"""
+        from django.core.cache import cache
+        from store.cache_tags import get_tag_versions
+
+        before = get_tag_versions(["catalog", "product:*"])
+        with patch.object(cache, "set_many", wraps=cache.set_many) as set_many:
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                for size in ("S", "M", "L"):
+                    ProductVariant.objects.create(product=self.product, size=size, stock=1)
+                self.product.name = "Sweat renommé"
+                self.product.save()
+                # Rien n'est invalidé avant le commit
+                self.assertEqual(get_tag_versions(["catalog", "product:*"]), before)
+            for callback in callbacks:
+                callback()
+
+        self.assertEqual(set_many.call_count, 1)
+        after = get_tag_versions(["catalog", "product:*"])
+        self.assertNotEqual(after["catalog"], before["catalog"])
+        self.assertNotEqual(after["product:*"], before["product:*"])
+
+    def test_cart_change_invalidates_cart_summary(self):
+        """Un ajout au panier invalide le résumé en cache de l'utilisateur"""
+        from store.performance_utils import get_cart_summary_cached
+
+        self.assertEqual(get_cart_summary_cached(self.user)["total_items"], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(user=self.user, product=self.product, quantity=2)
+            cart, _ = Cart.objects.get_or_create(user=self.user)
+            cart.orders.add(order)
+
+        self.assertEqual(get_cart_summary_cached(self.user)["total_items"], 2)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    NEAR_CACHE_TTL=60,
+    CACHE_METRICS_FLUSH_SECONDS=3600,
+)
+class NearCacheTest(BaseTestCase):
+    """Tests du cache local devant le cache partagé"""
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+        from store.cache_metrics import flush_metrics
+        from store.near_cache import NearCache
+
+        cache.clear()
+        flush_metrics()
+        self.near_cache = NearCache()
+        self.calls = 0
+
+    def tearDown(self):
+        from store.near_cache import near_cache
+
+        # Le cache local du worker survit aux tests
+        near_cache.clear()
+        super().tearDown()
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_local_hit_skips_shared_cache(self):
+        """Une valeur fraîche est servie sans lecture du cache partagé"""
+        from django.core.cache import cache
+
+        self.assertEqual(self.near_cache.get_or_compute("menu", self.compute, 60, tags=("category:*",)), 1)
+        with patch.object(cache, "get") as get, patch.object(cache, "get_many") as get_many:
+            self.assertEqual(self.near_cache.get_or_compute("menu", self.compute, 60, tags=("category:*",)), 1)
+        get.assert_not_called()
+        get_many.assert_not_called()
+
+    def test_expired_entry_revalidated_by_tag_versions(self):
+        """À l'échéance, une entrée dont les versions n'ont pas changé est prolongée"""
+        from store.cache_metrics import pending_metrics
+
+        with override_settings(NEAR_CACHE_TTL=0):
+            self.near_cache.get_or_compute("menu", self.compute, 60, tags=("category:*",))
+            self.assertEqual(self.near_cache.get_or_compute("menu", self.compute, 60, tags=("category:*",)), 1)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                Category.objects.create(name="Nouvelle", slug="nouvelle")
+            self.assertEqual(self.near_cache.get_or_compute("menu", self.compute, 60, tags=("category:*",)), 2)
+
+        stats = pending_metrics()["local:menu"]
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+
+    def test_category_change_refreshes_global_categories(self):
+        """Le menu des catégories reflète une catégorie ajoutée dans ce worker"""
+        from store.context_processors import global_categories
+
+        names = [c.name for c in global_categories(None)["global_categories"]]
+        self.assertEqual(names, ["Test Category"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name="Accessoires", slug="accessoires")
+
+        names = [c.name for c in global_categories(None)["global_categories"]]
+        self.assertEqual(names, ["Accessoires", "Test Category"])
+        self.assertEqual(
+            self.category.background_gradient,
+            Category.gradient_for(self.category.color_theme),
+        )
+
+
+@override_settings(NEAR_CACHE_TTL=60)
+class InvalidationBusTest(BaseTestCase):
+    """Tests de la diffusion des invalidations entre workers"""
+
+    def setUp(self):
+        super().setUp()
+        import os
+        import tempfile
+        from store.invalidation_bus import FileBus
+        from store.near_cache import NearCache
+
+        handle, self.path = tempfile.mkstemp(suffix=".log")
+        os.close(handle)
+        self.publisher = FileBus(self.path)
+        self.subscriber = FileBus(self.path)
+        self.near_cache = NearCache()
+        self.near_cache.get_or_compute("menu", lambda: "menu", 60, tags=("category:*",), remote=False)
+        self.near_cache.get_or_compute("panier", lambda: "panier", 60, tags=("cart:1",), remote=False)
+
+    def tearDown(self):
+        import os
+
+        os.remove(self.path)
+        super().tearDown()
+
+    def test_message_from_other_worker_drops_matching_entries(self):
+        """Un message d'un autre worker retire les seules entrées étiquetées"""
+        from store.invalidation_bus import apply_message
+
+        with patch("store.invalidation_bus.ORIGIN", "autre-worker"):
+            self.publisher.publish(["category:*", "category:3"])
+        payloads = self.subscriber.poll()
+
+        self.assertEqual(len(payloads), 1)
+        self.assertTrue(apply_message(payloads[0]))
+        self.assertEqual(len(self.near_cache), 1)
+        self.assertEqual(self.subscriber.poll(), [])
+
+        # Les messages du worker lui-même sont ignorés
+        self.publisher.publish(["cart:1"])
+        self.assertFalse(apply_message(self.subscriber.poll()[0]))
+        self.assertEqual(len(self.near_cache), 1)
+
+    def test_truncated_log_drops_all_local_state(self):
+        """Un journal tronqué (messages manqués) vide tout l'état local"""
+        from store.invalidation_bus import drop_local_state
+        from store.performance_utils import get_catalog_version
+
+        self.publisher.publish(["catalog"])
+        self.subscriber.poll()
+        open(self.path, "w").close()
+
+        self.assertIsNone(self.subscriber.poll())
+        version = get_catalog_version()
+        drop_local_state()
+        self.assertEqual(len(self.near_cache), 0)
+        self.assertNotEqual(get_catalog_version(), version)
+
+    def test_large_invalidations_split_under_notify_limit(self):
+        """Les étiquettes sont découpées en messages sous la limite de NOTIFY"""
+        from store.invalidation_bus import MAX_PAYLOAD_BYTES, encode_messages
+
+        tags = [f"product:{pk}" for pk in range(2000)]
+        messages = encode_messages(tags)
+
+        self.assertGreater(len(messages), 1)
+        self.assertTrue(all(len(m.encode()) <= MAX_PAYLOAD_BYTES for m in messages))
+        received = [tag for m in messages for tag in json.loads(m)["tags"]]
+        self.assertEqual(sorted(received), sorted(tags))
+
+
+class CacheCodecTest(BaseTestCase):
+    """Tests du codec compact des valeurs en cache"""
+
+    def setUp(self):
+        super().setUp()
+        for i in range(3):
+            Product.objects.create(
+                name=f"Veste {i}",
+                slug=f"veste-{i}",
+                price=Decimal("79.90") + i,
+                description="Veste légère " * 20,
+                category=self.category,
+            )
+
+    def test_round_trip_rebuilds_instances_without_queries(self):
+        """Les produits relus gardent leurs types et leur catégorie préchargée"""
+        from store import cache_codec
+
+        products = list(Product.objects.select_related("category").order_by("id"))
+        value = {"hero": products, "stats": {"total": 3, "ca": Decimal("12.50")}}
+        data = cache_codec.dumps(value)
+
+        with self.assertNumQueries(0):
+            decoded = cache_codec.loads(data)
+            first = decoded["hero"][0]
+            self.assertEqual(first.pk, products[0].pk)
+            self.assertEqual(first.price, Decimal("79.90"))
+            self.assertEqual(first.created_at, products[0].created_at)
+            self.assertEqual(first.category.name, "Test Category")
+            self.assertFalse(first.thumbnail)
+        self.assertEqual(decoded["stats"], {"total": 3, "ca": Decimal("12.50")})
+        # Au-delà du seuil, le corps est compressé
+        self.assertTrue(data[3] & 1)
+
+    def test_other_schema_version_is_recomputed(self):
+        """Une valeur écrite par un autre schéma est traitée comme absente"""
+        from django.core.cache import cache
+        from store import cache_codec
+        from store.performance_utils import get_or_compute
+
+        compute = MagicMock(return_value=list(Product.objects.order_by("id")))
+        with override_settings(
+            CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        ):
+            cache.clear()
+            get_or_compute("codec_key", compute, 60, beta=0, codec=cache_codec)
+            with patch.object(cache_codec, "SCHEMA_VERSION", 2):
+                products = get_or_compute("codec_key", compute, 60, beta=0, codec=cache_codec)
+
+        self.assertEqual(compute.call_count, 2)
+        self.assertEqual(len(products), 3)
+
+    def test_benchmark_command(self):
+        """La commande compare les tailles pickle et codec"""
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command("benchmark_cache_codec", repeat=2, stdout=out)
+        self.assertIn("hero_products", out.getvalue())
+        self.assertIn("products_by_category", out.getvalue())
+
+
+class RequestCartSummaryTest(BaseTestCase):
+    """Tests du résumé de panier mémorisé par requête"""
+
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(
+            name="Casquette",
+            slug="casquette",
+            price=Decimal("19.00"),
+            description="Casquette",
+            category=self.category,
+        )
+        self.cart = Cart.objects.create(user=self.user)
+        order = Order.objects.create(user=self.user, product=self.product, quantity=2)
+        self.cart.orders.add(order)
+
+    def test_cart_page_computes_summary_once(self):
+        """Vue, context processor et tags du panier partagent un seul calcul"""
+        from store import views
+
+        self.client.force_login(self.user)
+        with patch.object(views, "get_cart_summary", wraps=views.get_cart_summary) as summary:
+            response = self.client.get(reverse("store:cart"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["total_items"], 2)
+        self.assertEqual(response.context["cart_total_items"], 2)
+        self.assertEqual(summary.call_count, 1)
+
+    def test_cart_mutation_invalidates_memo(self):
+        """Une modification du panier pendant la requête force un recalcul"""
+        from store.middleware import RequestCartSummary
+
+        summary = RequestCartSummary(self.user)
+        self.assertEqual(summary["total_items"], 2)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(summary["total_price"], Decimal("38.00"))
+
+        order = Order.objects.create(user=self.user, product=self.product, quantity=1)
+        self.cart.orders.add(order)
+        self.assertEqual(summary["total_items"], 3)
+
+
+class LazyContextProcessorsTest(BaseTestCase):
+    """Tests des context processors paresseux"""
+
+    def test_static_pages_run_no_queries(self):
+        """À propos et FAQ ne lisent ni catégories ni panier : aucune requête"""
+        for name in ("pages:about", "pages:faq"):
+            with self.assertNumQueries(0):
+                response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+
+    def test_lazy_values_evaluated_on_read(self):
+        """Les valeurs paresseuses se comportent comme les valeurs calculées"""
+        from django.test import RequestFactory
+        from store.context_processors import cart_info, global_categories
+
+        request = RequestFactory().get("/")
+        request.user = self.user
+
+        with self.assertNumQueries(0):
+            context = {**global_categories(request), **cart_info(request)}
+
+        self.assertEqual([c.name for c in context["global_categories"]], ["Test Category"])
+        self.assertEqual(len(context["global_featured_categories"]), 0)
+        self.assertEqual(context["cart_total_items"], 0)
+        self.assertTrue(context["cart_is_empty"])
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class PageCacheTest(BaseTestCase):
+    """Tests du cache de pages anonymes"""
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+
+        cache.clear()
+
+    def test_static_page_served_from_cache(self):
+        """Deuxième visite anonyme servie depuis le cache, sans requête"""
+        url = reverse("pages:faq")
+        self.assertEqual(self.client.get(url)["X-Cache"], "MISS")
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url + "?utm_source=newsletter")
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertContains(response, "Puis-je suivre ma commande ?")
+
+        # Visiteur connecté : jamais de cache
+        self.client.force_login(self.user)
+        self.assertFalse(self.client.get(url).has_header("X-Cache"))
+
+    def test_catalog_change_purges_product_pages(self):
+        """Une modification de produit purge les pages de la boutique"""
+        product = Product.objects.create(
+            name="Pull", slug="pull", price=Decimal("60.00"), category=self.category
+        )
+        ProductVariant.objects.create(product=product, size="M", stock=2)
+        url = reverse("store:product_list")
+        self.assertEqual(self.client.get(url)["X-Cache"], "MISS")
+        self.assertEqual(self.client.get(url)["X-Cache"], "HIT")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.name = "Pull marin"
+            product.save()
+
+        response = self.client.get(url)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertContains(response, "pull marin")
+
+    def test_product_page_cached_and_view_counted(self):
+        """La fiche produit anonyme, sans jeton CSRF, est servie depuis le cache"""
+        product = Product.objects.create(
+            name="Chemise", slug="chemise", price=Decimal("45.00"), category=self.category
+        )
+        ProductVariant.objects.create(product=product, size="M", stock=2)
+        url = reverse("store:product_detail", args=[product.slug])
+
+        with patch("store.views.record_view") as record_view:
+            response = self.client.get(url)
+            self.assertEqual(response["X-Cache"], "MISS")
+            self.assertNotContains(response, "csrfmiddlewaretoken")
+            self.assertEqual(self.client.get(url)["X-Cache"], "HIT")
+        self.assertEqual(record_view.call_count, 2)
+
+        # Visiteur connecté : formulaire POST avec jeton
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(url), "csrfmiddlewaretoken")
+
+    def test_stale_page_served_while_revalidating(self):
+        """Page expirée servie périmée tant qu'une autre requête la recalcule"""
+        import time
+        from django.core.cache import cache
+        from django.test import RequestFactory
+        from store.middleware import page_cache_key
+
+        url = reverse("pages:about")
+        self.client.get(url)
+        key = page_cache_key(RequestFactory().get(url))
+        entry = cache.get(key)
+        cache.set(key, dict(entry, expires=time.time() - 1), 60)
+
+        cache.add(f"lock:{key}", 1, 30)
+        self.assertEqual(self.client.get(url)["X-Cache"], "STALE")
+
+        cache.delete(f"lock:{key}")
+        self.assertEqual(self.client.get(url)["X-Cache"], "MISS")
+        self.assertEqual(self.client.get(url)["X-Cache"], "HIT")
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class FragmentCacheTest(BaseTestCase):
+    """Tests du cache des cartes produit et de la navigation"""
+
+    def setUp(self):
+        super().setUp()
+        from django.core.cache import cache
+
+        cache.clear()
+        self.products = [
+            Product.objects.create(
+                name=f"Chemise {index}",
+                slug=f"chemise-{index}",
+                price=Decimal("40.00"),
+                category=self.category,
+            )
+            for index in range(3)
+        ]
+
+    def test_page_cards_read_with_one_multi_get(self):
+        """Une lecture groupée par page ; seules les cartes absentes sont rendues"""
+        from django.core.cache import cache
+        from store import fragments
+
+        template = "store/fragments/product_card.html"
+        fragments.render_product_fragments(template, self.products[:2])
+
+        with patch.object(cache, "get_many", wraps=cache.get_many) as get_many, \
+                patch.object(fragments, "render_to_string",
+                             wraps=fragments.render_to_string) as render:
+            cards = fragments.render_product_fragments(template, self.products)
+
+        get_many.assert_called_once()
+        render.assert_called_once()
+        self.assertEqual(set(cards), {product.pk for product in self.products})
+        self.assertIn("chemise 2", cards[self.products[2].pk])
+
+    def test_product_update_changes_card(self):
+        """Une modification du produit change la clé de sa carte"""
+        from store.fragments import product_fragment_key, render_product_fragments
+
+        template = "store/fragments/product_card.html"
+        product = self.products[0]
+        key = product_fragment_key(template, product)
+
+        product.name = "Chemise lin"
+        product.save()
+        product.refresh_from_db()
+
+        self.assertNotEqual(product_fragment_key(template, product), key)
+        self.assertIn(
+            "chemise lin", render_product_fragments(template, [product])[product.pk]
+        )
+
+    def test_category_nav_purged_by_category_change(self):
+        """La navigation des catégories est recalculée après un renommage"""
+        url = reverse("store:product_list")
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(url), "test category")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = "Chemises"
+            self.category.save()
+
+        response = self.client.get(url)
+        self.assertContains(response, "chemises")
+        self.assertNotContains(response, "test category")
+
+
+class StockDecrementTest(BaseTestCase):
+    """Tests du décrément atomique du stock"""
+
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(
+            name="Veste", slug="veste", price=Decimal("90.00"), category=self.category
+        )
+        self.small = ProductVariant.objects.create(
+            product=self.product, size="S", stock=3
+        )
+        self.medium = ProductVariant.objects.create(
+            product=self.product, size="M", stock=1
+        )
+
+    def test_reports_each_line(self):
+        """Chaque ligne réussit ou échoue indépendamment"""
+        from store.inventory import StockLine, decrement_stock
+
+        results = decrement_stock(
+            [
+                StockLine(self.product.pk, "M", 2),
+                StockLine(self.product.pk, "S", 2),
+                StockLine(self.product.pk, "XL", 1),
+            ]
+        )
+
+        self.assertEqual([result.ok for result in results], [False, True, False])
+        self.small.refresh_from_db()
+        self.medium.refresh_from_db()
+        self.assertEqual((self.small.stock, self.medium.stock), (1, 1))
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.total_stock, 2)
+
+    def test_stale_read_cannot_oversell(self):
+        """Le contrôle se fait dans l'UPDATE, pas sur une valeur lue avant"""
+        from store.inventory import StockLine, decrement_stock
+
+        line = StockLine(self.product.pk, "M", 1)
+        self.assertTrue(decrement_stock([line])[0].ok)
+        # Deuxième paiement ayant lu stock=1 avant le premier
+        self.assertFalse(decrement_stock([line])[0].ok)
+
+        self.medium.refresh_from_db()
+        self.assertEqual(self.medium.stock, 0)
+
+    def test_batch_uses_one_update_per_line(self):
+        """Un panier coûte une lecture, un UPDATE par ligne, un INSERT au
+        journal, la lecture des stocks et un résumé (plus le point de
+        sauvegarde)"""
+        from store.inventory import StockLine, decrement_stock
+
+        lines = [StockLine(self.product.pk, "S", 1), StockLine(self.product.pk, "M", 1)]
+        with self.assertNumQueries(len(lines) + 6):
+            results = decrement_stock(lines)
+        self.assertTrue(all(result.ok for result in results))
+
+    def test_sale_without_stockout_keeps_index_versions(self):
+        """Seule une rupture fait évoluer la version de l'inventaire"""
+        from store.inventory import StockLine, decrement_stock
+        from store.performance_utils import get_catalog_version, get_inventory_version
+
+        catalog, inventory = get_catalog_version(), get_inventory_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            decrement_stock([StockLine(self.product.pk, "S", 1)])
+        self.assertEqual(get_catalog_version(), catalog)
+        self.assertEqual(get_inventory_version(), inventory)
+
+        remaining = ProductVariant.objects.get(product=self.product, size="S").stock
+        with self.captureOnCommitCallbacks(execute=True):
+            decrement_stock([StockLine(self.product.pk, "S", remaining)])
+            # Rupture pas encore validée : les autres workers gardent l'ancienne version
+            self.assertEqual(get_inventory_version(), inventory)
+        self.assertEqual(get_catalog_version(), catalog)
+        self.assertNotEqual(get_inventory_version(), inventory)
+
+    def test_full_save_keeps_concurrent_derived_columns(self):
+        """Une sauvegarde complète ne réécrit pas le stock ni la popularité"""
+        from django.db.models import F
+
+        stale = Product.objects.get(pk=self.product.pk)
+        Product.objects.filter(pk=self.product.pk).update(
+            pending_views=F("pending_views") + 3
+        )
+        ProductVariant.objects.create(product=self.product, size="L", stock=5)
+
+        stale.name = "Veste en lin"
+        stale.save()
+        fresh = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(fresh.name, "Veste en lin")
+        self.assertEqual(fresh.pending_views, 3)
+        self.assertEqual(fresh.total_stock, stale.total_stock + 5)
+
+    def test_catalog_version_bumped_after_commit(self):
+        """La version du catalogue ne change qu'au commit de l'écriture"""
+        from store.performance_utils import get_catalog_version
+
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = Decimal("12.00")
+            self.product.save()
+            self.assertEqual(get_catalog_version(), version)
+        self.assertNotEqual(get_catalog_version(), version)
+
+
+class StockReservationTest(BaseTestCase):
+    """Tests des réservations de stock pendant le paiement"""
+
+    def setUp(self):
+        super().setUp()
+        self.other_user = User.objects.create_user(
+            username="autre", email="autre@example.com", password="testpass123"
+        )
+        self.product = Product.objects.create(
+            name="Robe", slug="robe", price=Decimal("70.00"), category=self.category
+        )
+        self.variant = ProductVariant.objects.create(
+            product=self.product, size="M", stock=2
+        )
+
+    def test_hold_reduces_available_stock(self):
+        """Une réservation active retient le stock des autres paniers"""
+        from store.inventory import StockLine, available_stock, reserve_stock
+
+        line = StockLine(self.product.pk, "M", 2)
+        self.assertTrue(reserve_stock([line], "pi_1", user=self.user)[0].ok)
+        self.assertEqual(available_stock([self.variant.pk]), {self.variant.pk: 0})
+        self.assertFalse(reserve_stock([line], "pi_2", user=self.other_user)[0].ok)
+
+        # Nouveau PaymentIntent du même acheteur : remplace sa réservation
+        self.assertTrue(reserve_stock([line], "pi_3", user=self.user)[0].ok)
+
+    def test_confirmation_consumes_own_hold_only(self):
+        """La confirmation décrémente malgré sa propre réservation, pas celle d'un autre"""
+        from store.inventory import StockLine, decrement_stock, reserve_stock
+        from store.models import StockReservation
+
+        line = StockLine(self.product.pk, "M", 1)
+        reserve_stock([line], "pi_1", user=self.user)
+        reserve_stock([line], "pi_2", user=self.other_user)
+
+        # Paiement sans réservation : tout le stock est retenu
+        self.assertFalse(decrement_stock([line])[0].ok)
+        self.assertTrue(decrement_stock([line], reference="pi_1")[0].ok)
+
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 1)
+        self.assertEqual(
+            list(StockReservation.objects.values_list("reference", flat=True)),
+            ["pi_2"],
+        )
+
+    def test_validation_ignores_buyer_own_hold(self):
+        """Un PaymentIntent abandonné ne bloque pas le panier de son acheteur"""
+        from store.inventory import StockLine, reserve_stock, validate_cart_lines
+
+        line = StockLine(self.product.pk, "M", 2)
+        reserve_stock([line], "pi_1", user=self.user)
+        self.assertFalse(validate_cart_lines([line])[0].available)
+        self.assertTrue(validate_cart_lines([line], user=self.user)[0].available)
+        self.assertFalse(validate_cart_lines([line], user=self.other_user)[0].available)
+
+        order = Order.objects.create(
+            user=self.user, product=self.product, size="M", quantity=2
+        )
+        Cart.objects.create(user=self.user).orders.add(order)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("store:checkout"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_reorder_out_of_stock_redirects_to_store_history(self):
+        """Réassort impossible : retour à l'historique des commandes de la boutique"""
+        order = Order.objects.create(
+            user=self.user, product=self.product, size="M", quantity=5, ordered=True
+        )
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("store:reorder", args=[order.id]))
+        self.assertRedirects(
+            response, reverse("store:order_history"), fetch_redirect_response=False
+        )
+
+    def test_paid_cart_consumes_buyer_holds_or_refuses(self):
+        """Les réservations de l'acheteur ne bloquent pas son paiement ; une rupture lève"""
+        from accounts.payment_views import _decrement_cart_stock
+        from store.inventory import InsufficientStockError, StockLine, reserve_stock
+        from store.models import StockReservation
+
+        order = Order.objects.create(
+            user=self.user, product=self.product, size="M", quantity=2
+        )
+        reserve_stock([order], "pi_abandonne", user=self.user)
+        _decrement_cart_stock([order], user=self.user)
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+        self.variant.stock = 2
+        self.variant.save()
+        reserve_stock([StockLine(self.product.pk, "M", 1)], "pi_2", user=self.other_user)
+        with self.assertRaises(InsufficientStockError) as raised:
+            with transaction.atomic():
+                _decrement_cart_stock([order], user=self.user)
+        self.assertEqual(raised.exception.lines, [order])
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 2)
+
+    def test_webhook_refunds_out_of_stock_payment(self):
+        """Le webhook Stripe ne valide pas un panier en rupture : il rembourse"""
+        from accounts.models import Transaction
+        from accounts.webhook_services import StripeWebhookService
+
+        order = Order.objects.create(
+            user=self.user, product=self.product, size="M", quantity=3
+        )
+        payment = Transaction.objects.create(
+            user=self.user, transaction_id="pi_rupture", provider="stripe",
+            amount=Decimal("210.00"), status="pending", order_id=str(order.id),
+        )
+        event = {"data": {"object": {"id": "pi_rupture", "amount_received": 21000}}}
+
+        with patch(
+            "accounts.payment_services.StripePaymentProcessor.create_refund"
+        ) as create_refund:
+            result = StripeWebhookService._handle_payment_success(
+                event, MagicMock()
+            )
+
+        self.assertTrue(result["success"])
+        create_refund.assert_called_once_with("pi_rupture")
+        payment.refresh_from_db()
+        order.refresh_from_db()
+        self.variant.refresh_from_db()
+        self.assertEqual(payment.status, "refunded")
+        self.assertEqual(payment.metadata["stock_issue_orders"], [order.id])
+        self.assertFalse(order.ordered)
+        self.assertEqual(self.variant.stock, 2)
+
+    def test_sweeper_deletes_expired_holds(self):
+        """Les réservations expirées ne comptent plus et sont supprimées par lots"""
+        from django.core.management import call_command
+        from io import StringIO
+        from store.inventory import StockLine, available_stock, reserve_stock
+        from store.models import StockReservation
+
+        reserve_stock([StockLine(self.product.pk, "M", 1)], "pi_1", ttl=-1)
+        reserve_stock([StockLine(self.product.pk, "M", 1)], "pi_2", ttl=-1)
+        reserve_stock([StockLine(self.product.pk, "M", 1)], "pi_3", ttl=60)
+        self.assertEqual(available_stock([self.variant.pk]), {self.variant.pk: 1})
+
+        out = StringIO()
+        call_command("release_expired_reservations", batch_size=1, stdout=out)
+        self.assertIn("2 réservation(s)", out.getvalue())
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+
+class CartValidationTest(BaseTestCase):
+    """Tests de la validation groupée des lignes de panier"""
+
+    def setUp(self):
+        super().setUp()
+        from store.inventory import StockLine
+
+        self.StockLine = StockLine
+        self.shirt = Product.objects.create(
+            name="Polo", slug="polo", price=Decimal("35.00"), category=self.category
+        )
+        self.shirt_m = ProductVariant.objects.create(
+            product=self.shirt, size="M", stock=3, price=Decimal("39.00")
+        )
+        self.shirt_l = ProductVariant.objects.create(product=self.shirt, size="L", stock=1)
+        self.hat = Product.objects.create(
+            name="Bob", slug="bob", price=Decimal("15.00"), category=self.category
+        )
+
+    def test_all_lines_in_one_query(self):
+        """Disponibilité, maximum et prix de tout le panier en une requête"""
+        from store.inventory import reserve_stock, validate_cart_lines
+
+        reserve_stock([self.StockLine(self.shirt.pk, "M", 1)], "pi_autre")
+        lines = [
+            self.StockLine(self.shirt.pk, "M", 2),
+            self.StockLine(self.shirt.pk, "L", 2),
+            self.StockLine(self.shirt.pk, "XL", 1),
+            self.StockLine(self.hat.pk, None, 1),
+        ]
+        with self.assertNumQueries(1):
+            checks = validate_cart_lines(lines)
+
+        self.assertEqual(
+            [(check.available, check.max_quantity, check.price) for check in checks],
+            [
+                (True, 2, Decimal("39.00")),
+                (False, 1, Decimal("35.00")),
+                (False, 0, Decimal("35.00")),
+                (False, 0, Decimal("15.00")),
+            ],
+        )
+
+    def test_lines_share_variant_stock(self):
+        """Deux lignes de la même variante se partagent son stock"""
+        from store.inventory import validate_cart_lines
+
+        first, second = validate_cart_lines(
+            [self.StockLine(self.shirt.pk, "M", 2), self.StockLine(self.shirt.pk, "M", 2)]
+        )
+        self.assertTrue(first.available)
+        self.assertFalse(second.available)
+        self.assertEqual(second.max_quantity, 1)
+
+    def test_increase_quantity_uses_variant_stock(self):
+        """Le bouton + du panier respecte le stock de la variante"""
+        self.client.force_login(self.user)
+        order = Order.objects.create(
+            user=self.user, product=self.shirt, quantity=1, size="L"
+        )
+        self.client.get(reverse("store:increase_quantity", args=[order.id]))
+        order.refresh_from_db()
+        self.assertEqual(order.quantity, 1)
+
+        order.size = "M"
+        order.save()
+        self.client.get(reverse("store:increase_quantity", args=[order.id]))
+        order.refresh_from_db()
+        self.assertEqual(order.quantity, 2)
+
+    def test_add_to_cart_counts_quantity_already_in_cart(self):
+        """L'ajout au panier compare le total au stock disponible"""
+        self.client.force_login(self.user)
+        url = reverse("store:add_to_cart", args=[self.shirt.slug])
+
+        self.client.post(url, {"size": "M", "quantity": 2})
+        self.client.post(url, {"size": "M", "quantity": 2})
+        self.client.post(url, {"quantity": 1})
+
+        orders = Order.objects.filter(user=self.user, ordered=False)
+        self.assertEqual([(order.size, order.quantity) for order in orders], [("M", 2)])
+
+
+class InventoryLedgerTest(BaseTestCase):
+    """Tests du journal des mouvements de stock"""
+
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(
+            name="Jean", slug="jean", price=Decimal("80.00"), category=self.category
+        )
+        self.variant = ProductVariant.objects.create(
+            product=self.product, size="32", stock=5
+        )
+
+    def test_every_change_is_journaled(self):
+        """Import, vente, ajustement manuel et annulation sont journalisés"""
+        from store.inventory import decrement_stock, ledger_stock, reconcile
+        from store.models import InventoryMovement
+
+        order = Order.objects.create(
+            user=self.user, product=self.product, quantity=2, size="32", ordered=True,
+            date_ordered=timezone.now(),
+        )
+        decrement_stock([order])
+
+        variant = ProductVariant.objects.get(pk=self.variant.pk)
+        variant.stock += 10
+        variant.save()
+
+        self.client.force_login(self.user)
+        self.client.post(reverse("store:cancel_order", args=[order.id]))
+
+        self.assertEqual(
+            list(
+                InventoryMovement.objects.order_by("id").values_list("reason", "quantity")
+            ),
+            [("import", 5), ("sale", -2), ("adjustment", 10), ("cancellation", 2)],
+        )
+        variant.refresh_from_db()
+        self.assertEqual(variant.stock, 15)
+        self.assertEqual(ledger_stock([variant.pk]), {variant.pk: 15})
+        self.assertEqual(reconcile(), {})
+
+    def test_import_variants_update_stock_summary_and_ledger(self):
+        """Les variantes importées en masse sont en stock et journalisées"""
+        from store.management.commands.import_products import Command
+        from store.models import InventoryMovement
+
+        product = Product.objects.create(
+            name="Robe import", slug="robe-import", price=Decimal("50.00")
+        )
+        Command().create_variants(product, "Women", "Robe import")
+
+        product.refresh_from_db()
+        variants = list(product.variants.all())
+        self.assertEqual(len(variants), 4)
+        self.assertEqual(product.total_stock, sum(v.stock for v in variants))
+        self.assertTrue(product.is_in_stock)
+        self.assertEqual(product.in_stock_variant_count, 4)
+        self.assertEqual(
+            InventoryMovement.objects.filter(variant__product=product).count(), 4
+        )
+
+    def test_restock_without_sale_only_before_ledger(self):
+        """Sans vente journalisée, seule une commande antérieure au journal est remise"""
+        from store.inventory import decrement_stock, restock_order
+        from store.models import InventoryMovement
+
+        recent = Order.objects.create(
+            user=self.user, product=self.product, quantity=2, size="32", ordered=True,
+            date_ordered=timezone.now(),
+        )
+        self.assertEqual(restock_order(recent), [])
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 5)
+
+        legacy = Order.objects.create(
+            user=self.user, product=self.product, quantity=2, size="32", ordered=True,
+            date_ordered=timezone.now() - timezone.timedelta(days=30),
+        )
+        self.assertEqual(len(restock_order(legacy)), 1)
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 7)
+
+        # La vente garde la référence de la commande supprimée à l'annulation
+        decrement_stock([recent])
+        self.client.force_login(self.user)
+        self.client.post(reverse("store:cancel_order", args=[recent.id]))
+        sale = InventoryMovement.objects.get(reason=InventoryMovement.SALE)
+        self.assertIsNone(sale.order_id)
+        self.assertEqual(sale.note, f"Commande #{recent.id}")
+
+    def test_compaction_keeps_balance_and_history(self):
+        """Les instantanés reprennent le solde ; les mouvements restent lisibles"""
+        from store.inventory import (
+            StockLine, compact_ledger, decrement_stock, ledger_stock,
+        )
+        from store.models import InventoryMovement, InventorySnapshot
+
+        decrement_stock([StockLine(self.product.pk, "32", 1)])
+        now = timezone.now()
+
+        self.assertEqual(compact_ledger(now), (1, 0))
+        snapshot = InventorySnapshot.objects.get()
+        self.assertEqual((snapshot.stock, snapshot.movement_count), (4, 2))
+        self.assertEqual(InventoryMovement.objects.count(), 2)
+
+        decrement_stock([StockLine(self.product.pk, "32", 1)])
+        self.assertEqual(ledger_stock([self.variant.pk]), {self.variant.pk: 3})
+
+        # Élagage : seuls les mouvements déjà repliés disparaissent
+        self.assertEqual(compact_ledger(now, prune_before=now), (0, 2))
+        self.assertEqual(ledger_stock([self.variant.pk]), {self.variant.pk: 3})
+
+    def test_reconcile_reports_drift(self):
+        """Une écriture hors journal apparaît à la réconciliation"""
+        from store.inventory import reconcile
+
+        ProductVariant.objects.filter(pk=self.variant.pk).update(stock=7)
+        self.assertEqual(reconcile(), {self.variant.pk: (7, 5)})
+
+
+class CartItemTest(BaseTestCase):
+    """Tests des lignes de panier et des totaux maintenus sur Cart"""
+
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(
+            name="Sweat", slug="sweat", price=Decimal("40.00"), category=self.category
+        )
+        self.variant = ProductVariant.objects.create(
+            product=self.product, size="L", stock=10
+        )
+        self.cart = Cart.objects.create(user=self.user)
+        self.order = Order.objects.create(
+            user=self.user, product=self.product, quantity=2, size="L"
+        )
+        self.cart.orders.add(self.order)
+
+    def test_totals_follow_cart_writes(self):
+        """Ajout, changement de quantité et paiement mettent à jour les totaux"""
+        from store.models import CartItem
+
+        item = CartItem.objects.get()
+        self.assertEqual(
+            (item.variant_id, item.product_id, item.quantity),
+            (self.variant.pk, self.product.pk, 2),
+        )
+        self.assertEqual(
+            (self.cart.item_count, self.cart.subtotal), (2, Decimal("80.00"))
+        )
+
+        self.order.quantity = 3
+        self.order.save()
+        self.cart.refresh_from_db()
+        self.assertEqual(
+            (self.cart.total_items, self.cart.total_price), (3, Decimal("120.00"))
+        )
+
+        # Commande payée : elle quitte le panier
+        self.order.ordered = True
+        self.order.save()
+        self.cart.refresh_from_db()
+        self.assertTrue(self.cart.is_empty)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_price_change_and_clear(self):
+        """Un changement de prix recalcule le panier ; clear le vide"""
+        product = Product.objects.get(pk=self.product.pk)
+        product.price = Decimal("30.00")
+        product.save()
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.subtotal, Decimal("60.00"))
+
+        self.cart.clear()
+        self.assertEqual((self.cart.item_count, self.cart.subtotal), (0, 0))
+        self.assertFalse(Order.objects.filter(pk=self.order.pk).exists())
+
+    def test_badge_reads_single_row(self):
+        """Le badge du panier ne lit que la ligne Cart"""
+        from django.template import Context, Template
+
+        from store.middleware import RequestCartSummary
+
+        request = MagicMock(user=self.user)
+        request.cart_summary = RequestCartSummary(self.user)
+        template = Template("{% load cart_tags %}{% cart_badge user %}")
+        with self.assertNumQueries(1):
+            html = template.render(Context({"request": request, "user": self.user}))
+        self.assertIn("2", html)
@@ -7,6 +7,7 @@ urlpatterns = [
     path("", views.product_list, name="product_list"),
     path("product/<str:slug>/", views.product_detail, name="product_detail"),
     path("product/<str:slug>/add-to-cart/", views.add_to_cart, name="add_to_cart"),
+    path("suggestions/", views.search_suggestions, name="search_suggestions"),
     path("category/<slug:category_slug>/", views.category_view, name="category"),
     path("cart/", views.cart, name="cart"),
     path("cart/delete/", views.delete_cart, name="delete_cart"),
@@ -4,11 +4,32 @@ from django.contrib import messages
 from django.core.exceptions import ValidationError
 from django.db import transaction
 from django.utils import timezone
-from django.core.paginator import Paginator
+from django.utils.functional import SimpleLazyObject
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from store.models import Cart, Order, Product, Wishlist
-from .performance_utils import measure_performance
+from . import cache_codec
+from .performance_utils import get_or_compute, measure_performance
+from .search import search_products
+from .facets import (
+    FacetPaginator,
+    get_facet_rows_cached,
+    get_size_facet_rows_cached,
+    summarize_facets,
+    summarize_size_facets,
+)
+from .pagination import KeysetPaginator
+from .catalog_index import (
+    CATALOG_INDEX_SORTS,
+    get_catalog_index,
+    paginate_product_ids,
+)
+from .suggestions import get_suggestion_index
+from .size_index import get_size_index
+from .recommendations import cart_recommendations
+from .popularity import record_view
+from .middleware import add_page_cache_tags, get_request_cart_summary, page_cache
+from .inventory import StockLine, restock_order, validate_cart_lines
 import logging
 from accounts.email_services import EmailService
 
@@ -18,59 +39,118 @@ logger = logging.getLogger(__name__)
 # Create your views here.
 
 
+@page_cache(tags=("product:*", "category:*"))
 @measure_performance
 def product_list(request):
     """
     Vue principale de la boutique - tous les produits avec filtres avancés.
     Remplace les pages de catégories séparées pour une navigation unifiée.
     """
-    from django.db.models import Q, Min, Max
-    from store.models import Category
+    from django.db.models import Exists, OuterRef, Q
+    from store.models import Category, ProductVariant
 
     # Récupérer tous les filtres depuis les paramètres GET
     search_query = request.GET.get("q", "")
     category_slug = request.GET.get("category", "")
     price_min = request.GET.get("price_min", "")
     price_max = request.GET.get("price_max", "")
+    # Borne haute exclue (liens des tranches de prix, voir store.facets)
+    price_below = request.GET.get("price_below", "")
     stock_filter = request.GET.get("stock", "")
-    sort_by = request.GET.get("sort", "-created_at")
+    size_filter = request.GET.get("size", "")
+    sort_by = request.GET.get("sort", "relevance" if search_query else "-created_at")
 
     # Base queryset optimisée
     products_queryset = Product.objects.select_related("category")
 
-    # Filtrage par catégorie si spécifié
-    selected_category = None
-    if category_slug:
-        try:
-            selected_category = Category.objects.get(slug=category_slug)
-            products_queryset = products_queryset.filter(category=selected_category)
-        except Category.DoesNotExist:
-            pass
-
-    # Appliquer les filtres de recherche
+    # Recherche plein texte indexée, classée par pertinence
     if search_query:
+        products_queryset = search_products(products_queryset, search_query)
+
+    # Filtres de prix (valeurs normalisées pour la clé de cache des facettes)
+    try:
+        price_min_value = float(price_min) if price_min else None
+    except ValueError:
+        price_min_value = None
+    try:
+        price_max_value = float(price_max) if price_max else None
+    except ValueError:
+        price_max_value = None
+    try:
+        price_below_value = float(price_below) if price_below else None
+    except ValueError:
+        price_below_value = None
+
+    if price_min_value is not None:
+        products_queryset = products_queryset.filter(price__gte=price_min_value)
+    if price_max_value is not None:
+        products_queryset = products_queryset.filter(price__lte=price_max_value)
+    if price_below_value is not None:
+        products_queryset = products_queryset.filter(price__lt=price_below_value)
+
+    # Filtre de taille : variante de cette taille en stock (EXISTS, pas de liste d'ids)
+    size_index = get_size_index()
+    if size_filter not in size_index.sizes:
+        size_filter = ""
+    unsized_queryset = products_queryset
+    if size_filter:
         products_queryset = products_queryset.filter(
-            Q(name__icontains=search_query) | Q(description__icontains=search_query)
+            Exists(
+                ProductVariant.objects.filter(
+                    product=OuterRef("pk"), size=size_filter, stock__gt=0
+                )
+            )
         )
 
-    # Filtres de prix
-    if price_min:
-        try:
-            products_queryset = products_queryset.filter(price__gte=float(price_min))
-        except ValueError:
-            pass
+    # Facettes calculées avant les filtres catégorie/stock, appliqués ensuite en Python
+    facet_rows = get_facet_rows_cached(
+        products_queryset,
+        search_query,
+        price_min_value,
+        price_max_value,
+        size_filter,
+        price_below=price_below_value,
+    )
 
-    if price_max:
+    # Filtrage par catégorie si spécifié
+    selected_category = None
+    selection = Q()
+    if category_slug:
         try:
-            products_queryset = products_queryset.filter(price__lte=float(price_max))
-        except ValueError:
+            selected_category = Category.objects.get(slug=category_slug)
+            selection &= Q(category=selected_category)
+        except Category.DoesNotExist:
             pass
 
     # Filtre de stock
     if stock_filter == "in":
-        products_queryset = products_queryset.filter(variants__stock__gt=0).distinct()
+        selection &= Q(is_in_stock=True)
     elif stock_filter == "out":
-        products_queryset = products_queryset.exclude(variants__stock__gt=0)
+        selection &= Q(is_in_stock=False)
+
+    products_queryset = products_queryset.filter(selection)
+
+    # Facette taille : requête groupée hors filtre de taille, en cache avec les facettes
+    size_facets = []
+    if size_index.sizes:
+        size_facets = summarize_size_facets(
+            get_size_facet_rows_cached(
+                unsized_queryset,
+                search_query,
+                price_min_value,
+                price_max_value,
+                price_below=price_below_value,
+            ),
+            size_index.sizes,
+            category_id=selected_category.id if selected_category else None,
+            stock_filter=stock_filter,
+        )
+
+    facets = summarize_facets(
+        facet_rows,
+        category_id=selected_category.id if selected_category else None,
+        stock_filter=stock_filter,
+    )
 
     # Tri
     valid_sorts = {
@@ -80,46 +160,88 @@ def product_list(request):
         "-price": "-price",
         "created_at": "created_at",
         "-created_at": "-created_at",
-        "stock": "variants__stock",
-        "-stock": "-variants__stock",
+        "stock": "total_stock",
+        "-stock": "-total_stock",
+        "popular": "-popularity_score",
     }
 
+    # Tous les tris portent sur des colonnes : utilisables par la pagination par curseur
+    keyset_sorts = set(valid_sorts)
+
     if sort_by in valid_sorts:
         products_queryset = products_queryset.order_by(valid_sorts[sort_by])
+    elif search_query and sort_by == "relevance":
+        # Conserver le tri par pertinence de l'index de recherche
+        pass
     else:
         products_queryset = products_queryset.order_by("-created_at")
 
-    # Pagination
-    paginator = Paginator(products_queryset, 12)
-    page_number = request.GET.get("page")
-    products = paginator.get_page(page_number)
-
-    # Statistiques pour les filtres
-    total_products = products_queryset.count()
-    in_stock_count = products_queryset.filter(variants__stock__gt=0).distinct().count()
-
-    # Prix min/max pour les curseurs de prix
-    price_range = products_queryset.aggregate(
-        min_price=Min("price"), max_price=Max("price")
-    )
+    # Mode curseur (défilement infini) : ?cursor=<jeton>, vide pour la première page
+    cursor_mode = "cursor" in request.GET and sort_by in keyset_sorts
+    # Index NumPy en mémoire (optionnel) pour les combinaisons sans recherche
+    catalog_index = None
+    if not cursor_mode and not search_query and sort_by in CATALOG_INDEX_SORTS:
+        catalog_index = get_catalog_index()
+
+    if cursor_mode:
+        paginator = KeysetPaginator(products_queryset, 12, (valid_sorts[sort_by],))
+        products = paginator.get_page(request.GET.get("cursor"))
+    elif catalog_index is not None:
+        product_ids = catalog_index.query(
+            category_id=selected_category.id if selected_category else None,
+            price_min=price_min_value,
+            price_max=price_max_value,
+            price_below=price_below_value,
+            stock_filter=stock_filter,
+            sort=sort_by,
+            product_ids=size_index.product_ids(size_filter) if size_filter else None,
+        )
+        products = paginate_product_ids(product_ids, 12, request.GET.get("page"))
+    else:
+        # Pagination (le total vient des facettes : pas de COUNT supplémentaire)
+        paginator = FacetPaginator(products_queryset, 12, count=facets["total"])
+        page_number = request.GET.get("page")
+        products = paginator.get_page(page_number)
+
+    # Matrice des tailles des cartes, lue dans l'index (pas de requête par produit)
+    products.object_list = list(products.object_list)
+    for product in products.object_list:
+        product.size_availability = size_index.availability(product.id)
+
+    total_products = facets["total"]
+    in_stock_count = facets["in_stock"]
+    price_range = facets["price_range"]
+
+    # Récupérer toutes les catégories pour le menu de filtres, avec leurs effectifs
+    # (paresseux : inutile quand le fragment de navigation est en cache)
+    def category_nav():
+        categories = list(Category.objects.filter(is_active=True).order_by("name"))
+        for category in categories:
+            category.facet_count = facets["categories"].get(category.id, 0)
+        return categories
 
-    # Récupérer toutes les catégories pour le menu de filtres
-    all_categories = Category.objects.filter(is_active=True).order_by("name")
+    all_categories = SimpleLazyObject(category_nav)
 
     context = {
         "products": products,
+        "cursor_mode": cursor_mode,
         "search_query": search_query,
         "selected_category": selected_category,
         "category_slug": category_slug,
         "all_categories": all_categories,
+        "category_facets": sorted(facets["categories"].items(), key=str),
         "total_products": total_products,
         "in_stock_count": in_stock_count,
         "out_of_stock_count": total_products - in_stock_count,
         "price_range": price_range,
+        "price_buckets": facets["price_buckets"],
+        "size_facets": size_facets,
         "current_filters": {
             "price_min": price_min,
             "price_max": price_max,
+            "price_below": price_below,
             "stock": stock_filter,
+            "size": size_filter,
             "sort": sort_by,
         },
         "page_title": (
@@ -132,56 +254,65 @@ def product_list(request):
     return render(request, "store/product_list.html", context)
 
 
+@page_cache(tags=("product:*", "category:*"))
 @measure_performance
 def index(request):
     """
     Landing page de présentation pure - focus sur l'expérience et les catégories.
     """
-    from django.db.models import Count, Q, Avg
-    from django.core.cache import cache
+    from django.db.models import Count, Q
     from store.models import Category
 
     # === SECTION LANDING PAGE PRÉSENTATION ===
 
     # 1. Catégories vedettes pour la navigation principale
-    featured_categories = cache.get("featured_categories")
-    if featured_categories is None:
-        featured_categories_qs = (
+    featured_categories = get_or_compute(
+        "featured_categories",
+        # Convertir en liste pour éviter les problèmes de sérialisation
+        lambda: list(
             Category.objects.filter(is_featured=True, is_active=True)
             .annotate(
-                # Temporairement : compter tous les produits
-                products_in_stock=Count("product")
+                products_in_stock=Count("product", filter=Q(product__is_in_stock=True))
             )
             .order_by("display_order", "name")[:6]
-        )
-        # Convertir en liste pour éviter les problèmes de sérialisation
-        featured_categories = list(featured_categories_qs)
-        cache.set("featured_categories", featured_categories, 3600)  # 1h
+        ),
+        3600,  # 1h
+        tags=("catalog", "inventory"),
+    )
 
     # 2. Produits vedettes - récupérer plus de produits pour la grille
-    hero_products = cache.get("hero_products")
-    if hero_products is None:
-        # Récupérer 20 produits pour remplir toute la grille
-        hero_products = (
+    # Récupérer 20 produits pour remplir toute la grille (demande récente d'abord)
+    hero_products = get_or_compute(
+        "hero_products",
+        lambda: list(
             Product.objects.select_related("category")
             .filter(category__is_active=True)
-            .annotate(rating_avg=Avg("rating"))
-            .order_by("-rating_avg", "-created_at")[:20]
-        )
-        cache.set("hero_products", hero_products, 1800)  # 30min
+            .order_by("-popularity_score", "-rating", "-created_at")[:20]
+        ),
+        1800,  # 30min
+        tags=("catalog",),
+        codec=cache_codec,
+    )
 
     # 3. Produits par catégorie pour diversité
-    products_by_category = cache.get("products_by_category")
-    if products_by_category is None:
+    def compute_products_by_category():
         products_by_category = {}
         categories = Category.objects.filter(is_active=True)[:6]
         for category in categories:
-            products_by_category[category.slug] = (
+            products_by_category[category.slug] = list(
                 Product.objects.select_related("category")
                 .filter(category=category)
                 .order_by("-created_at")[:5]
             )
-        cache.set("products_by_category", products_by_category, 1800)
+        return products_by_category
+
+    products_by_category = get_or_compute(
+        "products_by_category",
+        compute_products_by_category,
+        1800,
+        tags=("catalog",),
+        codec=cache_codec,
+    )
 
     # 4. Nouveautés et tendances
     new_arrivals = (
@@ -190,25 +321,27 @@ def index(request):
         .order_by("-created_at")[:8]
     )
 
+    # Tendances : score de popularité (ventes et consultations récentes)
     trending_products = (
         Product.objects.select_related("category")
         .filter(category__is_active=True)
-        .order_by("-id")[:8]
+        .order_by("-popularity_score", "-created_at")[:8]
     )
 
     # === STATISTIQUES DE LA BOUTIQUE ===
 
-    shop_stats = cache.get("shop_stats")
-    if shop_stats is None:
-        shop_stats = {
+    shop_stats = get_or_compute(
+        "shop_stats",
+        lambda: {
             "total_products": Product.objects.filter(category__is_active=True).count(),
             "total_categories": Category.objects.filter(is_active=True).count(),
-            # Temporairement : tous les produits considérés en stock
             "products_in_stock": Product.objects.filter(
-                category__is_active=True
+                category__is_active=True, is_in_stock=True
             ).count(),
-        }
-        cache.set("shop_stats", shop_stats, 3600)  # 1h
+        },
+        3600,  # 1h
+        tags=("catalog", "inventory"),
+    )
 
     context = {
         # Landing page de présentation
@@ -223,8 +356,15 @@ def index(request):
 
 
 # Fonction pour afficher les détails d'un produit
+def _record_cached_product_view(request, meta):
+    record_view(meta["product_id"])
+
+
+@page_cache(tags=("category:*",), on_hit=_record_cached_product_view)
 def product_detail(request, slug):
     product = get_object_or_404(Product, slug=slug)
+    record_view(product.id)
+    request.page_cache_meta = {"product_id": product.id}
 
     # Récupérer toutes les variantes disponibles pour ce produit
     variants = product.variants.all().order_by("size")
@@ -233,22 +373,43 @@ def product_detail(request, slug):
     # Sélectionner la première variante disponible par défaut
     selected_variant = available_variants.first()
 
-    # Récupérer des produits similaires (même catégorie ou produits récents)
-    similar_products = (
-        Product.objects.exclude(id=product.id).filter(variants__stock__gt=0).distinct()
+    # Produits similaires précalculés (store.similarity), lus sur l'index (product, rank)
+    similar_products = list(
+        Product.objects.filter(similar_to__product=product, is_in_stock=True)
+        .select_related("category")
+        .order_by("similar_to__rank")[:5]
     )
 
-    # Prioriser les produits de la même catégorie
-    if product.category:
-        similar_products = similar_products.filter(category=product.category)[:5]
-    else:
-        similar_products = similar_products.order_by("-created_at")[:5]
+    # Table pas encore calculée pour ce produit : même catégorie ou produits récents
+    if not similar_products:
+        similar_products = Product.objects.exclude(id=product.id).filter(
+            is_in_stock=True
+        )
+        if product.category:
+            similar_products = similar_products.filter(category=product.category)[:5]
+        else:
+            similar_products = similar_products.order_by("-created_at")[:5]
+
+    # Souvent achetés ensemble (store.recommendations), index (product, rank)
+    bought_together = (
+        Product.objects.filter(bought_with__product=product, is_in_stock=True)
+        .order_by("bought_with__rank")[:4]
+    )
+
+    # Page en cache purgée si ce produit ou un produit affiché change
+    add_page_cache_tags(
+        request,
+        f"product:{product.id}",
+        *(f"product:{p.id}" for p in similar_products),
+        *(f"product:{p.id}" for p in bought_together),
+    )
 
     context = {
         "product": product,
         "variants": variants,
         "available_variants": available_variants,
         "similar_products": similar_products,
+        "bought_together": bought_together,
         "selected_variant": selected_variant,
     }
     return render(request, "store/product_detail.html", context)
@@ -280,37 +441,6 @@ def add_to_cart(request, slug):
                 else request.GET.get("quantity", 1)
             )
 
-            # Vérifier qu'une taille a été sélectionnée si le produit a des variants
-            if product.variants.exists() and not selected_size:
-                messages.error(request, "Veuillez sélectionner une taille.")
-                return redirect(reverse("store:product_detail", kwargs={"slug": slug}))
-
-            # Vérifier le stock de la variante si une taille est sélectionnée
-            if selected_size and product.variants.exists():
-                try:
-                    from store.models import ProductVariant
-
-                    variant = product.variants.get(size=selected_size)
-                    if variant.stock < quantity_requested:
-                        messages.error(
-                            request,
-                            f"Stock insuffisant pour la taille {selected_size}. "
-                            f"Seulement {variant.stock} disponible(s).",
-                        )
-                        return redirect(
-                            reverse("store:product_detail", kwargs={"slug": slug})
-                        )
-                except ProductVariant.DoesNotExist:
-                    messages.error(request, f"Taille {selected_size} non disponible.")
-                    return redirect(
-                        reverse("store:product_detail", kwargs={"slug": slug})
-                    )
-
-            # Vérifier que le produit a des variantes en stock
-            if not product.is_available:
-                messages.error(request, f"'{product.name}' n'est plus disponible.")
-                return redirect(reverse("store:product_detail", kwargs={"slug": slug}))
-
             # Créer ou récupérer le panier
             cart_obj, _ = Cart.objects.get_or_create(user=user)
 
@@ -318,25 +448,44 @@ def add_to_cart(request, slug):
             existing_order = cart_obj.orders.filter(
                 product=product, ordered=False, size=selected_size or ""
             ).first()
+            new_quantity = quantity_requested + (
+                existing_order.quantity if existing_order else 0
+            )
+
+            # Stock de la variante (réservations déduites), en une requête
+            (check,) = validate_cart_lines(
+                [StockLine(product.pk, selected_size, new_quantity)], user=request.user
+            )
+            if check.variant_id is None:
+                if selected_size:
+                    messages.error(request, f"Taille {selected_size} non disponible.")
+                else:
+                    messages.error(request, f"'{product.name}' n'est plus disponible.")
+                return redirect(reverse("store:product_detail", kwargs={"slug": slug}))
+
+            # Vérifier qu'une taille a été sélectionnée si le produit a des variants
+            if not selected_size:
+                messages.error(request, "Veuillez sélectionner une taille.")
+                return redirect(reverse("store:product_detail", kwargs={"slug": slug}))
+
+            if not check.available:
+                if existing_order:
+                    messages.warning(
+                        request,
+                        f"Impossible d'ajouter {quantity_requested} article(s). "
+                        f"Stock maximum pour la taille {selected_size}: {check.max_quantity}. "
+                        f"Vous en avez déjà {existing_order.quantity} dans votre panier.",
+                    )
+                else:
+                    messages.error(
+                        request,
+                        f"Stock insuffisant pour la taille {selected_size}. "
+                        f"Seulement {check.max_quantity} disponible(s).",
+                    )
+                return redirect(reverse("store:product_detail", kwargs={"slug": slug}))
 
             if existing_order:
                 # Le produit est déjà dans le panier - augmenter la quantité
-                # Vérifier d'abord que nous ne dépassons pas le stock
-                new_quantity = existing_order.quantity + quantity_requested
-
-                if selected_size and product.variants.exists():
-                    variant = product.variants.get(size=selected_size)
-                    if new_quantity > variant.stock:
-                        messages.warning(
-                            request,
-                            f"Impossible d'ajouter {quantity_requested} article(s). "
-                            f"Stock maximum pour la taille {selected_size}: {variant.stock}. "
-                            f"Vous en avez déjà {existing_order.quantity} dans votre panier.",
-                        )
-                        return redirect(
-                            reverse("store:product_detail", kwargs={"slug": slug})
-                        )
-
                 existing_order.quantity = new_quantity
                 existing_order.save()
                 messages.success(
@@ -381,14 +530,17 @@ def cart(request):
         messages.warning(request, "Vous devez être connecté pour voir votre panier.")
         return redirect("login")
 
-    # Utiliser la fonction utilitaire optimisée
-    cart_data = get_cart_summary(request.user)
+    # Résumé mémorisé pour la requête (partagé avec le context processor)
+    cart_data = get_request_cart_summary(request)
 
     context = {
         "orders": cart_data["orders"],
         "total": cart_data["total_price"],
         "total_items": cart_data["total_items"],
         "is_empty": cart_data["is_empty"],
+        "recommendations": cart_recommendations(
+            {order.product_id for order in cart_data["orders"]}
+        ),
     }
     return render(request, "store/cart.html", context)
 
@@ -412,34 +564,28 @@ def increase_quantity(request, order_id):
                 Order, id=order_id, user=request.user, ordered=False
             )
 
-            # Vérifier le stock disponible en temps réel
+            # Vérifier le stock disponible de la variante (lecture en base)
             product = order.product
-            # S'assurer d'avoir les données les plus récentes
-            product.refresh_from_db()
+            (check,) = validate_cart_lines(
+                [StockLine(order.product_id, order.size, order.quantity + 1)],
+                user=request.user,
+            )
 
-            if order.quantity >= product.stock:
+            if order.quantity >= check.max_quantity:
                 messages.warning(
                     request,
                     f"Stock insuffisant pour '{product.name}'. "
-                    f"Stock disponible: {product.stock}, "
+                    f"Stock disponible: {check.max_quantity}, "
                     f"quantité actuelle dans le panier: {order.quantity}",
                 )
             else:
-                # Vérifier qu'on peut encore ajouter une unité
-                if order.quantity + 1 <= product.stock:
-                    order.quantity += 1
-                    order.save()
-                    messages.success(
-                        request,
-                        f"Quantité de '{product.name}' "
-                        f"augmentée à {order.quantity}.",
-                    )
-                else:
-                    messages.warning(
-                        request,
-                        f"Impossible d'ajouter plus de '{product.name}'. "
-                        f"Stock maximum atteint ({product.stock}).",
-                    )
+                order.quantity += 1
+                order.save()
+                messages.success(
+                    request,
+                    f"Quantité de '{product.name}' "
+                    f"augmentée à {order.quantity}.",
+                )
 
     except Order.DoesNotExist:
         messages.error(request, "Produit non trouvé dans votre panier.")
@@ -527,20 +673,15 @@ def remove_from_cart(request, order_id):
 def get_cart_summary(user):
     """
     Retourne un résumé du panier pour un utilisateur donné.
-    VERSION OPTIMISÉE avec select_related et prefetch_related.
+    Les lignes sont chargées paresseusement, les totaux lus sur Cart.
     """
     if not user.is_authenticated:
         return {"orders": [], "total_items": 0, "total_price": 0, "is_empty": True}
 
-    # Optimisation: récupérer le panier avec une seule requête optimisée
     try:
-        cart_obj = (
-            Cart.objects.select_related("user")
-            .prefetch_related("orders__product")
-            .get(user=user)
-        )
+        cart_obj = Cart.objects.select_related("user").get(user=user)
 
-        # Filtrer les commandes non commandées avec les produits pré-chargés
+        # Lignes du panier (commandes non payées) avec leurs produits
         orders = cart_obj.orders.filter(ordered=False).select_related("product")
 
     except Cart.DoesNotExist:
@@ -548,15 +689,12 @@ def get_cart_summary(user):
         cart_obj = Cart.objects.create(user=user)
         orders = []
 
-    # Calculs optimisés (les produits sont déjà en mémoire)
-    total_items = sum(order.quantity for order in orders)
-    total_price = sum(order.quantity * order.product.price for order in orders)
-
+    # Totaux maintenus sur la ligne du panier (voir store.carts)
     return {
         "orders": orders,
-        "total_items": total_items,
-        "total_price": total_price,
-        "is_empty": not orders,
+        "total_items": cart_obj.item_count,
+        "total_price": cart_obj.subtotal,
+        "is_empty": not cart_obj.item_count,
         "cart": cart_obj,
     }
 
@@ -565,6 +703,7 @@ def get_cart_summary(user):
 def check_stock_availability(product, requested_quantity=1, size=None):
     """
     Vérifie la disponibilité du stock pour un produit avec le système de variantes.
+    Une seule requête, réservations en cours déduites (voir validate_cart_lines).
 
     Args:
         product: Instance du produit à vérifier
@@ -578,30 +717,20 @@ def check_stock_availability(product, requested_quantity=1, size=None):
             'message': str
         }
     """
-    product.refresh_from_db()  # Données les plus récentes
+    (check,) = validate_cart_lines([StockLine(product.pk, size, requested_quantity)])
+    available_stock = check.max_quantity
 
-    # Utiliser le système de variantes
-    if size:
-        # Vérifier une taille spécifique
-        variant = product.get_variant_by_size(size)
-        if not variant:
-            return {
-                "available": False,
-                "max_quantity": 0,
-                "message": f"Taille '{size}' non disponible pour '{product.name}'.",
-            }
+    if size and check.variant_id is None:
+        return {
+            "available": False,
+            "max_quantity": 0,
+            "message": f"Taille '{size}' non disponible pour '{product.name}'.",
+        }
 
-        available_stock = variant.stock
+    if size:
         stock_message = f"Stock disponible pour la taille {size}: {available_stock}"
     else:
-        # Vérifier le stock total de toutes les variantes
-        if hasattr(product, 'total_stock'):
-            available_stock = product.total_stock
-        else:
-            # Fallback si la propriété n'existe pas
-            available_stock = sum(variant.stock for variant in product.variants.all())
-
-        stock_message = f"Stock total disponible: {available_stock}"
+        stock_message = f"Stock disponible: {available_stock}"
 
     if available_stock <= 0:
         return {
@@ -610,7 +739,7 @@ def check_stock_availability(product, requested_quantity=1, size=None):
             "message": f"Le produit '{product.name}' n'est plus en stock.",
         }
 
-    if requested_quantity > available_stock:
+    if not check.available:
         return {
             "available": False,
             "max_quantity": available_stock,
@@ -663,13 +792,31 @@ def checkout(request):
         messages.warning(request, "Vous devez être connecté pour passer une commande.")
         return redirect("login")
 
-    # Récupérer les données du panier
-    cart_data = get_cart_summary(request.user)
+    # Récupérer les données du panier (mémorisées pour la requête)
+    cart_data = get_request_cart_summary(request)
 
     if cart_data["is_empty"]:
         messages.warning(request, "Votre panier est vide.")
         return redirect("cart")
 
+    # Toutes les lignes du panier vérifiées en une requête (hors réservations
+    # de l'acheteur : un paiement abandonné ne bloque pas son propre panier)
+    unavailable = [
+        check
+        for check in validate_cart_lines(cart_data["orders"], user=request.user)
+        if not check.available
+    ]
+    if unavailable:
+        for check in unavailable:
+            order = check.line
+            messages.error(
+                request,
+                f"Stock insuffisant pour '{order.product.name}' "
+                f"(taille {order.size or 'unique'}) : "
+                f"{check.max_quantity} disponible(s), {order.quantity} demandé(s).",
+            )
+        return redirect("store:cart")
+
     if request.method == "POST":
         # Validation des informations de livraison
         required_fields = [
@@ -738,12 +885,12 @@ def order_history(request):
         messages.warning(request, "Vous devez être connecté pour voir vos commandes.")
         return redirect("login")
 
-    # Récupérer les commandes finalisées de l'utilisateur
-    orders = (
-        Order.objects.filter(user=request.user, ordered=True)
-        .select_related("product")
-        .order_by("-date_ordered")
-    )
+    # Récupérer les commandes finalisées de l'utilisateur, page par page
+    orders_queryset = Order.objects.filter(
+        user=request.user, ordered=True
+    ).select_related("product")
+    paginator = KeysetPaginator(orders_queryset, 10, ("-date_ordered",))
+    orders = paginator.get_page(request.GET.get("cursor"))
 
     context = {"orders": orders}
     return render(request, "store/order_history.html", context)
@@ -992,36 +1139,6 @@ def reorder(request, order_id):
             quantity = original_order.quantity
             size = getattr(original_order, 'size', None) # Récupérer la taille si elle existe
 
-            # Vérifier la disponibilité du stock
-            stock_check = check_stock_availability(product, quantity, size)
-            if not stock_check["available"]:
-                messages.error(
-                    request,
-                    f"Stock insuffisant pour '{product.name}'. "
-                    f"Stock disponible: {stock_check['max_quantity']}",
-                )
-                return redirect("accounts:order_history")
-
-            # Vérifier si déjà dans le panier
-            current_cart_quantity = get_user_cart_quantity(request.user, product)
-            total_quantity = current_cart_quantity + quantity
-
-            # Utiliser le stock total du produit via ses variantes
-            max_stock = product.total_stock if hasattr(product, 'total_stock') else 0
-            if size:
-                # Si une taille spécifique, vérifier le stock de cette variante
-                variant = product.get_variant_by_size(size)
-                max_stock = variant.stock if variant else 0
-
-            if total_quantity > max_stock:
-                messages.warning(
-                    request,
-                    f"Impossible d'ajouter {quantity} '{product.name}'. "
-                    f"Vous avez déjà {current_cart_quantity} dans votre panier "
-                    f"et le stock total est de {max_stock}.",
-                )
-                return redirect("accounts:order_history")
-
             # Créer ou récupérer le panier
             cart_obj, _ = Cart.objects.get_or_create(user=request.user)
 
@@ -1031,6 +1148,28 @@ def reorder(request, order_id):
                 existing_order_filter['size'] = size
 
             existing_order = cart_obj.orders.filter(**existing_order_filter).first()
+            current_cart_quantity = existing_order.quantity if existing_order else 0
+
+            # Vérifier la disponibilité du stock (quantité déjà au panier comprise)
+            (check,) = validate_cart_lines(
+                [StockLine(product.pk, size, current_cart_quantity + quantity)],
+                user=request.user,
+            )
+            if not check.available:
+                if current_cart_quantity:
+                    messages.warning(
+                        request,
+                        f"Impossible d'ajouter {quantity} '{product.name}'. "
+                        f"Vous avez déjà {current_cart_quantity} dans votre panier "
+                        f"et le stock disponible est de {check.max_quantity}.",
+                    )
+                else:
+                    messages.error(
+                        request,
+                        f"Stock insuffisant pour '{product.name}'. "
+                        f"Stock disponible: {check.max_quantity}",
+                    )
+                return redirect("store:order_history")
 
             if existing_order:
                 # Augmenter la quantité
@@ -1089,12 +1228,13 @@ def cancel_order(request, order_id):
                         request,
                         "Cette commande ne peut plus être annulée " "(délai dépassé).",
                     )
-                    return redirect("accounts:order_history")
+                    return redirect("store:order_history")
 
-                # Remettre le stock
+                # Remettre le stock des variantes vendues (journalisé)
                 product = order.product
-                product.stock += order.quantity
-                product.save()
+                restock_order(
+                    order, user=request.user, note=f"Annulation commande #{order_id}"
+                )
 
                 # Marquer comme annulée (ou supprimer)
                 order.delete()  # Ou ajouter un statut "cancelled" au modèle
@@ -1109,7 +1249,7 @@ def cancel_order(request, order_id):
             messages.error(request, "Erreur lors de l'annulation de la commande.")
             logger.error(f"Erreur cancel_order: {e}")
 
-    return redirect("accounts:order_history")
+    return redirect("store:order_history")
 
 
 # Vue pour les catégories - redirection vers la boutique principale
@@ -1123,6 +1263,8 @@ def category_view(request, category_slug):
     # Conserver tous les paramètres existants et ajouter la catégorie
     query_params = request.GET.copy()
     query_params["category"] = category_slug
+    # Pages catégorie : produits les plus demandés d'abord
+    query_params.setdefault("sort", "popular")
 
     # Rediriger vers la boutique principale avec les paramètres
     redirect_url = f"/store/?{urlencode(query_params)}"
@@ -1248,13 +1390,14 @@ def wishlist_view(request):
         return redirect("login")
 
     try:
-        wishlist_items = Wishlist.objects.filter(user=request.user).select_related(
+        wishlist_queryset = Wishlist.objects.filter(user=request.user).select_related(
             "product"
         )
+        paginator = KeysetPaginator(wishlist_queryset, 24, ("-created_at",))
+        wishlist_items = paginator.get_page(request.GET.get("cursor"))
 
         context = {
             "wishlist_items": wishlist_items,
-            "wishlist_count": wishlist_items.count(),
         }
 
         return render(request, "store/wishlist.html", context)
@@ -1284,3 +1427,18 @@ def check_wishlist_status(request):
     except Exception as e:
         logger.error(f"Erreur check_wishlist_status: {e}")
         return JsonResponse({"in_wishlist": False})
+
+
+def search_suggestions(request):
+    """Suggestions d'autocomplétion pour la barre de recherche (pour AJAX)"""
+    query = request.GET.get("q", "").strip()[:100]
+    if len(query) < 2:
+        return JsonResponse({"query": query, "suggestions": []})
+
+    try:
+        suggestions = get_suggestion_index().suggest(query)
+        return JsonResponse({"query": query, "suggestions": suggestions})
+
+    except Exception as e:
+        logger.error(f"Erreur search_suggestions: {e}")
+        return JsonResponse({"query": query, "suggestions": []})